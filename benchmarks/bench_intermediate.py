@@ -0,0 +1,71 @@
+"""
+Benchmark of the text and compact intermediate records of the lot1 and lot2 jobs.
+
+Generates a synthetic cleaned_data.csv (same generator as bench_mappers.py), runs each mapper
+with and without the city dictionary, then measures:
+- the bytes of map output, raw and gzip-compressed (what the shuffle moves),
+- the records/second of the reducer's `read_orders` on the sorted output,
+and checks that both formats give the same top 100.
+
+Usage:
+    python benchmarks/bench_intermediate.py [--rows 2000000] [--input cleaned_data.csv]
+"""
+import argparse
+import gzip
+import heapq
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'tools'))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+import streamcodec  # noqa: E402
+from bench_mappers import mapperlot1, mapperlot2, run, write_synthetic_file  # noqa: E402
+
+
+def load_reducer(lot):
+    """Import reducerlot1 or reducerlot2 (both modules have the same name for `read_orders`)."""
+    sys.path.insert(0, os.path.join(ROOT, lot))
+    try:
+        return __import__('reducer' + lot)
+    finally:
+        sys.path.pop(0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=2_000_000)
+    parser.add_argument('--input', default=None, help="existing cleaned_data.csv to use instead of synthetic rows")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.input
+        if path is None:
+            path = os.path.join(tmp, 'cleaned_data.csv')
+            write_synthetic_file(path, args.rows)
+        dictionary = os.path.join(tmp, streamcodec.DEFAULT_DICTIONARY)
+        streamcodec.build_dictionary(path, dictionary)
+
+        for lot, mapper in (('lot1', mapperlot1.mapper), ('lot2', mapperlot2.mapper)):
+            reducer = load_reducer(lot)
+            tops = []
+            for name, mapper_dictionary in (('text', None), ('compact', dictionary)):
+                _, output = run(lambda: mapper(dictionary=mapper_dictionary), path)
+                lines = sorted(output.splitlines(keepends=True), key=lambda line: line.split('\t', 1)[0])
+                data = ''.join(lines).encode('utf-8')
+
+                start = time.perf_counter()
+                orders = list(reducer.read_orders(lines, dictionary))
+                elapsed = time.perf_counter() - start
+                tops.append(heapq.nsmallest(100, orders, key=reducer.ranking_key))
+
+                print("%s %-8s %9d records  %11d bytes  gzip: %10d bytes  reducer: %9.0f records/s"
+                      % (lot, name, len(lines), len(data), len(gzip.compress(data, 1)), len(lines) / elapsed))
+            assert [order[:3] for order in tops[0]] == [order[:3] for order in tops[1]], \
+                "%s top 100 differs between the text and compact records" % lot
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Micro-benchmark of the CSV parsing of the lot1 and lot2 mappers.
+
+Generates a synthetic cleaned_data.csv, then measures rows/second of:
+- before: the previous `csv.DictReader` parse loop (one dict per row, `required_columns`
+  checked on every row, `int()` on the year and `print()` per output line),
+- after: the current `mapperlot1.mapper` and `mapperlot2.mapper`,
+and checks that both give the same records.
+
+Usage:
+    python benchmarks/bench_mappers.py [--rows 2000000] [--input cleaned_data.csv]
+"""
+import argparse
+import csv
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'lot1'))
+sys.path.insert(0, os.path.join(ROOT, 'lot2'))
+import mapperlot1  # noqa: E402
+import mapperlot2  # noqa: E402
+
+CITIES = [('NANTES', '44'), ('LAVAL', '53'), ('ALENCON', '61'), ('CHARTRES', '28'), ('SAINT-BRIEUC', '22'),
+          ('ANGERS', '49'), ('CHATEAU-GONTIER', '53'), ('PARIS', '75')]
+
+
+def write_synthetic_file(path, rows):
+    """Write `rows` order lines with the layout of cleaned_data.csv."""
+    rng = random.Random(0)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(','.join(mapperlot1.default_columns) + '\n')
+        for i in range(rows):
+            codcde = rng.randrange(rows // 4 + 1)
+            ville, dept = CITIES[codcde % len(CITIES)]
+            f.write('%d,M.,DUPONT,Jean,%s%03d,%s,%d,%d-%02d-%02d,%s,%s,1,0.0,False,False,%d,%d,0,'
+                    'Camembert,M,0.25,10,False,boite,1.2,5.5\n'
+                    % (i % 5000, dept, i % 1000, ville, codcde, 2004 + codcde % 18, 1 + i % 12, 1 + i % 28,
+                       rng.choice(['0.0', '0.0', '1.5']), rng.choice(['0.0', '6.1', '4.55']),
+                       i % 200, 1 + i % 20))
+
+
+def before_mapperlot1():
+    """Previous lot1 parse loop (DictReader), with the same in-mapper combining."""
+    orders = {}
+    for row in csv.DictReader(sys.stdin):
+        try:
+            required_columns = ['codcli', 'cpcli', 'villecli', 'codcde', 'timbrecde', 'qte', 'datcde']
+            if not all(key in row for key in required_columns):
+                continue
+            year_commande = int(row['datcde'].split('-')[0])
+            if 2006 <= year_commande <= 2010 and row['cpcli'][:2] in {'53', '61', '28'}:
+                order = orders.setdefault(row['codcde'], [row['villecli'], 0, 0.0])
+                order[1] += int(row['qte'])
+                order[2] += float(row['timbrecde'])
+        except (ValueError, IndexError):
+            pass
+    for codcde, (villecli, qte, timbrecde) in orders.items():
+        print('%s\t%s\t%s\t%s' % (codcde, villecli, qte, timbrecde))
+
+
+def before_mapperlot2():
+    """Previous lot2 parse loop (DictReader, one print per output line)."""
+    for row in csv.DictReader(sys.stdin):
+        try:
+            if not all(key in row for key in ['codcli', 'cpcli', 'villecli', 'codcde', 'timbrecli', 'qte', 'datcde']):
+                continue
+            timbrecli = row['timbrecli']
+            qte = int(row['qte'])
+            year_commande = int(row['datcde'].split('-')[0])
+            if 2011 <= year_commande <= 2016 and row['cpcli'][:2] in {'22', '49', '53'}:
+                if not timbrecli or float(timbrecli) == 0:
+                    print("%s\t%s\t%d\t%s" % (row['codcde'], row['villecli'], qte, timbrecli))
+        except (ValueError, IndexError):
+            pass
+
+
+def run(mapper, path):
+    """Run `mapper` with `path` as standard input; return (elapsed seconds, output text)."""
+    stdin, stdout = sys.stdin, sys.stdout
+    with open(path, encoding='utf-8') as f:
+        sys.stdin, sys.stdout = f, io.StringIO()
+        try:
+            start = time.perf_counter()
+            mapper()
+            elapsed = time.perf_counter() - start
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdin, sys.stdout = stdin, stdout
+    return elapsed, output
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=2_000_000)
+    parser.add_argument('--input', default=None, help="existing cleaned_data.csv to use instead of synthetic rows")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.input
+        if path is None:
+            path = os.path.join(tmp, 'cleaned_data.csv')
+            write_synthetic_file(path, args.rows)
+        with open(path, encoding='utf-8') as f:
+            rows = sum(1 for _ in f) - 1
+
+        for name, before, after in (('mapperlot1', before_mapperlot1, mapperlot1.mapper),
+                                    ('mapperlot2', before_mapperlot2, mapperlot2.mapper)):
+            elapsed_before, output_before = run(before, path)
+            elapsed_after, output_after = run(after, path)
+            assert sorted(output_before.splitlines()) == sorted(output_after.splitlines()), \
+                "%s output differs from the DictReader version" % name
+            print("%s  %d rows  before: %9.0f rows/s  after: %9.0f rows/s  x%.1f"
+                  % (name, rows, rows / elapsed_before, rows / elapsed_after, elapsed_before / elapsed_after))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Startup time of every entry point of the Hadoop Streaming jobs and of the report stages.
+
+Runs each script on an empty standard input, `--repeat` times, and prints the median and best
+wall time, next to two references: a bare interpreter and the pandas + matplotlib imports that
+the lot2 reducer used to pay on every task attempt.
+
+Usage:
+    python benchmarks/bench_startup.py [--repeat 10]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def entry_points(tmp):
+    """(name, command) of the scripts to measure; the reports write into `tmp`."""
+    return [
+        ('python (empty)', ['-c', 'pass']),
+        ('import pandas + matplotlib', ['-c', 'import pandas, matplotlib.pyplot']),
+        ('lot1/mapperlot1.py', [os.path.join(ROOT, 'lot1', 'mapperlot1.py')]),
+        ('lot1/combinerlot1.py', [os.path.join(ROOT, 'lot1', 'combinerlot1.py')]),
+        ('lot1/reducerlot1.py', [os.path.join(ROOT, 'lot1', 'reducerlot1.py')]),
+        ('lot1/reportlot1.py', [os.path.join(ROOT, 'lot1', 'reportlot1.py'),
+                                '--output', os.path.join(tmp, 'results_lot1.xlsx')]),
+        ('lot2/mapperlot2.py', [os.path.join(ROOT, 'lot2', 'mapperlot2.py')]),
+        ('lot2/reducerlot2.py', [os.path.join(ROOT, 'lot2', 'reducerlot2.py')]),
+        ('lot2/reportlot2.py', [os.path.join(ROOT, 'lot2', 'reportlot2.py'),
+                                '--output', os.path.join(tmp, 'results_lot02.xlsx'),
+                                '--pdf', os.path.join(tmp, 'repartition_par_ville.pdf')]),
+        ('multiquery/mapper_multi.py', [os.path.join(ROOT, 'multiquery', 'mapper_multi.py')]),
+        ('multiquery/reducer_multi.py', [os.path.join(ROOT, 'multiquery', 'reducer_multi.py')]),
+    ]
+
+
+def measure(command, repeat):
+    """Wall times (seconds) of `repeat` runs of `python command` on an empty standard input."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *command], stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, command in entry_points(tmp):
+            times = measure(command, args.repeat)
+            print("%-30s median: %7.1f ms  best: %7.1f ms"
+                  % (name, statistics.median(times) * 1000, min(times) * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Benchmark of the accent removal step of the lot0 cleaner.
+
+Compares the historical per-cell `Series.apply(unidecode.unidecode)` with
+`cleaned_data.strip_accents` on synthetic columns shaped like the client file
+(few distinct cities, products and packagings, more distinct names), and checks
+that both give the same values.
+
+Usage:
+    python benchmarks/bench_strip_accents.py [--rows 1000000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import unidecode
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lot0'))
+from cleaned_data import strip_accents, transliterate  # noqa: E402
+
+CARDINALITIES = {'genrecli': 4, 'villecli': 2000, 'libobj': 150, 'libcondit': 20, 'nomcli': 50000}
+ACCENTED = 'éèêàâçôûîÉÈÀÇ'
+
+
+def make_column(rows, distinct, rng):
+    values = np.array(['%s%s %d' % (ACCENTED[i % len(ACCENTED)], 'Château-Gontier', i) for i in range(distinct)],
+                      dtype=object)
+    column = pd.Series(values[rng.integers(0, distinct, rows)], dtype=object)
+    column[rng.random(rows) < 0.01] = np.nan
+    return column
+
+
+def timed(func, column):
+    start = time.perf_counter()
+    result = func(column)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    total_before = total_after = 0.0
+    for name, distinct in CARDINALITIES.items():
+        column = make_column(args.rows, distinct, rng)
+        transliterate.cache_clear()
+
+        before, elapsed_before = timed(
+            lambda s: s.apply(lambda x: unidecode.unidecode(x) if isinstance(x, str) else x), column)
+        after, elapsed_after = timed(strip_accents, column)
+        assert before.equals(after), "strip_accents differs from the per-cell apply on %s" % name
+
+        total_before += elapsed_before
+        total_after += elapsed_after
+        print("%-10s %7d distinct  apply: %7.3fs  strip_accents: %7.3fs  x%.1f"
+              % (name, distinct, elapsed_before, elapsed_after, elapsed_before / elapsed_after))
+
+    print("%-10s %15s  apply: %7.3fs  strip_accents: %7.3fs  x%.1f"
+          % ('total', '', total_before, total_after, total_before / total_after))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,326 @@
+import argparse
+import collections
+import concurrent.futures
+import functools
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+
+import numpy as np
 import pandas as pd
 import unidecode
-import sys
 
-def read_and_clean_csv(input_file, output_file):
+# Fill value and target dtype of each column of the cleaned file
+CLEAN_DTYPES = {
+    'codcli': (0, 'int32'),
+    'genrecli': ('', 'string'),
+    'nomcli': ('', 'string'),
+    'prenomcli': ('', 'string'),
+    'cpcli': ('', 'string'),
+    'villecli': ('', 'string'),
+    'codcde': (0, 'int32'),
+    'timbrecli': (0.0, float),
+    'timbrecde': (0.0, float),
+    'Nbcolis': (0, 'int8'),
+    'cheqcli': (0.0, float),
+    'barchive': (False, 'bool'),
+    'bstock': (False, 'bool'),
+    'codobj': (0, 'int32'),
+    'qte': (0, 'int16'),
+    'Colis': (0, 'int32'),
+    'libobj': ('', 'string'),
+    'Tailleobj': ('', 'string'),
+    'Poidsobj': (0.0, float),
+    'points': (0, 'int32'),
+    'indispobj': (False, 'bool'),
+    'libcondit': ('', 'string'),
+    'prixcond': (0.0, float),
+    'puobj': (0.0, float),
+}
+
+# Dtypes declared when reading the raw file, so that every chunk is parsed the same way.
+# Text columns stay text (keeps the leading zeros of 'cpcli'), numeric columns are read as
+# float64 to accept missing values, boolean columns are left to pandas.
+READ_DTYPES = {'datcde': str}
+READ_DTYPES.update({
+    col: (str if dtype == 'string' else 'float64')
+    for col, (fill_value, dtype) in CLEAN_DTYPES.items()
+    if dtype != 'bool'
+})
+
+# Size of the byte ranges cleaned by each worker in parallel mode
+PARALLEL_CHUNK_BYTES = 32 * 1024 * 1024
+
+# Number of bytes fingerprinted at the start of the input and before the last offset reached,
+# to tell an appended file from a rewritten one in incremental mode
+FINGERPRINT_BYTES = 64 * 1024
+
+# Partition columns of the Parquet dataset: order year and department (first 2 digits of 'cpcli')
+PARTITION_COLS = ['year', 'dept']
+
+
+class RowHashSet:
+    """
+    Compact set of 64-bit row hashes used to remove duplicates across chunks.
+
+    Hashes are kept in a few sorted numpy arrays (8 bytes per distinct row) that are merged
+    two by two when they reach the same size, so lookups stay logarithmic.
+    """
+
+    def __init__(self):
+        self.runs = []
+
+    def __len__(self):
+        return sum(len(run) for run in self.runs)
+
+    def __contains__(self, value):
+        return bool(self.contains(np.array([value], dtype=np.uint64))[0])
+
+    def contains(self, hashes):
+        """Return a boolean mask telling which of `hashes` are already in the set."""
+        found = np.zeros(len(hashes), dtype=bool)
+        for run in self.runs:
+            positions = np.searchsorted(run, hashes)
+            positions[positions == len(run)] = 0
+            found |= run[positions] == hashes
+        return found
+
+    def add(self, hashes):
+        """Add `hashes` (numpy uint64 array) to the set."""
+        run = np.unique(hashes)
+        if len(run) == 0:
+            return
+        while self.runs and len(self.runs[-1]) <= len(run):
+            run = np.union1d(self.runs.pop(), run)
+        self.runs.append(run)
+
+    def keep_new(self, hashes):
+        """
+        Return the mask of the first occurrence of each hash not seen before, and record them.
+        """
+        keep = ~pd.Series(hashes).duplicated().to_numpy()
+        keep &= ~self.contains(hashes)
+        self.add(hashes[keep])
+        return keep
+
+
+@functools.lru_cache(maxsize=65536)
+def transliterate(value):
+    """Memoized `unidecode.unidecode`, shared by every column and every chunk."""
+    return unidecode.unidecode(value)
+
+
+def strip_accents(series):
+    """
+    Remove accents from the string values of `series`.
+
+    Each distinct value is transliterated once (`pd.factorize` + `transliterate`), then the
+    results are mapped back to the rows with the factorize codes. Missing and non-string
+    values are left untouched.
+    """
+    kind = pd.api.types.infer_dtype(series, skipna=True)
+    if kind == 'empty' or series.empty:
+        return series
+    if kind != 'string':
+        # Mixed column: factorize would merge values such as 1 and True, keep the per-cell path
+        return series.apply(lambda x: transliterate(x) if isinstance(x, str) else x)
+
+    codes, uniques = pd.factorize(series)
+    if len(uniques) == 0:
+        return series
+    translated = np.array([transliterate(value) for value in uniques], dtype=object)
+    stripped = pd.Series(translated[codes], index=series.index)
+    return stripped.where(codes != -1, series)
+
+
+def row_hashes(df):
+    """Return one uint64 hash per row of `df`, computed on the values only."""
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+def clean_dataframe(df):
+    """
+    Apply the cleaning steps of `read_and_clean_csv` to a DataFrame (without removing duplicates).
+
+    Parameters:
+    - df (pd.DataFrame): Raw data as read from the input CSV file.
+
+    Returns:
+    - pd.DataFrame: Data with accents removed, valid dates and typed columns.
+    """
+    # Remove accents
+    for col in df.select_dtypes(include=['object', 'string']).columns:
+        df[col] = strip_accents(df[col])
+
+    # Convert dates and remove rows with invalid dates
+    df['datcde'] = pd.to_datetime(df['datcde'], errors='coerce')
+    df = df.dropna(subset=['datcde'])
+
+    # Replace NaN values
+    for col, (fill_value, dtype) in CLEAN_DTYPES.items():
+        df[col] = df[col].fillna(fill_value).astype(dtype)
+    df['cpcli'] = df['cpcli'].str.zfill(5)
+
+    return df
+
+
+def reset_dataset(dataset_dir):
+    """Remove a previous Parquet dataset so that a full run does not append to stale files."""
+    if os.path.isdir(dataset_dir):
+        shutil.rmtree(dataset_dir)
+
+
+def write_partitioned_dataset(df, dataset_dir):
+    """
+    Append cleaned rows to a Parquet dataset partitioned by order year and department.
+
+    The dtypes worked out by `clean_dataframe` (int8 'Nbcolis', int16 'qte', string 'cpcli', ...)
+    are kept in the files, and each call adds new files to the `year=YYYY/dept=DD` directories,
+    so the streaming mode can write chunk by chunk. Requires `pyarrow`.
+    """
+    df = df.assign(year=df['datcde'].dt.year.astype('int16'), dept=df['cpcli'].str[:2])
+    df.to_parquet(dataset_dir, engine='pyarrow', partition_cols=PARTITION_COLS, index=False)
+
+
+def read_cleaned_dataset(dataset_dir, years=None, departments=None, columns=None):
+    """
+    Read the rows of the Parquet dataset written by `write_partitioned_dataset`.
+
+    Only the partitions matching `years` (inclusive (min, max) tuple) and `departments`
+    (iterable of 2-digit strings) are opened.
+
+    Parameters:
+    - dataset_dir (str): Root directory of the dataset.
+    - years (tuple, optional): (year_min, year_max) of the orders to keep.
+    - departments (iterable, optional): Department numbers to keep, e.g. {'53', '61', '28'}.
+    - columns (list, optional): Columns to load (all the cleaned columns by default).
+
+    Returns:
+    - pd.DataFrame: The selected rows, without the partition columns.
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    partitioning = ds.partitioning(pa.schema([('year', pa.int16()), ('dept', pa.string())]), flavor='hive')
+    dataset = ds.dataset(dataset_dir, format='parquet', partitioning=partitioning)
+
+    condition = None
+    if years is not None:
+        condition = (ds.field('year') >= years[0]) & (ds.field('year') <= years[1])
+    if departments is not None:
+        dept_condition = ds.field('dept').isin(sorted(departments))
+        condition = dept_condition if condition is None else condition & dept_condition
+
+    if columns is None:
+        columns = [name for name in dataset.schema.names if name not in PARTITION_COLS]
+    return dataset.to_table(columns=columns, filter=condition).to_pandas()
+
+
+def extract_partitions(dataset_dir, output_file, years=None, departments=None):
+    """
+    Write to CSV the rows of the selected partitions, with the layout of the cleaned file.
+
+    Used to give a filtered job (lot1, lot2) an input that only contains its years and departments.
+    """
+    df = read_cleaned_dataset(dataset_dir, years=years, departments=departments)
+    df.to_csv(output_file, index=False)
+    print(f"{len(df)} rows extracted to: {output_file}")
+
+
+def split_byte_ranges(input_file, chunk_bytes, start=None, end=None):
+    """
+    Split the data lines of `input_file` into (start, end) byte ranges of about `chunk_bytes`.
+
+    Every range starts at the beginning of a line and ends after a newline (or at the end of
+    the file). The header line is not part of any range.
+
+    Parameters:
+    - input_file (str): Path to the CSV file.
+    - chunk_bytes (int): Approximate size of each range.
+    - start (int, optional): Offset of the first line to split (default: just after the header).
+    - end (int, optional): Offset where the split stops (default: end of the file).
+
+    Returns:
+    - tuple: (header bytes, list of (start, end) ranges in file order).
+    """
+    with open(input_file, 'rb') as f:
+        header = f.readline()
+        if start is None:
+            start = f.tell()
+        size = os.fstat(f.fileno()).st_size if end is None else end
+
+        bounds = [start]
+        position = start + chunk_bytes
+        while position < size:
+            # Move the cut to the end of the line that contains `position - 1`
+            f.seek(position - 1)
+            f.readline()
+            if f.tell() >= size:
+                break
+            bounds.append(f.tell())
+            position = f.tell() + chunk_bytes
+        bounds.append(size)
+
+    return header, [(bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1) if bounds[i] < bounds[i + 1]]
+
+
+def read_byte_range(input_file, header, start, end):
+    """Read the lines between `start` and `end` as a DataFrame, with the dtypes of `READ_DTYPES`."""
+    with open(input_file, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    return pd.read_csv(io.BytesIO(header + data), encoding='utf-8', dtype=READ_DTYPES)
+
+
+def clean_byte_range(task):
+    """
+    Worker of `parallel_clean_csv`: read and clean one byte range, then render it as CSV.
+
+    Parameters:
+    - task (tuple): (input_file, header, start, end, keep_frame).
+
+    Returns:
+    - dict: number of rows read and kept after the date conversion, the CSV header and body
+      (bytes), the offset of the end of each rendered row, the row hashes and, if `keep_frame`
+      is set, the cleaned DataFrame itself.
+    """
+    input_file, header, start, end, keep_frame = task
+    df = read_byte_range(input_file, header, start, end)
+    initial_rows = len(df)
+    df = clean_dataframe(df)
+
+    body = df.to_csv(index=False, header=False).encode('utf-8')
+    line_ends = np.flatnonzero(np.frombuffer(body, dtype=np.uint8) == ord('\n')) + 1
+    if len(line_ends) != len(df):
+        raise ValueError(f"Multi-line values are not supported in parallel mode (bytes {start}-{end})")
+
+    return {
+        'initial_rows': initial_rows,
+        'dated_rows': len(df),
+        'header': df.head(0).to_csv(index=False).encode('utf-8'),
+        'body': body,
+        'line_ends': line_ends,
+        'hashes': row_hashes(df),
+        'frame': df if keep_frame else None,
+    }
+
+
+def select_lines(body, line_ends, keep):
+    """Return the rows of a rendered CSV `body` where `keep` is True, copying runs of kept rows at once."""
+    if keep.all():
+        return body
+    line_starts = np.concatenate(([0], line_ends[:-1]))
+    # Boundaries of the runs of consecutive kept rows
+    changes = np.flatnonzero(np.diff(np.concatenate(([False], keep, [False])).astype(np.int8)))
+    return b''.join(body[line_starts[first]:line_ends[last - 1]]
+                    for first, last in zip(changes[::2], changes[1::2]))
+
+
+def read_and_clean_csv(input_file, output_file, chunksize=None, parquet_dir=None, workers=1, incremental=False):
     """
     Read, clean, and transform a CSV file, then save the cleaned data to a new CSV file.
 
@@ -15,6 +333,14 @@ def read_and_clean_csv(input_file, output_file):
     Parameters:
     - input_file (str): Path to the input CSV file.
     - output_file (str): Path to the output CSV file to save cleaned data.
+    - chunksize (int, optional): Number of rows read at a time. When set, the file is streamed
+      chunk by chunk and memory no longer depends on the size of the input.
+    - parquet_dir (str, optional): Directory of a typed Parquet dataset, partitioned by order
+      year and department, written in addition to the CSV file.
+    - workers (int, optional): Number of processes. Above 1, the input is cleaned in parallel
+      (see `parallel_clean_csv`) and the output is the same as the serial path, row for row.
+    - incremental (bool, optional): Only clean the lines appended to `input_file` since the
+      previous run (see `incremental_clean_csv`).
 
     Data Cleaning Steps:
     - Removes accents from text in object columns.
@@ -27,62 +353,341 @@ def read_and_clean_csv(input_file, output_file):
 
     Output:
     - A cleaned CSV file is saved at the specified `output_file` path.
+    - If `parquet_dir` is set, the same rows are saved as a Parquet dataset in `parquet_dir`.
     """
     try:
-        # Read CSV file
-        df = pd.read_csv(input_file, encoding='utf-8')
-        print(f"Initial number of rows: {len(df)}")
-
-        # Remove accents 
-        for col in df.select_dtypes(include=['object']).columns:
-            df[col] = df[col].apply(lambda x: unidecode.unidecode(x) if isinstance(x, str) else x)
-
-        # Convert dates and remove rows with invalid dates
-        df['datcde'] = pd.to_datetime(df['datcde'], errors='coerce')
-        df = df.dropna(subset=['datcde'])  
-        print(f"Number of rows after date conversion: {len(df)}")
-
-        # Replace NaN values 
-        df['codcli'] = df['codcli'].fillna(0).astype('int32')
-        df['genrecli'] = df['genrecli'].fillna('').astype('string')
-        df['nomcli'] = df['nomcli'].fillna('').astype('string')
-        df['prenomcli'] = df['prenomcli'].fillna('').astype('string')
-        df['cpcli'] = df['cpcli'].fillna('').astype('string').str.zfill(5)
-        df['villecli'] = df['villecli'].fillna('').astype('string')
-        df['codcde'] = df['codcde'].fillna(0).astype('int32')
-        df['timbrecli'] = df['timbrecli'].fillna(0.0).astype(float)
-        df['timbrecde'] = df['timbrecde'].fillna(0.0).astype(float)
-        df['Nbcolis'] = df['Nbcolis'].fillna(0).astype('int8')
-        df['cheqcli'] = df['cheqcli'].fillna(0.0).astype(float)
-        df['barchive'] = df['barchive'].fillna(False).astype('bool')
-        df['bstock'] = df['bstock'].fillna(False).astype('bool')
-        df['codobj'] = df['codobj'].fillna(0).astype('int32')
-        df['qte'] = df['qte'].fillna(0).astype('int16')
-        df['Colis'] = df['Colis'].fillna(0).astype('int32')
-        df['libobj'] = df['libobj'].fillna('').astype('string')
-        df['Tailleobj'] = df['Tailleobj'].fillna('').astype('string')
-        df['Poidsobj'] = df['Poidsobj'].fillna(0.0).astype(float)
-        df['points'] = df['points'].fillna(0).astype('int32')
-        df['indispobj'] = df['indispobj'].fillna(False).astype('bool')
-        df['libcondit'] = df['libcondit'].fillna('').astype('string')
-        df['prixcond'] = df['prixcond'].fillna(0.0).astype(float)
-        df['puobj'] = df['puobj'].fillna(0.0).astype(float)
-        print(f"Number of rows after filling missing values: {len(df)}")
-
-        # Remove duplicates
-        df = df.drop_duplicates()
-        print(f"Number of rows after removing duplicates: {len(df)}")
-
-        # Save the cleaned data to a new CSV file
-        df.to_csv(output_file, index=False)
-        print(f"New file created successfully: {output_file}")
+        if incremental:
+            incremental_clean_csv(input_file, output_file, parquet_dir=parquet_dir, workers=workers)
+        else:
+            clean_full_csv(input_file, output_file, chunksize=chunksize, parquet_dir=parquet_dir, workers=workers)
 
     except Exception as e:
         print(f"An error occurred: {e}", file=sys.stderr)
 
 
+def clean_full_csv(input_file, output_file, chunksize=None, parquet_dir=None, workers=1):
+    """
+    Clean the whole input file with the serial, streaming or parallel path.
+
+    The manifest of a previous `--incremental` run no longer describes `output_file` once it
+    is rewritten, so it is removed first and the next incremental run does a full rebuild.
+
+    Returns:
+    - RowHashSet: Hashes of the rows written to `output_file`.
+    """
+    remove_manifest(output_file)
+    if parquet_dir:
+        reset_dataset(parquet_dir)
+
+    if workers > 1:
+        return parallel_clean_csv(input_file, output_file, workers, parquet_dir=parquet_dir)
+
+    if chunksize:
+        return stream_clean_csv(input_file, output_file, chunksize, parquet_dir=parquet_dir)
+
+    # Read CSV file
+    df = pd.read_csv(input_file, encoding='utf-8', dtype=READ_DTYPES)
+    initial_rows = len(df)
+    print(f"Initial number of rows: {initial_rows}")
+
+    df = clean_dataframe(df)
+    print(f"Number of rows after date conversion: {len(df)}")
+    print(f"Number of rows after filling missing values: {len(df)}")
+
+    # Remove duplicates
+    df = df.drop_duplicates()
+    print(f"Number of rows after removing duplicates: {len(df)}")
+
+    # Save the cleaned data to a new CSV file
+    df.to_csv(output_file, index=False)
+    print(f"New file created successfully: {output_file}")
+
+    if parquet_dir:
+        write_partitioned_dataset(df, parquet_dir)
+        print(f"Parquet dataset created successfully: {parquet_dir}")
+
+    seen = RowHashSet()
+    seen.add(row_hashes(df))
+    return seen
+
+
+def stream_clean_csv(input_file, output_file, chunksize, parquet_dir=None):
+    """
+    Streaming variant of `read_and_clean_csv`: clean the input `chunksize` rows at a time.
+
+    Each chunk is read with the dtypes of `READ_DTYPES`, cleaned with `clean_dataframe` and
+    appended to `output_file`. Duplicates are removed across the whole file with a
+    `RowHashSet`, so memory only grows by 8 bytes per distinct row.
+
+    Returns:
+    - RowHashSet: Hashes of the rows written to `output_file`.
+    """
+    seen = RowHashSet()
+    initial_rows = dated_rows = written_rows = 0
+
+    reader = pd.read_csv(input_file, encoding='utf-8', dtype=READ_DTYPES, chunksize=chunksize)
+    for chunk in reader:
+        initial_rows += len(chunk)
+        chunk = clean_dataframe(chunk)
+        dated_rows += len(chunk)
+
+        chunk = chunk[seen.keep_new(row_hashes(chunk))]
+        chunk.to_csv(output_file, index=False, mode='w' if written_rows == 0 else 'a',
+                     header=written_rows == 0)
+        written_rows += len(chunk)
+        if parquet_dir and len(chunk):
+            write_partitioned_dataset(chunk, parquet_dir)
+
+    print(f"Initial number of rows: {initial_rows}")
+    print(f"Number of rows after date conversion: {dated_rows}")
+    print(f"Number of rows after removing duplicates: {written_rows}")
+    print(f"New file created successfully: {output_file}")
+    if parquet_dir:
+        print(f"Parquet dataset created successfully: {parquet_dir}")
+    return seen
+
+
+def bounded_imap(pool, function, tasks, window):
+    """
+    Results of `function` over `tasks` in order, like `pool.imap`, with at most `window` tasks
+    submitted ahead of the consumer, so finished results do not pile up in memory.
+    """
+    pending = collections.deque()
+    for task in tasks:
+        if len(pending) >= window:
+            yield pending.popleft().get()
+        pending.append(pool.apply_async(function, (task,)))
+    while pending:
+        yield pending.popleft().get()
+
+
+def clean_ranges(input_file, header, ranges, output, seen, workers=1, parquet_dir=None, write_header=True):
+    """
+    Clean byte ranges of `input_file` and append the rows not in `seen` to the open file `output`.
+
+    Ranges are cleaned by `clean_byte_range`, in a pool of `workers` processes when `workers`
+    is above 1, and their results are consumed in file order. At most 2 ranges per worker are
+    in flight, so memory does not grow with the input when the writer is slower than the pool.
+
+    Returns:
+    - tuple: (rows read, rows left after the date conversion, rows written).
+    """
+    tasks = [(input_file, header, start, end, bool(parquet_dir)) for start, end in ranges]
+    initial_rows = dated_rows = written_rows = 0
+    # Parquet files are written by a background thread, one chunk at a time
+    parquet_writer = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    pending_write = None
+    pool = multiprocessing.Pool(workers) if workers > 1 else None
+
+    try:
+        if pool:
+            results = bounded_imap(pool, clean_byte_range, tasks, window=2 * workers)
+        else:
+            results = map(clean_byte_range, tasks)
+        for index, result in enumerate(results):
+            if index == 0 and write_header:
+                output.write(result['header'])
+            initial_rows += result['initial_rows']
+            dated_rows += result['dated_rows']
+
+            keep = seen.keep_new(result['hashes'])
+            output.write(select_lines(result['body'], result['line_ends'], keep))
+            written_rows += int(keep.sum())
+
+            if parquet_dir and keep.any():
+                if pending_write is not None:
+                    pending_write.result()
+                pending_write = parquet_writer.submit(write_partitioned_dataset, result['frame'][keep], parquet_dir)
+
+        if pending_write is not None:
+            pending_write.result()
+    finally:
+        parquet_writer.shutdown()
+        if pool:
+            pool.terminate()
+
+    return initial_rows, dated_rows, written_rows
+
+
+def parallel_clean_csv(input_file, output_file, workers, chunk_bytes=PARALLEL_CHUNK_BYTES, parquet_dir=None,
+                       end=None):
+    """
+    Parallel variant of `read_and_clean_csv`, using a pool of `workers` processes.
+
+    The input is split into byte ranges aligned on line boundaries (`split_byte_ranges`).
+    Each worker reads, cleans, hashes and renders its range (`clean_byte_range`). The results
+    are consumed in file order, and duplicates are removed globally with a `RowHashSet`
+    before the rows are appended to `output_file`. The output is therefore the same as the
+    serial path, row for row. With `end`, only the lines before that offset are cleaned.
+
+    Returns:
+    - RowHashSet: Hashes of the rows written to `output_file`.
+    """
+    header, ranges = split_byte_ranges(input_file, chunk_bytes, end=end)
+    seen = RowHashSet()
+
+    with open(output_file, 'wb') as output:
+        initial_rows, dated_rows, written_rows = clean_ranges(
+            input_file, header, ranges, output, seen, workers=workers, parquet_dir=parquet_dir)
+
+    print(f"Initial number of rows: {initial_rows}")
+    print(f"Number of rows after date conversion: {dated_rows}")
+    print(f"Number of rows after removing duplicates: {written_rows}")
+    print(f"New file created successfully: {output_file}")
+    if parquet_dir:
+        print(f"Parquet dataset created successfully: {parquet_dir}")
+    return seen
+
+
+def manifest_paths(output_file):
+    """Return the paths of the manifest and of the row hashes saved next to `output_file`."""
+    return output_file + '.manifest.json', output_file + '.hashes.npy'
+
+
+def remove_manifest(output_file):
+    """Delete the manifest and the row hashes saved next to `output_file`, if any."""
+    for path in manifest_paths(output_file):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def file_fingerprints(input_file, offset):
+    """Return the sha256 of the first bytes of `input_file` and of the bytes just before `offset`."""
+    with open(input_file, 'rb') as f:
+        head = f.read(min(offset, FINGERPRINT_BYTES))
+        f.seek(max(0, offset - FINGERPRINT_BYTES))
+        tail = f.read(offset - max(0, offset - FINGERPRINT_BYTES))
+    return hashlib.sha256(head).hexdigest(), hashlib.sha256(tail).hexdigest()
+
+
+def last_line_end(input_file):
+    """Return the offset just after the last newline of `input_file` (a trailing partial line is left out)."""
+    with open(input_file, 'rb') as f:
+        position = os.fstat(f.fileno()).st_size
+        while position > 0:
+            block_start = max(0, position - FINGERPRINT_BYTES)
+            f.seek(block_start)
+            block = f.read(position - block_start)
+            newline = block.rfind(b'\n')
+            if newline != -1:
+                return block_start + newline + 1
+            position = block_start
+    return 0
+
+
+def save_manifest(input_file, output_file, offset, seen):
+    """Record the offset reached in `input_file` and the hashes of the rows written to `output_file`."""
+    manifest_file, hashes_file = manifest_paths(output_file)
+    head, tail = file_fingerprints(input_file, offset)
+    manifest = {
+        'input_file': os.path.abspath(input_file),
+        'offset': offset,
+        'head_sha256': head,
+        'tail_sha256': tail,
+        'rows': len(seen),
+    }
+
+    # Write to temporary files first so that an interrupted run keeps the previous manifest
+    with open(hashes_file + '.tmp', 'wb') as f:
+        np.save(f, np.concatenate(seen.runs) if seen.runs else np.empty(0, dtype=np.uint64))
+    with open(manifest_file + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(hashes_file + '.tmp', hashes_file)
+    os.replace(manifest_file + '.tmp', manifest_file)
+
+
+def load_manifest(input_file, output_file):
+    """
+    Return the manifest of the previous run if `input_file` has only been appended to since.
+
+    Returns:
+    - tuple: (manifest dict, RowHashSet) or None when a full rebuild is needed (no manifest,
+      missing output, input truncated or rewritten).
+    """
+    manifest_file, hashes_file = manifest_paths(output_file)
+    if not (os.path.exists(manifest_file) and os.path.exists(hashes_file) and os.path.exists(output_file)):
+        return None
+
+    with open(manifest_file, encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest['input_file'] != os.path.abspath(input_file) or os.path.getsize(input_file) < manifest['offset']:
+        return None
+    if file_fingerprints(input_file, manifest['offset']) != (manifest['head_sha256'], manifest['tail_sha256']):
+        return None
+
+    seen = RowHashSet()
+    seen.add(np.load(hashes_file))
+    return manifest, seen
+
+
+def incremental_clean_csv(input_file, output_file, parquet_dir=None, workers=1, chunk_bytes=PARALLEL_CHUNK_BYTES):
+    """
+    Clean only the lines appended to `input_file` since the previous run.
+
+    A manifest saved next to `output_file` records the byte offset reached in the input,
+    fingerprints of the bytes before it and the hashes of the rows already written. The lines
+    after that offset are cleaned, rows that duplicate earlier ones are dropped and the rest is
+    appended to `output_file` (and to the Parquet dataset as new files). When there is no
+    manifest, or the input was rewritten rather than appended, the whole file is rebuilt.
+
+    Only complete lines are cleaned: a trailing partial line (a file still being written) is
+    left for the next run, which reads it once its newline has been appended.
+    """
+    previous = load_manifest(input_file, output_file)
+    end = last_line_end(input_file)
+    if previous is None:
+        print("No usable manifest, full rebuild.")
+        if parquet_dir:
+            reset_dataset(parquet_dir)
+        seen = parallel_clean_csv(input_file, output_file, workers, chunk_bytes=chunk_bytes, parquet_dir=parquet_dir,
+                                  end=end)
+        save_manifest(input_file, output_file, end, seen)
+        return
+
+    manifest, seen = previous
+    if end <= manifest['offset']:
+        print("No new rows since the last run.")
+        return
+
+    header, ranges = split_byte_ranges(input_file, chunk_bytes, start=manifest['offset'], end=end)
+    with open(output_file, 'ab') as output:
+        initial_rows, dated_rows, written_rows = clean_ranges(
+            input_file, header, ranges, output, seen, workers=workers, parquet_dir=parquet_dir, write_header=False)
+
+    save_manifest(input_file, output_file, end, seen)
+    print(f"New rows read: {initial_rows}")
+    print(f"Number of new rows after date conversion: {dated_rows}")
+    print(f"Number of new rows after removing duplicates: {written_rows}")
+    print(f"Rows appended to: {output_file}")
+
+
+def parse_year_range(value):
+    """Parse a 'YYYY-YYYY' (or 'YYYY') command line value into an inclusive (min, max) tuple."""
+    bounds = [int(year) for year in value.split('-')]
+    return bounds[0], bounds[-1]
+
+
 if __name__ == "__main__":
-    input_file = './data/dataw_fro03.csv'  
-    output_file = './data/cleaned_data.csv'  
+    parser = argparse.ArgumentParser(description="Clean the client data file.")
+    parser.add_argument('input_file', nargs='?', default='./data/dataw_fro03.csv')
+    parser.add_argument('output_file', nargs='?', default='./data/cleaned_data.csv')
+    parser.add_argument('--chunksize', type=int, default=None,
+                        help="stream the input this many rows at a time (bounded memory)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="number of processes used to clean the input (default: 1)")
+    parser.add_argument('--incremental', action='store_true',
+                        help="only clean the lines appended since the previous run (full rebuild if the input was rewritten)")
+    parser.add_argument('--parquet-dir', default=None,
+                        help="also write a Parquet dataset partitioned by year and department")
+    parser.add_argument('--extract', action='store_true',
+                        help="read the Parquet dataset `input_file` and write the selected partitions to `output_file`")
+    parser.add_argument('--years', type=parse_year_range, default=None, help="with --extract, e.g. 2006-2010")
+    parser.add_argument('--departments', default=None, help="with --extract, e.g. 53,61,28")
+    args = parser.parse_args()
 
-    read_and_clean_csv(input_file, output_file)
+    if args.extract:
+        departments = set(args.departments.split(',')) if args.departments else None
+        extract_partitions(args.input_file, args.output_file, years=args.years, departments=departments)
+    else:
+        read_and_clean_csv(args.input_file, args.output_file, chunksize=args.chunksize,
+                           parquet_dir=args.parquet_dir, workers=args.workers, incremental=args.incremental)
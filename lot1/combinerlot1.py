@@ -0,0 +1,60 @@
+import sys
+
+# Maximum number of orders kept in memory before the partial sums are written out
+max_orders_in_memory = 100000
+
+
+def combiner():
+    """
+    Pre-aggregate the output of `mapperlot1.py` per order code before the shuffle.
+
+    Reads lines in the mapper format 'codcde\tvillecli\tqte\ttimbrecde' from standard input and
+    writes, in the same format, one line per order code with the sums of `qte` and `timbrecde`.
+    Because the input and output formats are the same, Hadoop may run this combiner zero, one
+    or several times without changing the result of `reducerlot1.py`.
+
+    Compact records 'codcde\t~city id\tqte\ttimbrecde cents' (see tools/streamcodec.py) are
+    summed as integers in their own table and written back in the compact format, so the
+    combiner does not need the city dictionary.
+
+    Memory is bounded: the table is written out whenever it holds `max_orders_in_memory` orders.
+    """
+    orders = {}
+    compact_orders = {}
+
+    for line in sys.stdin:
+        parts = line.rstrip('\n').split('\t')
+        if len(parts) < 4:
+            print("Malformed line: %s" % line, file=sys.stderr)
+            continue
+
+        compact = parts[1][:1] == '~'
+        try:
+            codcde, villecli, qte = parts[0], parts[1], int(parts[2])
+            timbrecde = int(parts[3]) if compact else float(parts[3])
+        except ValueError as e:
+            print("Malformed line: %s, Error: %s" % (line, e), file=sys.stderr)
+            continue
+
+        table = compact_orders if compact else orders
+        order = table.get(codcde)
+        if order is None:
+            if len(table) >= max_orders_in_memory:
+                emit_orders(table)
+            order = table[codcde] = [villecli, 0, 0 if compact else 0.0]
+        order[1] += qte
+        order[2] += timbrecde
+
+    emit_orders(orders)
+    emit_orders(compact_orders)
+
+
+def emit_orders(orders):
+    """Print the partial sums of `orders` in the mapper output format, then empty the table."""
+    for codcde, (villecli, qte, timbrecde) in orders.items():
+        print('%s\t%s\t%s\t%s' % (codcde, villecli, qte, timbrecde))
+    orders.clear()
+
+
+if __name__ == "__main__":
+    combiner()
@@ -1,3 +1,6 @@
+import argparse
+import importlib
+import os
 import sys
 import csv
 
@@ -6,14 +9,61 @@ departement_numbers = {'53', '61', '28'}
 year_min = 2006
 year_max = 2010
 
-def mapper():
+# Maximum number of orders kept in memory by the mapper before the partial sums are written out
+max_orders_in_memory = 100000
+
+# Column order of cleaned_data.csv, used when the input split does not start with the header line
+default_columns = ['codcli', 'genrecli', 'nomcli', 'prenomcli', 'cpcli', 'villecli', 'codcde', 'datcde',
+                   'timbrecli', 'timbrecde', 'Nbcolis', 'cheqcli', 'barchive', 'bstock', 'codobj', 'qte', 'Colis',
+                   'libobj', 'Tailleobj', 'Poidsobj', 'points', 'indispobj', 'libcondit', 'prixcond', 'puobj']
+required_columns = ['codcli', 'cpcli', 'villecli', 'codcde', 'timbrecde', 'qte', 'datcde']
+
+
+def split_line(line):
+    """Split a CSV line into fields, with `csv.reader` only when the line contains quotes."""
+    if '"' in line:
+        return next(csv.reader([line]))
+    return line.rstrip('\r\n').split(',')
+
+
+def import_streamcodec():
+    """Import `streamcodec`, shipped with -file on Hadoop and found in tools/ in the repository."""
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools'))
+    return importlib.import_module('streamcodec')
+
+
+def emit_orders(orders, codec=None, city_tokens=None):
+    """
+    Print the partial sums of `orders` in the mapper output format, then empty the table.
+
+    `orders` maps each 'codcde' to [villecli, sum of qte, sum of timbrecde]. With `codec` and
+    `city_tokens`, orders are written as compact records 'codcde\t~city id\tqte\ttimbrecde cents'
+    (see tools/streamcodec.py), or in the text format when they cannot be encoded.
+    """
+    if codec is None:
+        sys.stdout.write(''.join('%s\t%s\t%s\t%s\n' % (codcde, villecli, qte, timbrecde)
+                                 for codcde, (villecli, qte, timbrecde) in orders.items()))
+    else:
+        output = []
+        for codcde, (villecli, qte, timbrecde) in orders.items():
+            city = city_tokens.get(villecli)
+            cents = codec.to_cents(timbrecde)
+            if city is None or cents is None:
+                output.append('%s\t%s\t%s\t%s\n' % (codcde, villecli, qte, timbrecde))
+            else:
+                output.append('%s\t%s\t%d\t%d\n' % (codcde, city, qte, cents))
+        sys.stdout.write(''.join(output))
+    orders.clear()
+
+
+def mapper(dictionary=None):
     """
     Process each row of a CSV file from standard input and filter data by department number and year.
-    
+
     Reads data from the standard input, expecting CSV format with specific columns related to client orders.
     Each row is filtered based on predefined department numbers and a date range for the year. Rows that
     meet these criteria are output in a specific format suitable for Hadoop processing.
-    
+
     Required columns:
     - 'codcli': client code
     - 'cpcli': postal code of client
@@ -23,41 +73,88 @@ def mapper():
     - 'qte': quantity ordered
     - 'datcde': order date in 'YYYY-MM-DD' format
 
+    Parsing:
+    - Column positions are resolved once from the header line. Input splits that do not start
+      with the header (every split but the first one in Hadoop) use the layout of cleaned_data.csv.
+    - Lines are split positionally, and rows are rejected on the first 4 characters of 'datcde'
+      and the first 2 of 'cpcli' before any conversion.
+
     Output format:
-    - Each filtered row is printed in the format: 'villecli;qte;timbrecde;codcde'.
+    - One line per order in the format: 'codcde\tvillecli\tqte\ttimbrecde', where `qte` and
+      `timbrecde` are the sums over the order lines read by this mapper (in-mapper combining).
+      `codcde` comes first so that Hadoop partitions and sorts the records on the order code.
+      The table of orders is written out whenever it holds `max_orders_in_memory` orders, so
+      the same order may appear more than once; the reducer adds the partial sums up.
+
+    Compact output:
+    - With `dictionary` (path of the city dictionary file), orders are written as compact
+      records 'codcde\t~city id\tqte\ttimbrecde cents' (see tools/streamcodec.py).
 
     Filtering criteria:
     - Orders between years `year_min` and `year_max` (inclusive).
     - Postal code starts with one of the specified department numbers.
     """
+    years = {str(year) for year in range(year_min, year_max + 1)}
+    orders = {}
+    codec = city_tokens = None
+    if dictionary:
+        codec = import_streamcodec()
+        city_tokens = codec.dictionary_tokens(codec.load_dictionary(dictionary))
+
+    # Resolve the column positions from the header, or fall back to the cleaned_data.csv layout
+    first_line = sys.stdin.readline()
+    if not first_line:
+        return
+    columns = split_line(first_line)
+    pending_lines = []
+    if 'codcde' not in columns:
+        columns = default_columns
+        pending_lines.append(first_line)
 
-    # Read from standard input
-    reader = csv.DictReader(sys.stdin)
-    
-    for row in reader:
-        try:
-            # Check if all required columns are present
-            required_columns = ['codcli', 'cpcli', 'villecli', 'codcde', 'timbrecde', 'qte', 'datcde']
-            if not all(key in row for key in required_columns):
-                print("Missing columns in row: %s" % row, file=sys.stderr)
+    missing_columns = [key for key in required_columns if key not in columns]
+    if missing_columns:
+        print("Missing columns: %s" % missing_columns, file=sys.stderr)
+        return
+    i_cpcli, i_villecli, i_codcde, i_timbrecde, i_qte, i_datcde = (
+        columns.index(key) for key in ('cpcli', 'villecli', 'codcde', 'timbrecde', 'qte', 'datcde'))
+    n_columns = max(i_cpcli, i_villecli, i_codcde, i_timbrecde, i_qte, i_datcde) + 1
+
+    for lines in (pending_lines, sys.stdin):
+        for line in lines:
+            row = split_line(line)
+            if len(row) < n_columns:
+                if line.strip():
+                    print("Malformed line: %s" % line.rstrip('\r\n'), file=sys.stderr)
                 continue
 
-            # Extract necessary columns
-            cpcli = row['cpcli']
-            villecli = row['villecli']
-            codcde = row['codcde']
-            timbrecde = row['timbrecde']
-            qte = row['qte']
+            # Filter by year and department number on the raw text, before any conversion
+            if row[i_datcde][:4] not in years or row[i_cpcli][:2] not in departement_numbers:
+                continue
 
-            # Filter by year and department number
-            year_commande = int(row['datcde'].split('-')[0])
-            if year_min <= year_commande <= year_max and cpcli[:2] in departement_numbers:
-                # Output format for Hadoop
-                print('%s;%s;%s;%s' % (villecli, qte, timbrecde, codcde))
+            try:
+                codcde = row[i_codcde]
+                qte = int(row[i_qte])
+                timbrecde = float(row[i_timbrecde])
+            except ValueError as e:
+                print("Malformed line: %s, Error: %s" % (line.rstrip('\r\n'), e), file=sys.stderr)
+                continue
 
-        except (ValueError, IndexError) as e:
-            print("Malformed line: %s, Error: %s" % (row, e), file=sys.stderr)
+            # Accumulate the order in memory, spill the table when it is full
+            order = orders.get(codcde)
+            if order is None:
+                if len(orders) >= max_orders_in_memory:
+                    emit_orders(orders, codec, city_tokens)
+                order = orders[codcde] = [row[i_villecli], 0, 0.0]
+            order[1] += qte
+            order[2] += timbrecde
+
+    # Output format for Hadoop
+    emit_orders(orders, codec, city_tokens)
 
 # Run the mapper
 if __name__ == "__main__":
-    mapper()
+    parser = argparse.ArgumentParser(description="Lot1 mapper.")
+    parser.add_argument('--dictionary', default=None, help="city dictionary file: write compact intermediate records")
+    args = parser.parse_args()
+
+    mapper(dictionary=args.dictionary)
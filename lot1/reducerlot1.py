@@ -1,76 +1,125 @@
+import argparse
+import heapq
+import importlib
 import os
 import sys
-import csv
-import pandas as pd
 
-def reducer():
+# Number of best orders kept by each reducer (and in the final report)
+top_k = 100
+
+
+def ranking_key(order):
     """
-    Process CSV input data from standard input, aggregate by order code, and export the top 100 results to Excel.
+    Sort key of the best orders: total quantity then total timbrecde (both descending), then
+    order code, so that ties are broken the same way whatever the number of reducers.
 
-    This function reads semi-colon delimited data from the standard input, with each line containing:
-    - 'ville' (city of the order)
-    - 'qte' (quantity ordered)
-    - 'timbrecde' (order timestamp as a float)
-    - 'codcde' (order code)
-    
-    The reducer aggregates total quantities and timestamp sums for each unique order code (`codcde`). The top 100
-    entries by total quantity and timestamp are saved in descending order in an Excel file.
+    The timbrecde sum is rounded to ignore float noise from the order in which partial sums are added.
+    """
+    codcde, ville, quantity_totale, timbrecde_total = order
+    return -quantity_totale, -round(timbrecde_total, 6), codcde
 
-    Data Processing:
-    - For each line, the function extracts the relevant columns and aggregates `quantity_totale` and `timbrecde_total` 
-      for each unique `codcde`.
-    - Malformed lines or rows with conversion errors are logged to standard error.
 
-    Output:
-    - Top 100 entries (by total quantity and timbrecde) are saved to an Excel file at the path:
-      `'/datavolume1/results_lot1.xlsx'`.
-    - The resulting DataFrame contains columns: 'Ville', 'Code Commande', 'Quantité Totale', 'Timbrecde Total'.
+def import_streamcodec():
+    """Import `streamcodec`, shipped with -file on Hadoop and found in tools/ in the repository."""
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools'))
+    return importlib.import_module('streamcodec')
+
+
+def read_orders(lines, dictionary=None):
     """
+    Aggregate the sorted mapper output of this reducer, one order at a time.
+
+    Hadoop delivers the records sorted by key (`codcde`), so all the partial sums of an order
+    are consecutive: each order is yielded as soon as the key changes and only one order is
+    kept in memory.
+
+    Lines may be text records or compact records 'codcde\t~city id\tqte\ttimbrecde cents' (see
+    tools/streamcodec.py); the city dictionary (`dictionary`, or `villes.txt` by default) is
+    only loaded when the first compact record is read.
 
-    results = {}
+    Yields:
+    - tuple: (codcde, ville, quantity_totale, timbrecde_total)
+    """
+    current = None
+    previous_key = None
+    unsorted = False
+    cities = None
 
-    for line in sys.stdin: 
+    for line in lines:
         line = line.strip()
-        if not line:  
+        if not line:
             continue
 
-        parts = line.split(';')
-        if len(parts) < 4:  
+        parts = line.split('\t')
+        if len(parts) < 4:
             print("Malformed line: %s" % line, file=sys.stderr)
             continue
-        
+
         # Data extraction from lines and parts
         try:
-            ville = parts[0]  
-            qte = int(parts[1]) 
-            timbrecde = float(parts[2])  
-            codcde = parts[3]  
-
-            if codcde not in results:
-                results[codcde] = {'ville': ville, 'quantity_totale': 0, 'timbrecde_total': 0.0}
-                
-            results[codcde]['quantity_totale'] += qte
-            results[codcde]['timbrecde_total'] += timbrecde
-
-        except ValueError as e:
+            codcde = parts[0]
+            ville = parts[1]
+            qte = int(parts[2])
+            if ville[:1] == '~':
+                if cities is None:
+                    codec = import_streamcodec()
+                    cities = codec.dictionary_values(codec.load_dictionary(dictionary))
+                ville = cities[ville]
+                timbrecde = int(parts[3]) / 100
+            else:
+                timbrecde = float(parts[3])
+        except (ValueError, KeyError) as e:
             print("Malformed line: %s, Error: %s" % (line, e), file=sys.stderr)
-            
-    # Sort results by total quantity and total timbre in descending order
-    top_100_results = sorted(results.items(), key=lambda x: (x[1]['quantity_totale'], x[1]['timbrecde_total']), reverse=True)[:100]
-    print("Top 100 results: {}".format(top_100_results))
-   
-    # Prepare data for DataFrame
-    # Create DataFrame
-    df = pd.DataFrame([(data['ville'], codcde, data['quantity_totale'], data['timbrecde_total']) for codcde, data in top_100_results],
-                      columns=['Ville', 'Code Commande', 'Quantité Totale', 'Timbrecde Total'])
+            continue
 
-    # Specify the output file path
-    xlsx_file_path =xlsx_file_path = '/datavolume1/results_lot1.xlsx'
+        if current is not None and codcde == current[0]:
+            current[2] += qte
+            current[3] += timbrecde
+            continue
 
-    # Export to Excel
-    df.to_excel(xlsx_file_path, index=False)
+        if current is not None:
+            yield tuple(current)
+        if previous_key is not None and codcde < previous_key and not unsorted:
+            print("Input not sorted by codcde (%s after %s), orders may be split" % (codcde, previous_key),
+                  file=sys.stderr)
+            unsorted = True
+        previous_key = codcde
+        current = [codcde, ville, qte, timbrecde]
+
+    if current is not None:
+        yield tuple(current)
+
+
+def reducer(dictionary=None):
+    """
+    Aggregate the mapper output by order code and emit the local top 100 orders of this reducer.
+
+    This function reads tab-separated data from the standard input, sorted by order code, with each line containing:
+    - 'codcde' (order code)
+    - 'ville' (city of the order)
+    - 'qte' (quantity ordered, possibly already summed by the mapper or the combiner)
+    - 'timbrecde' (order timbre as a float, possibly already summed)
+
+    Data Processing:
+    - Consecutive lines of the same `codcde` are summed into `quantity_totale` and `timbrecde_total`.
+    - A bounded heap keeps the 100 best orders by total quantity and timbrecde, so memory is O(100)
+      whatever the number of orders.
+    - Malformed lines or rows with conversion errors are logged to standard error.
+
+    Output:
+    - Up to 100 lines 'codcde\tville\tquantity_totale\ttimbrecde_total', best first. With several
+      reducers (partitioned on `codcde`), `reportlot1.py` merges these partial results into the
+      global top 100 and writes the Excel file.
+    """
+    top_orders = heapq.nsmallest(top_k, read_orders(sys.stdin, dictionary), key=ranking_key)
+
+    for codcde, ville, quantity_totale, timbrecde_total in top_orders:
+        print('%s\t%s\t%s\t%s' % (codcde, ville, quantity_totale, timbrecde_total))
 
-    print("Saved results in '%s'." % xlsx_file_path)
 
 if __name__ == "__main__":
-    reducer()
+    parser = argparse.ArgumentParser(description="Lot1 reducer.")
+    parser.add_argument('--dictionary', default=None, help="city dictionary of the compact records (default: villes.txt)")
+    args = parser.parse_args()
+
+    reducer(dictionary=args.dictionary)
@@ -0,0 +1,64 @@
+import argparse
+import heapq
+import sys
+
+import pandas as pd
+
+from reducerlot1 import ranking_key, top_k
+
+
+def read_partial_results(lines):
+    """
+    Parse the records written by `reducerlot1.py` ('codcde\tville\tquantity_totale\ttimbrecde_total').
+
+    Yields:
+    - tuple: (codcde, ville, quantity_totale, timbrecde_total)
+    """
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            codcde, ville, quantity_totale, timbrecde_total = line.split('\t')
+            yield codcde, ville, int(quantity_totale), float(timbrecde_total)
+        except ValueError as e:
+            print("Malformed line: %s, Error: %s" % (line, e), file=sys.stderr)
+
+
+def report(lines, xlsx_file_path):
+    """
+    Merge the partial top 100 of every reducer into the global top 100 and export it to Excel.
+
+    Parameters:
+    - lines (iterable): Lines of the reducer outputs (all the `part-*` files of the job).
+    - xlsx_file_path (str): Path of the Excel file to write.
+
+    Output:
+    - The top 100 orders (by total quantity, then total timbrecde) are saved in descending order
+      to `xlsx_file_path`, with columns: 'Ville', 'Code Commande', 'Quantité Totale', 'Timbrecde Total'.
+    """
+    top_100_results = heapq.nsmallest(top_k, read_partial_results(lines), key=ranking_key)
+    print("Top 100 results: {}".format(top_100_results))
+
+    # Create DataFrame
+    df = pd.DataFrame([(ville, codcde, quantity_totale, timbrecde_total)
+                       for codcde, ville, quantity_totale, timbrecde_total in top_100_results],
+                      columns=['Ville', 'Code Commande', 'Quantité Totale', 'Timbrecde Total'])
+
+    # Export to Excel
+    df.to_excel(xlsx_file_path, index=False)
+
+    print("Saved results in '%s'." % xlsx_file_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge the lot1 reducer outputs and write the Excel report.")
+    parser.add_argument('inputs', nargs='*', help="reducer output files (default: standard input)")
+    parser.add_argument('--output', default='/datavolume1/results_lot1.xlsx')
+    args = parser.parse_args()
+
+    if args.inputs:
+        lines = (line for path in args.inputs for line in open(path, encoding='utf-8'))
+    else:
+        lines = sys.stdin
+    report(lines, args.output)
@@ -1,3 +1,6 @@
+import argparse
+import importlib
+import os
 import sys
 import csv
 
@@ -6,12 +9,38 @@ departments_number = {'22', '49', '53'}
 year_min = 2011
 year_max = 2016
 
-def mapper():
+# Number of output lines buffered before being written to standard output
+output_batch_size = 10000
+
+# Column order of cleaned_data.csv, used when the input split does not start with the header line
+default_columns = ['codcli', 'genrecli', 'nomcli', 'prenomcli', 'cpcli', 'villecli', 'codcde', 'datcde',
+                   'timbrecli', 'timbrecde', 'Nbcolis', 'cheqcli', 'barchive', 'bstock', 'codobj', 'qte', 'Colis',
+                   'libobj', 'Tailleobj', 'Poidsobj', 'points', 'indispobj', 'libcondit', 'prixcond', 'puobj']
+required_columns = ['codcli', 'cpcli', 'villecli', 'codcde', 'timbrecli', 'qte', 'datcde']
+
+# Text values of `timbrecli` accepted without calling float()
+zero_timbrecli = {'', '0', '0.0'}
+
+
+def split_line(line):
+    """Split a CSV line into fields, with `csv.reader` only when the line contains quotes."""
+    if '"' in line:
+        return next(csv.reader([line]))
+    return line.rstrip('\r\n').split(',')
+
+
+def import_streamcodec():
+    """Import `streamcodec`, shipped with -file on Hadoop and found in tools/ in the repository."""
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools'))
+    return importlib.import_module('streamcodec')
+
+
+def mapper(dictionary=None):
     """
     Process each row of a CSV input to filter orders by department and year, then output in a format for further processing.
 
     Reads CSV data from standard input, expecting specific columns related to client orders. Each row is filtered
-    based on department numbers and a date range for the year. Orders that meet these criteria and have either a 
+    based on department numbers and a date range for the year. Orders that meet these criteria and have either a
     missing or zero value for `timbrecli` are printed in a format suitable for the reducer function.
 
     Required columns:
@@ -23,41 +52,86 @@ def mapper():
     - 'qte': quantity ordered
     - 'datcde': order date in 'YYYY-MM-DD' format
 
+    Parsing:
+    - Column positions are resolved once from the header line. Input splits that do not start
+      with the header (every split but the first one in Hadoop) use the layout of cleaned_data.csv.
+    - Lines are split positionally, and rows are rejected on the first 4 characters of 'datcde'
+      and the first 2 of 'cpcli' before any conversion.
+
     Filtering criteria:
     - Orders between years `year_min` and `year_max` (inclusive).
     - Postal code starts with one of the specified department numbers.
     - `timbrecli` is either missing or zero.
 
     Output format:
-    - Each filtered row is printed in the format: 'codcde\tvillecli\tqte\ttimbrecli'.
+    - Each filtered row is printed in the format: 'codcde\tvillecli\tqte\ttimbrecli', in batches
+      of `output_batch_size` lines.
+    - With `dictionary` (path of the city dictionary file), rows are written as compact records
+      'codcde\t~city id\tqte' (see tools/streamcodec.py): `timbrecli` is dropped since it is
+      always zero after filtering. Cities missing from the dictionary stay in the text format.
     """
+    years = {str(year) for year in range(year_min, year_max + 1)}
+    output = []
+    city_tokens = {}
+    if dictionary:
+        codec = import_streamcodec()
+        city_tokens = codec.dictionary_tokens(codec.load_dictionary(dictionary))
 
-    reader = csv.DictReader(sys.stdin)
+    # Resolve the column positions from the header, or fall back to the cleaned_data.csv layout
+    first_line = sys.stdin.readline()
+    if not first_line:
+        return
+    columns = split_line(first_line)
+    pending_lines = []
+    if 'codcde' not in columns:
+        columns = default_columns
+        pending_lines.append(first_line)
 
-    for row in reader:
-        try:
-            # Check for necessary columns
-            if not all(key in row for key in ['codcli', 'cpcli', 'villecli', 'codcde', 'timbrecli', 'qte', 'datcde']):
-                print("missing columns: %s" % str(row), file=sys.stderr)
+    missing_columns = [key for key in required_columns if key not in columns]
+    if missing_columns:
+        print("missing columns: %s" % missing_columns, file=sys.stderr)
+        return
+    i_cpcli, i_villecli, i_codcde, i_timbrecli, i_qte, i_datcde = (
+        columns.index(key) for key in ('cpcli', 'villecli', 'codcde', 'timbrecli', 'qte', 'datcde'))
+    n_columns = max(i_cpcli, i_villecli, i_codcde, i_timbrecli, i_qte, i_datcde) + 1
+
+    for lines in (pending_lines, sys.stdin):
+        for line in lines:
+            row = split_line(line)
+            if len(row) < n_columns:
+                if line.strip():
+                    print("Malformed line: %s" % line.rstrip('\r\n'), file=sys.stderr)
                 continue
 
-            # Extract columns
-            cpcli = row['cpcli']
-            villecli = row['villecli']
-            codcde = row['codcde']
-            timbrecli = row['timbrecli']
-            qte = int(row['qte'])
-            year_commande = int(row['datcde'].split('-')[0])
+            # Filter by year and department number on the raw text, before any conversion
+            if row[i_datcde][:4] not in years or row[i_cpcli][:2] not in departments_number:
+                continue
 
-            # Filter by year and department number
-            if year_min <= year_commande <= year_max and cpcli[:2] in departments_number:
+            try:
                 # Filter orders without specified timbrecli or zero
-                if not timbrecli or float(timbrecli) == 0:
-                    print("%s\t%s\t%d\t%s" % (codcde, villecli, qte, timbrecli))  # Format expected by the reducer
+                timbrecli = row[i_timbrecli]
+                if timbrecli not in zero_timbrecli and float(timbrecli) != 0:
+                    continue
+                qte = int(row[i_qte])
+            except ValueError as e:
+                print("Malformed line: %s, Error: %s" % (line.rstrip('\r\n'), e), file=sys.stderr)
+                continue
+
+            city = city_tokens.get(row[i_villecli])
+            if city is None:
+                output.append("%s\t%s\t%d\t%s\n" % (row[i_codcde], row[i_villecli], qte, timbrecli))  # Format expected by the reducer
+            else:
+                output.append("%s\t%s\t%d\n" % (row[i_codcde], city, qte))
+            if len(output) >= output_batch_size:
+                sys.stdout.write(''.join(output))
+                output.clear()
 
-        except (ValueError, IndexError) as e:
-            print("Malformed line: %s, Error: %s" % (row, e), file=sys.stderr)
+    sys.stdout.write(''.join(output))
 
 
 if __name__ == "__main__":
-    mapper()
+    parser = argparse.ArgumentParser(description="Lot2 mapper.")
+    parser.add_argument('--dictionary', default=None, help="city dictionary file: write compact intermediate records")
+    args = parser.parse_args()
+
+    mapper(dictionary=args.dictionary)
@@ -1,96 +1,107 @@
+import argparse
+import heapq
+import importlib
+import os
 import sys
-import matplotlib
-matplotlib.use('Agg')
-from matplotlib import pyplot as plt
-import pandas as pd
 
+# Number of best orders kept by each reducer (and in the final report)
+top_k = 100
 
-def reducer():
+
+def ranking_key(order):
+    """
+    Sort key of the best orders: total quantity then mean quantity (both descending), then
+    order code so that ties are always broken the same way.
+    """
+    codcde, ville, total_quantity, moyenne_qte = order
+    return -total_quantity, -round(moyenne_qte, 6), codcde
+
+
+def import_streamcodec():
+    """Import `streamcodec`, shipped with -file on Hadoop and found in tools/ in the repository."""
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools'))
+    return importlib.import_module('streamcodec')
+
+
+def read_orders(lines, dictionary=None):
+    """
+    Aggregate the sorted mapper output, one order at a time.
+
+    Hadoop delivers the lines sorted by key (`codcde`, first field), so the lines of an order
+    are consecutive: the running total and count of the current order are finished as soon as
+    the key changes, and only one order is kept in memory.
+
+    Lines may be text records or compact records 'codcde\t~city id\tqte' (see
+    tools/streamcodec.py); the city dictionary (`dictionary`, or `villes.txt` by default) is
+    only loaded when the first compact record is read.
+
+    Yields:
+    - tuple: (codcde, ville, total_quantity, moyenne_qte)
     """
-    Aggregate and analyze order data from standard input, producing summary statistics and saving results in Excel and PDF.
+    current_codcde = None
+    ville = None
+    total_quantity = 0.0
+    count = 0
+    cities = None
 
-    This function reads tab-separated data from standard input, where each line represents an order with:
+    for line in lines:
+        try:
+            parts = line.strip().split('\t')
+            if parts[1][:1] == '~':
+                codcde, villecli, qte = parts
+                if cities is None:
+                    codec = import_streamcodec()
+                    cities = codec.dictionary_values(codec.load_dictionary(dictionary))
+                villecli = cities[villecli]
+            else:
+                codcde, villecli, qte, timbrecli = parts
+            qte = float(qte)
+        except (ValueError, IndexError, KeyError):
+            continue
+
+        if codcde != current_codcde:
+            if current_codcde is not None:
+                yield current_codcde, ville, total_quantity, total_quantity / count if count > 0 else 0
+            current_codcde, ville, total_quantity, count = codcde, villecli, 0.0, 0
+
+        # Adding quantity to the order
+        total_quantity += qte
+        count += 1
+
+    if current_codcde is not None:
+        yield current_codcde, ville, total_quantity, total_quantity / count if count > 0 else 0
+
+
+def reducer(dictionary=None):
+    """
+    Aggregate the mapper output by order code and emit the local top 100 orders of this reducer.
+
+    This function reads tab-separated data from standard input, sorted by order code, where each line represents an order with:
     - 'codcde' (order code),
     - 'villecli' (city),
     - 'qte' (quantity),
     - 'timbrecli' (timestamp, optional, defaulting to 0 if missing).
 
     Data Aggregation:
-    - Each order code is used to aggregate total quantities and compute the mean quantity per order code.
-    - The resulting data is sorted in descending order by total quantity and mean quantity.
+    - Consecutive lines of an order code are aggregated into the total quantity and the mean quantity per order code.
+    - A bounded heap keeps the top 100 orders by total quantity and mean quantity, so memory does not depend
+      on the number of orders.
 
     Output:
-    - An Excel file with 5% of the top 100 orders chosen randomly.
-    - A pie chart in PDF format showing the distribution of total quantities among selected cities.
-
-    Processing steps:
-    - Aggregates total quantities (`total_quantity`) per order code.
-    - Calculates the mean quantity (`moyenne_qte`) per order code based on the total orders for each code.
-    - Filters the top 100 orders by `total_quantity` and `moyenne_qte` in descending order.
-    - Selects a random 5% sample of the top 100 orders and creates a pie chart visualization.
-
-    Files generated:
-    - Excel file (`/datavolume1/results_lot02.xlsx`) with selected sample data.
-    - PDF file (`/datavolume1/repartition_par_ville.pdf`) with the pie chart.
+    - Up to 100 lines 'codcde\tville\ttotal_quantity\tmoyenne_qte', best first. The reducer only
+      imports the standard library and writes no file, so it starts fast and can be retried by
+      Hadoop; `reportlot2.py` merges the outputs of all the reducers, draws the random 5% sample
+      and writes the Excel and PDF files.
     """
+    top_orders = heapq.nsmallest(top_k, read_orders(sys.stdin, dictionary), key=ranking_key)
 
-    results = {}
-    counts = {}
+    for codcde, ville, total_quantity, moyenne_qte in top_orders:
+        print('%s\t%s\t%s\t%s' % (codcde, ville, total_quantity, moyenne_qte))
 
-    # Reading input data
-    for line in sys.stdin:
-        try:
-            codcde, villecli, qte, timbrecli = line.strip().split('\t')
-            qte = float(qte)
-            timbrecli = float(timbrecli) if timbrecli else 0.0
-
-            if codcde not in results:
-                results[codcde] = {
-                    "ville": villecli,
-                    "total_quantity": 0,
-                }
-                counts[codcde] = 0
-            
-            # Adding quantity to the order
-            results[codcde]["total_quantity"] += qte
-            counts[codcde] += 1 
-                
-        except ValueError:
-            continue 
-
-    for codcde in results:
-        count = counts[codcde]
-        results[codcde]["menne_qte"] = results[codcde]["total_quantity"] / count if count > 0 else 0
-
-    # Convert to DataFrame
-    df_results = pd.DataFrame.from_dict(results, orient='index').reset_index()
-    df_results.columns = ['Codcde', 'Ville', 'Total Quantite', 'Moyenne des Quantites']
- 
-    # Sort Total Quantite desc, Moyenne des Quantites desc
-    df_results = df_results.sort_values(by=['Total Quantite', 'Moyenne des Quantites'], ascending=[False, False])
- 
-    # Take the top 100 results
-    df_top_100 = df_results.head(100)
- 
-    # Display 5% of these results randomly
-    df_sample = df_top_100.sample(frac=0.05)
-    
-    # Pie chart
-    plt.figure(figsize=(10, 6))
-    df_sample.groupby('Ville')['Total Quantite'].sum().plot(kind='pie', autopct='%1.1f%%')
-    plt.title('Random Display of 5% of the Top 100 Orders')
-    plt.ylabel('')
-    plt.legend(title='Cities', bbox_to_anchor=(1, 0.5), loc='center left')
-    plt.tight_layout()
-    plt.savefig('/datavolume1/repartition_par_ville.pdf')
-    plt.close()
-    
-    # Extract result to an Excel file
-    output_file = '/datavolume1/results_lot02.xlsx'
-    df_sample.to_excel(output_file, index=False)
- 
-    print("5%% of the top 100 orders have been saved in: %s" % output_file)
 
 if __name__ == "__main__":
-    reducer()
+    parser = argparse.ArgumentParser(description="Lot2 reducer.")
+    parser.add_argument('--dictionary', default=None, help="city dictionary of the compact records (default: villes.txt)")
+    args = parser.parse_args()
 
+    reducer(dictionary=args.dictionary)
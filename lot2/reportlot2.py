@@ -0,0 +1,86 @@
+import argparse
+import heapq
+import random
+import sys
+
+import matplotlib
+matplotlib.use('Agg')
+from matplotlib import pyplot as plt
+import pandas as pd
+
+from reducerlot2 import ranking_key, top_k
+
+# Fraction of the top 100 orders drawn at random for the report
+sample_fraction = 0.05
+
+
+def read_partial_results(lines):
+    """
+    Parse the records written by `reducerlot2.py` ('codcde\tville\ttotal_quantity\tmoyenne_qte').
+
+    Yields:
+    - tuple: (codcde, ville, total_quantity, moyenne_qte)
+    """
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            codcde, ville, total_quantity, moyenne_qte = line.split('\t')
+            yield codcde, ville, float(total_quantity), float(moyenne_qte)
+        except ValueError as e:
+            print("Malformed line: %s, Error: %s" % (line, e), file=sys.stderr)
+
+
+def report(lines, xlsx_file_path, pdf_file_path, seed=None):
+    """
+    Merge the partial top 100 of every reducer, draw 5% of the global top 100 at random and
+    export them to Excel and to a pie chart in PDF.
+
+    Parameters:
+    - lines (iterable): Lines of the reducer outputs (all the `part-*` files of the job).
+    - xlsx_file_path (str): Path of the Excel file to write.
+    - pdf_file_path (str): Path of the PDF file to write.
+    - seed (int): Seed of the random sample (reproducible reports), or None.
+
+    Output:
+    - An Excel file with 5% of the top 100 orders chosen randomly, with columns:
+      'Codcde', 'Ville', 'Total Quantite', 'Moyenne des Quantites'.
+    - A pie chart in PDF format showing the distribution of total quantities among selected cities.
+    """
+    top_100 = heapq.nsmallest(top_k, read_partial_results(lines), key=ranking_key)
+
+    # Display 5% of these results randomly
+    sample = random.Random(seed).sample(top_100, round(len(top_100) * sample_fraction))
+    df_sample = pd.DataFrame(sample, columns=['Codcde', 'Ville', 'Total Quantite', 'Moyenne des Quantites'])
+
+    # Pie chart
+    plt.figure(figsize=(10, 6))
+    if not df_sample.empty:
+        df_sample.groupby('Ville')['Total Quantite'].sum().plot(kind='pie', autopct='%1.1f%%')
+        plt.legend(title='Cities', bbox_to_anchor=(1, 0.5), loc='center left')
+    plt.title('Random Display of 5% of the Top 100 Orders')
+    plt.ylabel('')
+    plt.tight_layout()
+    plt.savefig(pdf_file_path)
+    plt.close()
+
+    # Extract result to an Excel file
+    df_sample.to_excel(xlsx_file_path, index=False)
+
+    print("5%% of the top 100 orders have been saved in: %s" % xlsx_file_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge the lot2 reducer outputs and write the Excel and PDF reports.")
+    parser.add_argument('inputs', nargs='*', help="reducer output files (default: standard input)")
+    parser.add_argument('--output', default='/datavolume1/results_lot02.xlsx')
+    parser.add_argument('--pdf', default='/datavolume1/repartition_par_ville.pdf')
+    parser.add_argument('--seed', type=int, default=None, help="seed of the random 5%% sample (reproducible runs)")
+    args = parser.parse_args()
+
+    if args.inputs:
+        lines = (line for path in args.inputs for line in open(path, encoding='utf-8'))
+    else:
+        lines = sys.stdin
+    report(lines, args.output, args.pdf, seed=args.seed)
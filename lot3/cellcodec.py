@@ -0,0 +1,349 @@
+import argparse
+import importlib
+import itertools
+import os
+import struct
+import sys
+import threading
+import time
+import happybase
+import pandas as pd
+from hbase_common import (SCAN_BATCH_SIZE, SCAN_WORKERS, column_family, host, meta_family, meta_table_name,
+                          parallel_scan, port, shards, table_name)
+
+"""
+Encodage typé des cellules de la table HBase 'fromagerie'.
+
+Au lieu de `str(valeur).encode('utf-8')`, chaque colonne est encodée selon le type que le lot0 lui donne
+(`CLEAN_DTYPES` de `lot0/cleaned_data.py`):
+- entiers (`int32`, `int16`, `int8`): entier signé big-endian sur 1, 2 ou 4 octets, la plus petite taille qui
+  contient la valeur (la taille de la cellule donne le format);
+- réels (`float`): centièmes en entier sur 1, 2 ou 4 octets quand la valeur est un nombre entier de centièmes
+  (montants, poids), sinon 8 octets IEEE 754 big-endian: la valeur relue est exacte, sans chaîne décimale;
+- booléens: 1 octet (0 ou 1);
+- textes: UTF-8, ou, pour les colonnes de `DICTIONARY_COLUMNS` (libellés très répétés), numéro sur 2 octets
+  dans un dictionnaire de la colonne. La ville (`villecli`) reste en UTF-8 par défaut: la requête 1 la filtre
+  côté serveur avec un comparateur `substring:`, qui ne lit que du texte (`--dictionary villecli ...` la code
+  quand même, filtrée alors côté client);
+- colonnes hors de `CLEAN_DTYPES` (`datcde`): UTF-8.
+Les valeurs manquantes sont remplacées par la valeur de remplissage du lot0 (0, 0.0, False, '').
+
+Le schéma (type de chaque colonne) et les dictionnaires sont enregistrés dans la table `fromagerie_meta`:
+- ligne `schema`: `m:_format` (`binary`, `text` ou `migrating`) et `m:<colonne>` = type (`i`, `h`, `b`, `d`, `?`,
+  `s` texte, `S` texte par dictionnaire);
+- ligne `dict|<colonne>`: `m:<numéro>` = valeur.
+Les lecteurs (`load_codec`) n'ont besoin que de cette table. Une table chargée avant l'encodage typé (sans ligne
+`schema`) est lue en texte, avec les types du lot0.
+
+Les décodeurs travaillent par colonne sur un lot de lignes (`decode_rows`): quand toutes les cellules d'une colonne
+ont la même taille, elles sont lues en un seul `struct.unpack` sur leur concaténation.
+
+Migration d'une table existante (texte vers binaire, sur place, requêtes arrêtées):
+    python3 cellcodec.py --migrate [--workers 8] [--batch-size 1000]
+Pendant la migration, le format est `migrating` et les lecteurs refusent la table; si la migration est
+interrompue, recharger la table avec `script_hbase.py`.
+"""
+
+# Text columns coded with a dictionary (2-byte value numbers); 'villecli' stays text for the server-side
+# substring filter of query 1
+DICTIONARY_COLUMNS = ('libobj', 'libcondit')
+
+# Column kinds of the lot0 dtypes (struct format of the largest integer, 'd' for floats)
+NUMBER_KINDS = ('i', 'h', 'b', 'd')
+DTYPE_KINDS = {'int32': 'i', 'int16': 'h', 'int8': 'b', float: 'd', 'bool': '?', 'string': 's'}
+
+# Struct format of an integer cell, by size; 8-byte cells of floats are doubles
+INTEGER_FORMATS = {1: 'b', 2: 'h', 4: 'i'}
+INTEGER_SIZES = [(1 << 7, 1, 'b'), (1 << 15, 2, 'h'), (1 << 31, 4, 'i')]
+UNPACKERS = {size: struct.Struct('>' + format).unpack for size, format in INTEGER_FORMATS.items()}
+UNPACK_DOUBLE = struct.Struct('>d').unpack
+
+# Fill value of each kind, for missing values
+FILL_VALUES = {'i': 0, 'h': 0, 'b': 0, 'd': 0.0, '?': False, 's': '', 'S': ''}
+
+# Largest number of values of a dictionary (2-byte numbers)
+MAX_DICTIONARY_SIZE = 1 << 16
+
+SCHEMA_ROW = b'schema'
+DICTIONARY_ROW = 'dict|'
+
+
+def import_cleaned_data():
+    """Import `cleaned_data` (lot0), copied next to the scripts or found in lot0/ in the repository."""
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lot0'))
+    return importlib.import_module('cleaned_data')
+
+
+def meta_column(name):
+    """Qualified column name of the meta family."""
+    return ('%s:%s' % (meta_family, name)).encode('utf-8')
+
+
+def parse_bool(text):
+    return text.lower() in ('true', '1', '1.0')
+
+
+def pack_integer(value):
+    """Smallest signed big-endian cell (1, 2 or 4 bytes) of an integer."""
+    for bound, size, format in INTEGER_SIZES:
+        if -bound <= value < bound:
+            return struct.pack('>' + format, value)
+    raise ValueError("Entier hors de int32: %d" % value)
+
+
+def pack_float(value):
+    """Cell of a float: whole number of hundredths as an integer cell, else an 8-byte double."""
+    if abs(value) < (1 << 31) / 100:
+        hundredths = round(value * 100)
+        if hundredths / 100 == value:
+            return pack_integer(hundredths)
+    return struct.pack('>d', value)
+
+
+def unpack_numbers(cells):
+    """Integers (or doubles, for 8-byte cells) of a list of cells, in one unpack when they have the same size."""
+    sizes = set(map(len, cells))
+    if len(sizes) == 1:
+        size = sizes.pop()
+        format = INTEGER_FORMATS.get(size, 'd')
+        return list(struct.unpack('>%d%s' % (len(cells), format), b''.join(cells)))
+    return [UNPACKERS[len(cell)](cell)[0] if len(cell) != 8 else UNPACK_DOUBLE(cell)[0] for cell in cells]
+
+
+# Parser of a text cell, by kind
+TEXT_PARSERS = {'i': int, 'h': int, 'b': int, 'd': float, '?': parse_bool, 's': str, 'S': str}
+
+
+class CellCodec:
+    """
+    Encoder and decoder of the cells of the 'fromagerie' table.
+
+    `kinds` maps each column to its kind ('i', 'h', 'b', 'd', '?', 's' or 'S'); other columns are
+    text. With `binary=False` the cells are `str(value)` in UTF-8, as before the typed encoding.
+    """
+
+    def __init__(self, kinds, binary=True, dictionaries=None):
+        self.kinds = dict(kinds)
+        self.binary = binary
+        self.values = {name: list(values) for name, values in (dictionaries or {}).items()}
+        self.numbers = {name: {value: number for number, value in enumerate(values)}
+                        for name, values in self.values.items()}
+        self.saved = {name: len(values) for name, values in self.values.items()}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_dtypes(cls, dtypes=None, binary=True, dictionary_columns=DICTIONARY_COLUMNS):
+        """Codec of the lot0 dtypes (`CLEAN_DTYPES` by default)."""
+        if dtypes is None:
+            dtypes = import_cleaned_data().CLEAN_DTYPES
+        kinds = {name: DTYPE_KINDS[dtype] for name, (fill_value, dtype) in dtypes.items()}
+        for name in dictionary_columns:
+            if kinds.get(name) == 's':
+                kinds[name] = 'S'
+        return cls(kinds, binary=binary)
+
+    def kind(self, name):
+        return self.kinds.get(name, 's')
+
+    def is_text(self, name):
+        """Whether the cells of the column are UTF-8 text (HBase `substring:` comparators match them)."""
+        return not self.binary or self.kind(name) == 's'
+
+    def number(self, name, value):
+        """Number of `value` in the dictionary of the column, added if new."""
+        numbers = self.numbers.setdefault(name, {})
+        number = numbers.get(value)
+        if number is None:
+            with self.lock:
+                number = numbers.get(value)
+                if number is None:
+                    values = self.values.setdefault(name, [])
+                    if len(values) >= MAX_DICTIONARY_SIZE:
+                        raise ValueError("Dictionnaire de la colonne %s plein (%d valeurs)" % (name, len(values)))
+                    number = numbers[value] = len(values)
+                    values.append(value)
+        return number
+
+    def encode_value(self, name, value):
+        """Cell of one value of the column `name`."""
+        if not self.binary:
+            return str(value).encode('utf-8', errors='replace')
+        kind = self.kind(name)
+        if value is None or value != value:
+            value = FILL_VALUES[kind]
+        if kind == 'd':
+            return pack_float(float(value))
+        if kind in NUMBER_KINDS:
+            return pack_integer(int(value))
+        if kind == '?':
+            return b'\x01' if parse_bool(str(value)) else b'\x00'
+        if kind == 'S':
+            return struct.pack('>H', self.number(name, str(value)))
+        return str(value).encode('utf-8', errors='replace')
+
+    def encode_column(self, name, series):
+        """Cells of the values of a column, each distinct value encoded only once."""
+        codes, uniques = pd.factorize(pd.Series(series, dtype=object), use_na_sentinel=False)
+        encoded = [self.encode_value(name, value) for value in uniques.tolist()]
+        return [encoded[code] for code in codes.tolist()]
+
+    def decode_column(self, name, cells):
+        """Values of a list of cells of the column `name`."""
+        kind = self.kind(name)
+        if not self.binary:
+            parse = TEXT_PARSERS[kind]
+            return [parse(cell.decode('utf-8', errors='replace')) for cell in cells]
+        if kind == 'd':
+            return [value / 100 if len(cell) != 8 else value for cell, value in zip(cells, unpack_numbers(cells))]
+        if kind in NUMBER_KINDS:
+            return unpack_numbers(cells)
+        if kind == '?':
+            return [byte != 0 for byte in b''.join(cells)]
+        if kind == 'S':
+            values = self.values.get(name, [])
+            return [values[number] for number in struct.unpack('>%dH' % len(cells), b''.join(cells))]
+        return [cell.decode('utf-8', errors='replace') for cell in cells]
+
+    def decode_rows(self, rows, names):
+        """
+        Values of the columns `names` of scanned rows (dicts of cells), column by column.
+
+        Returns:
+        - list of dict: {column: value} of each row; missing cells get the fill value of the column.
+        """
+        decoded = []
+        for name in names:
+            column = ('%s:%s' % (column_family, name)).encode('utf-8')
+            cells = [data.get(column) for data in rows]
+            present = [cell for cell in cells if cell is not None]
+            values = self.decode_column(name, present)
+            if len(present) < len(cells):
+                fill = FILL_VALUES[self.kind(name)]
+                values = iter(values)
+                values = [fill if cell is None else next(values) for cell in cells]
+            decoded.append(values)
+        return [dict(zip(names, row)) for row in zip(*decoded)] if names else [{} for _ in rows]
+
+    def save(self, table, format=None):
+        """Write the schema and the new dictionary values to the meta table."""
+        schema = {meta_column(name): kind.encode('utf-8') for name, kind in self.kinds.items()}
+        schema[meta_column('_format')] = (format or ('binary' if self.binary else 'text')).encode('utf-8')
+        table.put(SCHEMA_ROW, schema)
+        with self.lock:
+            pending = [(name, self.saved.get(name, 0), list(values)) for name, values in self.values.items()]
+        for name, start, values in pending:
+            if len(values) > start:
+                table.put((DICTIONARY_ROW + name).encode('utf-8'),
+                          {meta_column(str(number)): values[number].encode('utf-8', errors='replace')
+                           for number in range(start, len(values))})
+                self.saved[name] = len(values)
+
+
+def load_codec(connection, default='text'):
+    """
+    Codec of the 'fromagerie' table, read from the meta table.
+
+    Without a schema in the meta table, returns `default`: 'text' (table loaded before the typed
+    encoding, read as text with the lot0 types) or None.
+    """
+    if meta_table_name.encode('utf-8') in connection.tables():
+        meta = connection.table(meta_table_name)
+        for key, data in meta.scan(row_prefix=SCHEMA_ROW):
+            if key != SCHEMA_ROW:
+                continue
+            format = data.get(meta_column('_format'), b'text').decode('utf-8')
+            if format == 'migrating':
+                raise ValueError("Migration de la table %s interrompue: recharger la table avec script_hbase.py"
+                                 % table_name)
+            kinds = {column.decode('utf-8').split(':', 1)[1]: kind.decode('utf-8') for column, kind in data.items()
+                     if column != meta_column('_format')}
+            dictionaries = {}
+            for dict_key, entries in meta.scan(row_prefix=DICTIONARY_ROW.encode('utf-8')):
+                values = {int(column.decode('utf-8').split(':', 1)[1]): value.decode('utf-8')
+                          for column, value in entries.items()}
+                dictionaries[dict_key.decode('utf-8')[len(DICTIONARY_ROW):]] = [values[number]
+                                                                               for number in range(len(values))]
+            return CellCodec(kinds, binary=(format == 'binary'), dictionaries=dictionaries)
+    if default == 'text':
+        return CellCodec.from_dtypes(binary=False)
+    return default
+
+
+def migrate(host, port, workers=SCAN_WORKERS, batch_size=1000, dictionary_columns=DICTIONARY_COLUMNS):
+    """
+    Rewrite the cells of the 'fromagerie' table with the typed binary encoding, in place.
+
+    The key ranges are migrated in parallel: each thread decodes its rows with the current codec,
+    encodes them again and writes them back by batches. The meta table has the 'migrating' format
+    until every row is written.
+
+    Returns:
+    - int: number of rows rewritten.
+    """
+    connection = happybase.Connection(host, port)
+    connection.open()
+    old_codec = load_codec(connection)
+    if old_codec.binary:
+        print("La table %s est deja encodee en binaire." % table_name)
+        return 0
+    if meta_table_name.encode('utf-8') not in connection.tables():
+        connection.create_table(meta_table_name, {meta_family: dict()})
+    meta = connection.table(meta_table_name)
+    key_ranges = shards(connection.table(table_name))
+
+    new_codec = CellCodec.from_dtypes(dictionary_columns=dictionary_columns)
+    new_codec.save(meta, format='migrating')
+    pool = happybase.ConnectionPool(size=2 * workers, host=host, port=port)
+    start = time.perf_counter()
+
+    def migrate_rows(rows):
+        count = 0
+        rows = iter(rows)
+        with pool.connection() as writer:
+            table = writer.table(table_name)
+            while True:
+                block = list(itertools.islice(rows, SCAN_BATCH_SIZE))
+                if not block:
+                    return count
+                names = sorted({column.decode('utf-8').split(':', 1)[1] for _, data in block for column in data})
+                values = old_codec.decode_rows([data for _, data in block], names)
+                qualified = [('%s:%s' % (column_family, name)).encode('utf-8') for name in names]
+                cells = [new_codec.encode_column(name, [row[name] for row in values]) for name in names]
+                with table.batch(batch_size=batch_size) as batch:
+                    for (key, data), row in zip(block, zip(*cells)):
+                        batch.put(key, {column: cell for column, cell in zip(qualified, row) if column in data})
+                count += len(block)
+
+    count = sum(parallel_scan(key_ranges, migrate_rows, workers=workers, pool=pool))
+    new_codec.save(meta)
+    connection.close()
+    print("%d lignes migrees en %.1f s" % (count, time.perf_counter() - start))
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Encodage typé des cellules de la table HBase 'fromagerie'.")
+    parser.add_argument('--migrate', action='store_true', help="réécrire la table en binaire, sur place")
+    parser.add_argument('--host', default=host)
+    parser.add_argument('--port', type=int, default=port)
+    parser.add_argument('--workers', type=int, default=SCAN_WORKERS)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--dictionary', nargs='*', default=list(DICTIONARY_COLUMNS),
+                        help="colonnes texte codées par dictionnaire")
+    args = parser.parse_args()
+
+    if args.migrate:
+        migrate(args.host, args.port, workers=args.workers, batch_size=args.batch_size,
+                dictionary_columns=args.dictionary)
+    else:
+        connection = happybase.Connection(args.host, port=args.port)
+        codec = load_codec(connection)
+        connection.close()
+        print("Format: %s" % ('binary' if codec.binary else 'text'))
+        for name, kind in sorted(codec.kinds.items()):
+            print("  %s: %s%s" % (name, kind, ' (%d valeurs)' % len(codec.values[name]) if name in codec.values
+                                  else ''))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+import itertools
+import queue
+import struct
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+import happybase
+import pandas as pd
+"""
+Configuration HBase et clés de ligne de la table 'fromagerie', partagées par le chargement et les requêtes du lot3.
+
+Clé de ligne:
+    <bucket>|<année>|<département>|<codcde>|<ligne>      ex.: b'07|2020|44|89292|120533'
+
+- `bucket` (2 chiffres): sel calculé sur `codcde` (crc32 % `SALT_BUCKETS`). Les écritures sont réparties entre
+  `SALT_BUCKETS` plages de clés au lieu d'aller toutes dans la dernière région, et toutes les lignes d'une même
+  commande sont dans le même bucket.
+- `année` (4 chiffres, `datcde`) puis `département` (2 premiers chiffres de `cpcli`): une requête sur une année
+  (et un département) ne lit, dans chaque bucket, que la plage de clés correspondante.
+- `codcde` puis `ligne` (numéro de ligne du CSV) rendent la clé unique.
+
+Chaque ligne porte en plus la colonne `data_fro:_gen` (`CHANGE_COLUMN`), génération du chargement qui l'a écrite
+(horodatage en nanosecondes sur 19 chiffres, comparable en binaire): la synchronisation Elasticsearch du lot4 ne
+lit que les lignes écrites depuis sa dernière génération (`single_column_value_filter('_gen', '>', ...)`).
+
+Une requête fait donc `SALT_BUCKETS` scans bornés (`row_prefix`, ou `row_start`/`row_stop`), un par bucket.
+
+Pré-découpage de la table (shell HBase), une région par bucket:
+    create 'fromagerie', 'data_fro', SPLITS => ['01|', '02|', ..., '15|']
+
+Tables d'agrégats (maintenues par `script_hbase.py` pendant le chargement, compteurs HBase sur 8 octets):
+- `fromagerie_orders_by_year`: clé = année, `r:orders` = nombre de lignes de commande de l'année.
+- `fromagerie_clients`: clé = `codcli`, `r:count`, `r:total_qty`, `r:timbre_cents` (compteurs), `r:nom`, `r:prenom`.
+  La ligne `_top` (`TOP_CLIENT_ROW`) garde le client de plus grande quantité totale: `r:codcli`, `r:count`,
+  `r:total_qty`, `r:nom`, `r:prenom`, mise à jour à chaque écriture des agrégats.
+
+Table de méta-données `fromagerie_meta` (famille `m`): encodage des cellules de 'fromagerie' (voir `cellcodec.py`),
+et génération du chargement (ligne `generation`, `m:stamp`), nouvelle à chaque fin de chargement: les résultats
+mis en cache par les requêtes (`query_cache.py`) sont ceux d'une génération.
+
+Scans: les requêtes ne demandent que leurs colonnes (`columns`), poussent leurs prédicats au serveur sous forme
+de filtres HBase (`single_column_value_filter`, `KEY_ONLY_FILTER`) et lisent `SCAN_BATCH_SIZE` lignes par appel
+Thrift.
+
+Scans parallèles (`parallel_scan`): l'espace des clés est découpé en plages (`shards`: un bucket de sel chacune, ou
+les régions de la table si elle en a davantage) lues en même temps par `SCAN_WORKERS` threads, chacun avec sa
+connexion d'un `happybase.ConnectionPool`. Chaque plage produit son résultat partiel, fusionné par l'appelant.
+`StreamScan` lit les plages de la même façon mais rend les lignes au fil de l'eau, par blocs, à travers une file
+bornée: les threads de scan attendent quand le consommateur est en retard (mémoire bornée). Il s'utilise dans un
+`with` (ou avec `close`), qui arrête les threads même si le consommateur s'est interrompu sur une erreur.
+"""
+
+# Configuration connexion
+host = '127.0.0.1'
+port = 9090
+table_name = 'fromagerie'
+column_family = 'data_fro'
+
+# Number of salt buckets (key prefixes '00|' to '15|')
+SALT_BUCKETS = 16
+KEY_SEPARATOR = '|'
+
+# Rollup tables (counters are 8-byte big-endian integers)
+years_table_name = 'fromagerie_orders_by_year'
+clients_table_name = 'fromagerie_clients'
+# Row of the clients rollup table holding the client with the largest total quantity (not a `codcli`)
+TOP_CLIENT_ROW = b'_top'
+rollup_family = 'r'
+
+# Meta table of the 'fromagerie' table (cell encoding, see cellcodec.py)
+meta_table_name = 'fromagerie_meta'
+meta_family = 'm'
+GENERATION_ROW = b'generation'
+
+# Change marker column: generation of the load that wrote the row
+CHANGE_COLUMN = '_gen'
+
+# Rows fetched per Thrift call by the scanners (scanner caching)
+SCAN_BATCH_SIZE = 5000
+
+# Threads (and pooled Thrift connections) of the parallel scans
+SCAN_WORKERS = 8
+
+# Filter returning only the key of each row (first cell, without its value)
+KEY_ONLY_FILTER = "FirstKeyOnlyFilter() AND KeyOnlyFilter()"
+
+
+def columns(*names):
+    """Qualified column names of the `data_fro` family, for the `columns=` argument of `table.scan`."""
+    return [('%s:%s' % (column_family, name)).encode('utf-8') for name in names]
+
+
+def rollup_column(name):
+    """Qualified column name of the rollup family."""
+    return ('%s:%s' % (rollup_family, name)).encode('utf-8')
+
+
+def pack_counter(value):
+    """HBase counter cell of an integer value."""
+    return struct.pack('>q', value)
+
+
+def unpack_counter(value):
+    """Integer value of an HBase counter cell."""
+    return struct.unpack('>q', value)[0]
+
+
+def single_column_value_filter(name, operator, comparator):
+    """
+    HBase filter string keeping the rows whose column `name` matches, e.g.
+    single_column_value_filter('villecli', '=', 'substring:NANTES'). Rows without the column are
+    dropped. The `substring:` comparator is case-insensitive. The column must be among the
+    scanned `columns`.
+    """
+    return "SingleColumnValueFilter('%s', '%s', %s, '%s', true, true)" % (
+        column_family, name, operator, comparator.replace("'", "''"))
+
+
+def map_unique(series, function):
+    """Apply `function` to each distinct value of `series` only once; return the list of results."""
+    codes, uniques = pd.factorize(series, use_na_sentinel=False)
+    results = [function(value) for value in uniques.tolist()]
+    return [results[code] for code in codes.tolist()]
+
+
+def salt_bucket(codcde):
+    """Salt bucket of an order code (text)."""
+    return zlib.crc32(codcde.encode('utf-8')) % SALT_BUCKETS
+
+
+def year_of(datcde):
+    """Year of a 'YYYY-MM-DD' date, or '0000' when it is missing."""
+    year = datcde[:4] if isinstance(datcde, str) else ''
+    return year if len(year) == 4 and year.isdigit() else '0000'
+
+
+def department_of(cpcli):
+    """Department (first 2 digits of the 5-digit postal code), or '00' when it is missing."""
+    if cpcli is None or cpcli != cpcli:
+        return '00'
+    text = str(cpcli)
+    if text.endswith('.0'):
+        text = text[:-2]
+    return text.zfill(5)[:2] if text.isdigit() else '00'
+
+
+def row_keys(df):
+    """
+    Row keys of a chunk of the CSV ('bucket|year|department|codcde|line'); the line number is
+    the index of the chunk.
+    """
+    orders = map_unique(df['codcde'], lambda value: '%02d' % salt_bucket(str(value)) + KEY_SEPARATOR + str(value))
+    years = map_unique(df['datcde'], year_of)
+    departments = map_unique(df['cpcli'], department_of)
+    return [KEY_SEPARATOR.join((order[:2], year, department, order[3:], str(line))).encode('utf-8')
+            for order, year, department, line in zip(orders, years, departments, df.index.tolist())]
+
+
+def key_prefix(bucket, *parts):
+    """Key prefix of a bucket followed by leading key parts, e.g. key_prefix(3, 2020, '44') == b'03|2020|44|'."""
+    return ('%02d' % bucket + ''.join(KEY_SEPARATOR + str(part) for part in parts) + KEY_SEPARATOR).encode('utf-8')
+
+
+def year_range_scans(year_start, year_stop):
+    """
+    (row_start, row_stop) of each bucket for the years `year_start` to `year_stop` included.
+    """
+    return [(key_prefix(bucket, year_start), key_prefix(bucket, year_stop + 1)) for bucket in range(SALT_BUCKETS)]
+
+
+def prefix_scans(*parts):
+    """Row prefix of each bucket for the leading key parts (e.g. year, department)."""
+    return [key_prefix(bucket, *parts) for bucket in range(SALT_BUCKETS)]
+
+
+
+def prefix_ranges(*parts):
+    """(row_start, row_stop) of each bucket for the leading key parts, the key ranges of `prefix_scans`."""
+    return [(prefix, prefix[:-1] + bytes([prefix[-1] + 1])) for prefix in prefix_scans(*parts)]
+
+
+def shards(table=None):
+    """
+    Key ranges of a parallel scan of the whole table: the regions of `table` when it has more
+    regions than salt buckets, else one range per salt bucket. None bounds are open.
+    """
+    if table is not None:
+        regions = table.regions()
+        if len(regions) > SALT_BUCKETS:
+            return [(region['start_key'] or None, region['end_key'] or None) for region in regions]
+    return [(key_prefix(bucket), key_prefix(bucket + 1)) for bucket in range(SALT_BUCKETS)]
+
+
+def parallel_scan(key_ranges, consume, workers=SCAN_WORKERS, pool=None, name=table_name, **scan_kwargs):
+    """
+    Scan the key ranges at the same time and return the result of `consume(rows)` for each range,
+    in the order of `key_ranges`.
+
+    Each range is scanned by a thread with its own connection of `pool` (by default a pool of
+    `workers` connections to `host`:`port`); `scan_kwargs` (columns, filter, ...) are passed to
+    every `table.scan`. `consume` builds the partial result of one range, and the caller merges them.
+    """
+    if pool is None:
+        pool = happybase.ConnectionPool(size=max(1, min(workers, len(key_ranges))), host=host, port=port)
+    scan_kwargs.setdefault('batch_size', SCAN_BATCH_SIZE)
+
+    def scan_range(key_range):
+        row_start, row_stop = key_range
+        with pool.connection() as connection:
+            return consume(connection.table(name).scan(row_start=row_start, row_stop=row_stop, **scan_kwargs))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(scan_range, key_ranges))
+
+
+def generation_stamp():
+    """New load-generation stamp (nanoseconds, 19 digits: the stamps sort as bytes)."""
+    return '%d' % time.time_ns()
+
+
+def new_generation(connection, stamp=None):
+    """Write a load-generation stamp (a new one by default) to the meta table; return it."""
+    stamp = stamp or generation_stamp()
+    connection.table(meta_table_name).put(GENERATION_ROW, {('%s:stamp' % meta_family).encode('utf-8'):
+                                                           stamp.encode('utf-8')})
+    return stamp
+
+
+def load_generation(connection):
+    """Load-generation stamp of the 'fromagerie' table, or None (table loaded without stamp)."""
+    if meta_table_name.encode('utf-8') not in connection.tables():
+        return None
+    for key, data in connection.table(meta_table_name).scan(row_prefix=GENERATION_ROW):
+        if key == GENERATION_ROW:
+            return data.get(('%s:stamp' % meta_family).encode('utf-8'), b'').decode('utf-8') or None
+    return None
+
+
+class StreamScan:
+    """
+    Parallel scan of the key ranges whose rows are yielded as they are read, by blocks of
+    `batch_size` (key, data) pairs, in no particular order.
+
+    The blocks go through a queue of `queue_size` blocks (2 per thread by default): the scan
+    threads wait when it is full, so memory stays bounded whatever the speed of the consumer.
+    The threads start with the iteration. Use the scan as a context manager (or call `close`):
+    leaving it stops the threads even when the consumer raised while the iterator is still
+    referenced, which a generator left open would not do.
+    """
+
+    def __init__(self, key_ranges, workers=SCAN_WORKERS, pool=None, queue_size=None, name=table_name, **scan_kwargs):
+        if pool is None:
+            pool = happybase.ConnectionPool(size=max(1, min(workers, len(key_ranges))), host=host, port=port)
+        scan_kwargs.setdefault('batch_size', SCAN_BATCH_SIZE)
+        self.key_ranges = key_ranges
+        self.workers = workers
+        self.pool = pool
+        self.name = name
+        self.scan_kwargs = scan_kwargs
+        self.blocks = queue.Queue(maxsize=queue_size or 2 * workers)
+        self.stop = threading.Event()
+        self.executor = None
+
+    def put(self, item):
+        while not self.stop.is_set():
+            try:
+                self.blocks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def scan_range(self, key_range):
+        row_start, row_stop = key_range
+        try:
+            with self.pool.connection() as connection:
+                rows = iter(connection.table(self.name).scan(row_start=row_start, row_stop=row_stop,
+                                                             **self.scan_kwargs))
+                while not self.stop.is_set():
+                    block = list(itertools.islice(rows, self.scan_kwargs['batch_size']))
+                    if not block:
+                        break
+                    self.put(block)
+        except Exception as e:
+            self.put(e)
+        self.put(None)
+
+    def __iter__(self):
+        if self.executor is not None:
+            raise RuntimeError("StreamScan can only be iterated once")
+        self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        for key_range in self.key_ranges:
+            self.executor.submit(self.scan_range, key_range)
+        try:
+            remaining = len(self.key_ranges)
+            while remaining:
+                item = self.blocks.get()
+                if item is None:
+                    remaining -= 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    yield item
+        finally:
+            self.close()
+
+    def close(self):
+        """Stop the scan threads and wait for them."""
+        self.stop.set()
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
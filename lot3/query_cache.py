@@ -0,0 +1,88 @@
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+
+"""
+Cache disque des résultats des requêtes du lot3.
+
+Un résultat est rangé sous une clé faite du nom de la question, de ses paramètres (ville, année, plage d'années) et
+de la génération du chargement de la table 'fromagerie' (`hbase_common.load_generation`), que `script_hbase.py`
+renouvelle à la fin de chaque chargement. Tant qu'aucun chargement n'a eu lieu, la même requête relit son résultat
+sur le disque (quelques millisecondes) au lieu de scanner HBase; après un chargement, les anciennes entrées ne sont
+plus jamais lues. Sans génération (table chargée avant cette version), le cache n'est pas utilisé.
+
+Stockage: un fichier pickle par entrée dans `cache_dir`, écrit de façon atomique. La taille totale est bornée à
+`max_bytes`: au-delà, les entrées les moins récemment utilisées (date de modification, mise à jour à chaque
+lecture) sont supprimées.
+"""
+
+# Cache directory and size bound
+cache_dir = os.path.join(os.path.expanduser('~'), '.cache', 'fromagerie_lot3')
+max_bytes = 64 * 1024 * 1024
+
+# Returned by `QueryCache.get` when the result is not cached (None is a valid result)
+MISSING = object()
+
+
+class QueryCache:
+    """Disk cache of query results, with size-bounded LRU eviction."""
+
+    def __init__(self, directory=cache_dir, max_bytes=max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def path(self, name, parameters, generation):
+        key = json.dumps([name, parameters, generation], sort_keys=True, default=str)
+        return os.path.join(self.directory, hashlib.sha256(key.encode('utf-8')).hexdigest() + '.pkl')
+
+    def get(self, name, parameters, generation):
+        """Cached result of the query, or `MISSING`."""
+        if generation is None:
+            return MISSING
+        path = self.path(name, parameters, generation)
+        try:
+            with open(path, 'rb') as f:
+                result = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return MISSING
+        # Mark the entry as recently used
+        os.utime(path)
+        return result
+
+    def put(self, name, parameters, generation, result):
+        """Store the result of the query, then evict the least recently used entries over `max_bytes`."""
+        if generation is None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        fd, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, self.path(name, parameters, generation))
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.pkl'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+def cached_result(cache, generation, aggregator, compute):
+    """Result of the aggregator's question from the cache, or from `compute()` (then cached)."""
+    result = cache.get(aggregator.name, aggregator.parameters(), generation)
+    if result is MISSING:
+        result = compute()
+        cache.put(aggregator.name, aggregator.parameters(), generation, result)
+    return result
@@ -0,0 +1,380 @@
+import abc
+import argparse
+import itertools
+import os
+from collections import defaultdict
+import happybase
+import matplotlib.pyplot as plt
+import pandas as pd
+from cellcodec import load_codec
+from hbase_common import (KEY_SEPARATOR, SCAN_BATCH_SIZE, SCAN_WORKERS, columns, host, load_generation,
+                          parallel_scan, port, shards, table_name)
+from query_cache import MISSING, QueryCache, cache_dir
+
+"""
+Moteur de requêtes du lot3: toutes les questions calculées à partir d'un seul scan de la table 'fromagerie'.
+
+Chaque question est un agrégateur (`Aggregator`) qui déclare les colonnes qu'il lit, le filtre de ses lignes
+(`accepts`), son état (`add`), son résultat (`result`) et son export (`export`). Le moteur lit une seule fois la
+table, avec l'union des colonnes des questions demandées, et donne chaque ligne aux agrégateurs qui l'acceptent:
+le coût du jeu de rapports complet est un scan, quel que soit le nombre de questions. Les cellules sont décodées
+par lots de `SCAN_BATCH_SIZE` lignes, colonne par colonne, avec l'encodage de la table (`cellcodec.py`): les
+agrégateurs reçoivent des valeurs typées (`{colonne: valeur}`).
+
+Le scan est découpé en plages de clés (buckets de sel ou régions, voir `hbase_common.shards`) lues en parallèle:
+chaque plage a ses propres agrégateurs (résultats partiels), fusionnés à la fin (`merge`) dans l'ordre des clés,
+ce qui donne le même résultat qu'un scan séquentiel.
+
+Les résultats sont mis en cache sur disque (`query_cache.py`) par question, paramètres et génération du chargement:
+les questions déjà calculées depuis le dernier chargement ne sont pas rescannées, et le scan n'a lieu que s'il
+reste des questions à calculer.
+
+Questions:
+- `best_order_nantes`: meilleure commande de Nantes en 2020 (quantité, puis timbre) -> `best_order_nantes.csv`.
+- `orders_by_year`: nombre de commandes par année de 2010 à 2015 -> `orders_by_year.pdf`.
+- `client_max_timbre`: client avec la plus grande quantité totale commandée -> `client_max_timbre.xlsx`.
+
+Les scripts `script_query1.py`, `script_query2.py` et `script_query3.py` utilisent les mêmes agrégateurs et
+exports pour une seule question, avec leur accès propre (plages de clés, tables d'agrégats).
+
+Usage:
+    python3 query_engine.py [--questions best_order_nantes orders_by_year] [--output-dir /datavolume1/results_lot3]
+                            [--workers 8] [--no-cache] [--cache-dir ~/.cache/fromagerie_lot3]
+"""
+
+# Output directory of the exports
+output_dir = '/datavolume1/results_lot3'
+
+
+class Aggregator(abc.ABC):
+    """
+    A question of the lot3 report: columns read, row filter, state, result and export.
+
+    A subclass that misses one of the abstract methods cannot be instantiated.
+    """
+
+    name = None
+    column_names = ()
+
+    def parameters(self):
+        """Parameters of the question (part of its cache key)."""
+        return {}
+
+    def accepts(self, key, values):
+        """Whether the row (decoded values of `column_names`) is used by this question."""
+        return True
+
+    @abc.abstractmethod
+    def add(self, key, values):
+        """Add an accepted row to the state."""
+
+    @abc.abstractmethod
+    def merge(self, other):
+        """Add the state of `other`, built from the rows that follow in key order."""
+
+    @abc.abstractmethod
+    def result(self):
+        """Result of the question, from the rows added so far."""
+
+    @abc.abstractmethod
+    def export(self, result, output_directory):
+        """Write the result to its export file and display it."""
+
+
+class BestOrderNantes(Aggregator):
+    """
+    Order of `city` in `year` with the largest total quantity, then the largest total timbre.
+
+    With `department`, only the rows of that department (row key) are used: callers that scan the key
+    prefixes of one department must say so, the result (and its cache entry) differs from a scan of every
+    department.
+    """
+
+    name = 'best_order_nantes'
+    column_names = ('codcde', 'qte', 'timbrecde', 'genrecli', 'nomcli', 'prenomcli', 'villecli', 'datcde')
+
+    def __init__(self, year=2020, city='NANTES', department=None):
+        self.year = str(year)
+        self.city = city
+        self.department = department
+        self.orders = {}
+
+    def parameters(self):
+        return {'year': self.year, 'city': self.city, 'department': self.department}
+
+    def accepts(self, key, values):
+        # Filter orders by department (row key), date and city
+        if self.department is not None and key.decode('utf-8').split(KEY_SEPARATOR)[2] != self.department:
+            return False
+        return self.year in values['datcde'] and self.city in values['villecli'].upper()
+
+    def add(self, key, values):
+        codecde = str(values['codcde'])
+        order = self.orders.get(codecde)
+        if order is None:
+            order = self.orders[codecde] = {
+                'qte': 0,
+                'timbrecde': 0.0,
+                'villecli': values['villecli'],
+                'datcde': values['datcde'],
+                'genrecli': values['genrecli'],
+                'nomcli': values['nomcli'],
+                'prenomcli': values['prenomcli']
+            }
+
+        # Accumulate quantity and timbre for each codecde
+        order['qte'] += values['qte']
+        order['timbrecde'] += values['timbrecde']
+
+    def merge(self, other):
+        for codecde, order in other.orders.items():
+            if codecde in self.orders:
+                self.orders[codecde]['qte'] += order['qte']
+                self.orders[codecde]['timbrecde'] += order['timbrecde']
+            else:
+                self.orders[codecde] = order
+
+    def result(self):
+        # Find the best order based on quantity and timbre
+        best_order = None
+        best_order_key = None
+        for codecde, order in self.orders.items():
+            if best_order is None or (
+                    order['qte'] > best_order['qte'] or (
+                    order['qte'] == best_order['qte'] and order['timbrecde'] > best_order['timbrecde'])):
+                best_order = order
+                best_order_key = codecde
+
+        if best_order is None:
+            return None
+        return {
+            'City': best_order['villecli'],
+            'Date': best_order['datcde'],
+            'Codecde': best_order_key,
+            'Quantity': best_order['qte'],
+            'Timbrecde': best_order['timbrecde'],
+            'Gender': best_order['genrecli'],
+            'LastName': best_order['nomcli'],
+            'FirstName': best_order['prenomcli']
+        }
+
+    def export(self, result, output_directory):
+        if result is None:
+            print("No orders found.")
+            return
+
+        # Save data to a CSV file
+        os.makedirs(output_directory, exist_ok=True)
+        file_path = os.path.join(output_directory, 'best_order_nantes.csv')
+        pd.DataFrame([result]).to_csv(file_path, index=False)
+        print("Best order saved to " + file_path)
+
+        # Display the result in the console
+        print("Best Order:")
+        print("Order Code: {}".format(result['Codecde']))
+        print("Quantity: {}".format(result['Quantity']))
+        print("Timbrecde: {}".format(result['Timbrecde']))
+        print("Last Name: {}".format(result['LastName']))
+        print("First Name: {}".format(result['FirstName']))
+
+
+class OrdersByYear(Aggregator):
+    """Number of order lines per year, from `year_start` to `year_stop` included."""
+
+    name = 'orders_by_year'
+    column_names = ('datcde',)
+
+    def __init__(self, year_start=2010, year_stop=2015):
+        self.year_start = year_start
+        self.year_stop = year_stop
+        self.orders_per_year = {year: 0 for year in range(year_start, year_stop + 1)}
+
+    def parameters(self):
+        return {'year_start': self.year_start, 'year_stop': self.year_stop}
+
+    def add(self, key, values):
+        # Year of datcde, or of the row key when the scan returns keys only
+        date_str = values['datcde']
+        year_str = date_str.split('-')[0] if date_str else key.decode('utf-8').split(KEY_SEPARATOR)[1]
+        if year_str.isdigit() and self.year_start <= int(year_str) <= self.year_stop:
+            self.orders_per_year[int(year_str)] += 1
+
+    def merge(self, other):
+        for year, count in other.orders_per_year.items():
+            self.orders_per_year[year] += count
+
+    def result(self):
+        return dict(self.orders_per_year)
+
+    def export(self, result, output_directory):
+        # Display results in ascending order
+        print("\nTotal number of orders between {} and {}:".format(self.year_start, self.year_stop))
+        for year in sorted(result.keys()):
+            print("{}: {} orders".format(year, result[year]))
+
+        # Create a bar plot
+        years = list(result.keys())
+        counts = list(result.values())
+
+        plt.figure(figsize=(10, 6))
+        plt.bar(years, counts, color='blue')
+        plt.xlabel('Year')
+        plt.ylabel('Number of Orders')
+        plt.title('Total Number of Orders by Year ({}-{})'.format(self.year_start, self.year_stop))
+        plt.xticks(years)
+        plt.grid(axis='y')
+
+        # Save the plot as a PDF in the output directory
+        os.makedirs(output_directory, exist_ok=True)
+        pdf_path = os.path.join(output_directory, 'orders_by_year.pdf')
+        plt.savefig(pdf_path)
+        plt.close()
+        print("PDF saved at: " + pdf_path)
+
+
+class ClientMaxTimbre(Aggregator):
+    """Client with the largest total quantity, with its number of order lines, name and first name."""
+
+    name = 'client_max_timbre'
+    column_names = ('codcli', 'qte', 'timbrecli', 'nomcli', 'prenomcli')
+
+    def __init__(self):
+        self.clients_data = defaultdict(lambda: {'count': 0, 'total_qty': 0, 'nom': '', 'prenom': ''})
+
+    def add(self, key, values):
+        client = self.clients_data[values['codcli']]
+        client['count'] += 1
+        client['total_qty'] += values['qte']
+        client['nom'] = values['nomcli']
+        client['prenom'] = values['prenomcli']
+
+    def merge(self, other):
+        for client_id, other_client in other.clients_data.items():
+            client = self.clients_data[client_id]
+            client['count'] += other_client['count']
+            client['total_qty'] += other_client['total_qty']
+            client['nom'] = other_client['nom']
+            client['prenom'] = other_client['prenom']
+
+    def result(self):
+        if not self.clients_data:
+            return None
+        return dict(max(self.clients_data.values(), key=lambda client: client['total_qty']))
+
+    def export(self, result, output_directory):
+        print("\nClient with the highest postage fees:")
+        if result is None:
+            print("No client found.")
+            return
+        print(result)
+
+        # Export results to an Excel file
+        os.makedirs(output_directory, exist_ok=True)
+        file_path = os.path.join(output_directory, 'client_max_timbre.xlsx')
+        pd.DataFrame([result]).to_excel(file_path, index=False)
+        print("Results exported to " + file_path)
+
+
+# Registered questions, by name
+QUESTIONS = {aggregator.name: aggregator for aggregator in (BestOrderNantes, OrdersByYear, ClientMaxTimbre)}
+
+
+def column_names(aggregators):
+    """Union of the columns read by the aggregators."""
+    return sorted({name for aggregator in aggregators for name in aggregator.column_names})
+
+
+def feed(aggregators, rows, codec):
+    """
+    Decode the rows with `codec`, `SCAN_BATCH_SIZE` rows at a time, and feed every row to the
+    aggregators that accept it; return the aggregators.
+    """
+    names = column_names(aggregators)
+    rows = iter(rows)
+    while True:
+        block = list(itertools.islice(rows, SCAN_BATCH_SIZE))
+        if not block:
+            return aggregators
+        for (key, data), values in zip(block, codec.decode_rows([data for key, data in block], names)):
+            for aggregator in aggregators:
+                if aggregator.accepts(key, values):
+                    aggregator.add(key, values)
+
+
+def run(aggregators, rows, codec):
+    """
+    Feed every row to the aggregators that accept it.
+
+    Returns:
+    - dict: result of each aggregator, by name.
+    """
+    return {aggregator.name: aggregator.result() for aggregator in feed(aggregators, rows, codec)}
+
+
+def run_parallel(make_aggregators, key_ranges, codec, workers=SCAN_WORKERS, **scan_kwargs):
+    """
+    Scan the key ranges in parallel, with new aggregators (`make_aggregators()`) for each range,
+    and merge the partial aggregators in key order.
+
+    Returns:
+    - dict: result of each aggregator, by name.
+    """
+    partials = parallel_scan(key_ranges, lambda rows: feed(make_aggregators(), rows, codec), workers=workers,
+                             **scan_kwargs)
+    aggregators = partials[0]
+    for partial in partials[1:]:
+        for aggregator, other in zip(aggregators, partial):
+            aggregator.merge(other)
+    return {aggregator.name: aggregator.result() for aggregator in aggregators}
+
+
+def scan_columns(aggregators):
+    """Qualified columns read by the aggregators."""
+    return columns(*column_names(aggregators))
+
+
+def shared_scan(table, aggregators):
+    """Single sequential scan of the table with the columns of all the aggregators."""
+    return table.scan(columns=scan_columns(aggregators), batch_size=SCAN_BATCH_SIZE)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rapports du lot3 en un seul scan de la table 'fromagerie'.")
+    parser.add_argument('--questions', nargs='+', choices=sorted(QUESTIONS), default=list(QUESTIONS),
+                        help="questions à calculer (toutes par défaut)")
+    parser.add_argument('--output-dir', default=output_dir)
+    parser.add_argument('--workers', type=int, default=SCAN_WORKERS, help="plages de clés lues en parallèle")
+    parser.add_argument('--no-cache', action='store_true', help="recalculer sans lire le cache des résultats")
+    parser.add_argument('--cache-dir', default=cache_dir)
+    args = parser.parse_args()
+
+    connection = happybase.Connection(host, port=port)
+    generation = load_generation(connection)
+    cache = QueryCache(args.cache_dir)
+    aggregators = [QUESTIONS[name]() for name in args.questions]
+    results = {} if args.no_cache else {aggregator.name: cache.get(aggregator.name, aggregator.parameters(), generation)
+                                        for aggregator in aggregators}
+    missing = [aggregator.name for aggregator in aggregators if results.get(aggregator.name, MISSING) is MISSING]
+
+    # One scan for the questions not cached since the last load
+    if missing:
+        key_ranges = shards(connection.table(table_name))
+        codec = load_codec(connection)
+
+        def make_aggregators():
+            return [QUESTIONS[name]() for name in missing]
+
+        computed = run_parallel(make_aggregators, key_ranges, codec, workers=args.workers,
+                                columns=scan_columns(make_aggregators()))
+        for aggregator in aggregators:
+            if aggregator.name in computed:
+                results[aggregator.name] = computed[aggregator.name]
+                cache.put(aggregator.name, aggregator.parameters(), generation, computed[aggregator.name])
+    connection.close()
+
+    for aggregator in aggregators:
+        aggregator.export(results[aggregator.name], args.output_dir)
+
+
+if __name__ == "__main__":
+    main()
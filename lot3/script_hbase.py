@@ -1,76 +1,414 @@
+import argparse
+import concurrent.futures
+import time
 import happybase
 import pandas as pd
+from cellcodec import DICTIONARY_COLUMNS, CellCodec, load_codec
+from hbase_common import (CHANGE_COLUMN, SCAN_BATCH_SIZE, TOP_CLIENT_ROW, clients_table_name, column_family, columns,
+                          generation_stamp, host, map_unique, meta_family, meta_table_name, new_generation,
+                          pack_counter, port, rollup_column, rollup_family, row_keys, table_name, unpack_counter,
+                          year_of, years_table_name)
 """
 Script de connexion à HBase et insertion de données d'un fichier CSV dans une table HBase.
 
 Ce script se connecte à une instance HBase, crée une table pour stocker les données de fromagerie, puis insère
-les données ligne par ligne depuis un fichier CSV spécifié. La table est recréée si elle existe déjà.
+les données depuis un fichier CSV spécifié, par lots et en parallèle. La table est recréée si elle existe déjà.
 
 Configuration:
-- `host` (str): Adresse IP du serveur HBase.
-- `port` (int): Port du serveur HBase.
+- `host` (str), `port` (int): Adresse IP et port du serveur HBase (voir `hbase_common.py`).
 - `input_file` (str): Chemin du fichier CSV d'entrée à charger.
+- `chunksize` (int): Nombre de lignes du CSV lues et encodées à la fois.
+- `batch_size` (int): Nombre de lignes envoyées par mutation groupée (`table.batch`).
+- `workers` (int): Nombre de threads d'écriture, chacun avec sa connexion du `happybase.ConnectionPool`.
 
 Fonctionnalités:
 - Se connecte à HBase avec Happybase.
-- Vérifie si la table 'fromagerie' existe et la recrée si elle est présente.
-- Charge le fichier CSV en mémoire avec Pandas et encode chaque ligne en UTF-8.
-- Pour chaque ligne du DataFrame, insère les données dans HBase, avec gestion des erreurs de décodage UTF-8.
+- Vérifie si la table 'fromagerie' existe et la recrée si elle est présente (sauf avec `--keep-table`, pour
+  charger dans une table pré-découpée sur les buckets de sel).
+- Lit le fichier CSV par morceaux avec Pandas et encode les valeurs colonne par colonne avec l'encodage typé de
+  `cellcodec.py` (chaque valeur distincte d'une colonne n'est encodée qu'une fois); le schéma et les dictionnaires
+  sont écrits dans la table `fromagerie_meta`.
+- Envoie les lignes par lots de `batch_size` mutations, répartis entre `workers` threads d'écriture.
+- Affiche la progression en lignes/seconde, puis la liste des lignes en échec à la fin du chargement.
+- Tient à jour les tables d'agrégats `fromagerie_orders_by_year` et `fromagerie_clients` (voir `hbase_common.py`):
+  les agrégats de chaque morceau sont cumulés en mémoire (une entrée par année et par client), puis ajoutés en fin
+  de chargement avec des compteurs atomiques (`counter_inc`) et des `put` groupés pour les noms. La ligne `_top`
+  de `fromagerie_clients` (client de plus grande quantité totale) est mise à jour à partir des totaux rendus par
+  les compteurs.
+- Marque chaque ligne écrite avec la génération du chargement (colonne `data_fro:_gen`), puis l'écrit à la fin du
+  chargement dans `fromagerie_meta` (`hbase_common.new_generation`): les résultats mis en cache par les requêtes
+  (`query_cache.py`) pour les générations précédentes ne sont plus lus, et la synchronisation Elasticsearch du
+  lot4 ne relit que les lignes de générations plus récentes que la sienne.
+- `--rebuild-rollups` recrée les tables d'agrégats à partir d'un scan de la table 'fromagerie' (rattrapage après
+  un chargement fait sans agrégats, ou après un rechargement de lignes déjà présentes avec `--keep-table`).
+
+Clés de ligne:
+- `bucket|année|département|codcde|ligne` (voir `hbase_common.py`): les écritures sont réparties entre les
+  buckets de sel, et les requêtes lisent des plages de clés au lieu de toute la table.
 
 Détails des colonnes:
-- Les colonnes de données sont préfixées par la famille de colonnes `data_fro:` et encodées en UTF-8.
-- En cas d'erreur d'encodage, les valeurs sont remplacées par `ENCODING_ERROR`.
+- Les colonnes de données sont préfixées par la famille de colonnes `data_fro:`.
+- Les valeurs sont encodées selon les types du lot0 (entiers et réels big-endian, booléens sur un octet, textes en
+  UTF-8 ou par dictionnaire, voir `cellcodec.py`); avec `--text`, elles sont encodées en UTF-8 (`str(valeur)`).
+- Les caractères qui ne peuvent pas être encodés sont remplacés (`errors='replace'`).
 
+Usage:
+    python3 script_hbase.py [--input dataw_fro03_final.csv] [--workers 4] [--batch-size 1000]
+                            [--text | --dictionary libobj libcondit]
+    python3 script_hbase.py --rebuild-rollups
 """
 
 # Configuration connexion
-host = '127.0.0.1'
-port = 9090
 input_file = 'dataw_fro03_final.csv'
 
-# Connexion HBase 
-try:
+# Configuration chargement
+chunksize = 100000
+batch_size = 1000
+workers = 4
+
+
+def encode_rows(df, codec, generation):
+    """
+    Encode a chunk of the CSV into (row key, {column: value}) pairs, column by column, with the
+    cell codec of the table; every row is marked with the load `generation`.
+
+    Row keys are salted composite keys built by `hbase_common.row_keys`.
+    """
+    columns = [(column_family + ':' + column).encode('utf-8') for column in df.columns]
+    values = [codec.encode_column(column, df[column]) for column in df.columns]
+    columns.append((column_family + ':' + CHANGE_COLUMN).encode('utf-8'))
+    values.append([generation.encode('utf-8')] * len(df))
+    keys = row_keys(df)
+    return [(key, dict(zip(columns, row))) for key, row in zip(keys, zip(*values))]
+
+
+class Rollups:
+    """
+    Per-year row counts and per-client totals of the loaded rows, added to the rollup tables by `flush`.
+
+    Memory holds one entry per year and per client, whatever the number of rows.
+    """
+
+    def __init__(self):
+        self.years = {}
+        self.clients = {}
+
+    def add_chunk(self, df):
+        """Add the rows of a chunk of the CSV (or of scanned rows with the same columns)."""
+        years = pd.Series(map_unique(df['datcde'], year_of), index=df.index)
+        for year, count in years.value_counts().items():
+            self.years[year] = self.years.get(year, 0) + int(count)
+
+        clients = pd.DataFrame({
+            'codcli': map_unique(df['codcli'], str),
+            'qte': pd.to_numeric(df['qte'], errors='coerce').fillna(0).astype('int64'),
+            'cents': (pd.to_numeric(df['timbrecli'], errors='coerce').fillna(0) * 100).round().astype('int64'),
+            'nomcli': map_unique(df['nomcli'], str),
+            'prenomcli': map_unique(df['prenomcli'], str),
+        }, index=df.index)
+        grouped = clients.groupby('codcli', sort=False).agg(
+            count=('qte', 'size'), qte=('qte', 'sum'), cents=('cents', 'sum'),
+            nomcli=('nomcli', 'last'), prenomcli=('prenomcli', 'last'))
+        for codcli, count, qte, cents, nomcli, prenomcli in grouped.itertuples():
+            total = self.clients.get(codcli)
+            if total is None:
+                self.clients[codcli] = [int(count), int(qte), int(cents), nomcli, prenomcli]
+            else:
+                total[0] += int(count)
+                total[1] += int(qte)
+                total[2] += int(cents)
+                total[3], total[4] = nomcli, prenomcli
+
+    def flush(self, pool, workers=workers, batch_size=batch_size):
+        """
+        Add the totals to the rollup tables with atomic counters, then empty them.
+
+        The counters return the new totals of the flushed clients, so the top client row is
+        updated from them without reading the other clients: a client that was not flushed kept
+        its total, which is not larger than the previous top.
+
+        Returns:
+        - list of (row key, error) of the rollup rows that could not be written.
+        """
+        def write_years(items):
+            with pool.connection() as connection:
+                table = connection.table(years_table_name)
+                for year, count in items:
+                    table.counter_inc(year.encode('utf-8'), rollup_column('orders'), count)
+
+        def write_clients(items):
+            top = None
+            with pool.connection() as connection:
+                table = connection.table(clients_table_name)
+                with table.batch(batch_size=batch_size) as batch:
+                    for codcli, (count, qte, cents, nomcli, prenomcli) in items:
+                        batch.put(codcli.encode('utf-8'), {rollup_column('nom'): nomcli.encode('utf-8', errors='replace'),
+                                                           rollup_column('prenom'): prenomcli.encode('utf-8', errors='replace')})
+                for codcli, (count, qte, cents, nomcli, prenomcli) in items:
+                    key = codcli.encode('utf-8')
+                    count = table.counter_inc(key, rollup_column('count'), count)
+                    qte = table.counter_inc(key, rollup_column('total_qty'), qte)
+                    table.counter_inc(key, rollup_column('timbre_cents'), cents)
+                    if top is None or qte > top[2]:
+                        top = (codcli, count, qte, nomcli, prenomcli)
+            return top
+
+        tasks = [(write_years, years_table_name, list(self.years.items()))]
+        clients = list(self.clients.items())
+        tasks += [(write_clients, clients_table_name, clients[i:i + batch_size])
+                  for i in range(0, len(clients), batch_size)]
+
+        failed = []
+        top = None
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(function, items): (name, items) for function, name, items in tasks}
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    name, items = futures[future]
+                    failed.extend(('%s:%s' % (name, key), str(e)) for key, _ in items)
+                else:
+                    if result is not None and (top is None or result[2] > top[2]):
+                        top = result
+        if top is not None:
+            try:
+                write_top_client(pool, top)
+            except Exception as e:
+                failed.append(('%s:%s' % (clients_table_name, TOP_CLIENT_ROW.decode()), str(e)))
+        self.years.clear()
+        self.clients.clear()
+        return failed
+
+
+def write_top_client(pool, top):
+    """
+    Replace the top client row of the clients rollup table by `top` (codcli, count, total
+    quantity, name, first name) if its total is larger, or if it is the same client.
+    """
+    codcli, count, qte, nomcli, prenomcli = top
+    with pool.connection() as connection:
+        table = connection.table(clients_table_name)
+        current = table.row(TOP_CLIENT_ROW)
+        if (current and current[rollup_column('codcli')].decode() != codcli
+                and unpack_counter(current[rollup_column('total_qty')]) >= qte):
+            return
+        table.put(TOP_CLIENT_ROW, {
+            rollup_column('codcli'): codcli.encode('utf-8'),
+            rollup_column('count'): pack_counter(count),
+            rollup_column('total_qty'): pack_counter(qte),
+            rollup_column('nom'): nomcli.encode('utf-8', errors='replace'),
+            rollup_column('prenom'): prenomcli.encode('utf-8', errors='replace'),
+        })
+
+
+def write_rows(pool, rows, batch_size):
+    """
+    Write rows to the table with batched mutations, on a connection of the pool.
+
+    If the batch fails, the rows are written again one by one to find the rows in error.
+
+    Returns:
+    - tuple: (number of rows, list of (row key, error) of the rows that could not be written)
+    """
+    try:
+        with pool.connection() as connection:
+            with connection.table(table_name).batch(batch_size=batch_size) as batch:
+                for key, data in rows:
+                    batch.put(key, data)
+        return len(rows), []
+    except Exception:
+        pass
+
+    failed = []
+    try:
+        with pool.connection() as connection:
+            table = connection.table(table_name)
+            for key, data in rows:
+                try:
+                    table.put(key, data)
+                except Exception as e:
+                    failed.append((key.decode('utf-8'), str(e)))
+    except Exception as e:
+        # Connection lost: every row not reported yet is in error
+        reported = {key for key, _ in failed}
+        failed.extend((key.decode('utf-8'), str(e)) for key, _ in rows if key.decode('utf-8') not in reported)
+    return len(rows), failed
+
+
+def create_table(connection, keep_table=False):
+    """
+    Create the 'fromagerie' table, its meta table and the rollup tables, dropping them first if
+    they exist (unless `keep_table`: existing tables are kept and the missing ones are created).
+    """
+    tables = connection.tables()
+    for name, family in ((table_name, column_family), (meta_table_name, meta_family),
+                         (years_table_name, rollup_family), (clients_table_name, rollup_family)):
+        # Verif if exist table
+        if name.encode('utf-8') in tables:
+            if keep_table:
+                print("La table %s existe, chargement dans la table existante." % name)
+                continue
+            print("La table %s existe. Suppression en cours..." % name)
+            connection.delete_table(name, disable=True)
+
+        # Create table with col family
+        connection.create_table(
+            name,
+            {family: dict()}
+        )
+        print("La table est creer: ", name)
+
+
+def rebuild_rollups(host, port, workers=workers, batch_size=batch_size, chunksize=chunksize):
+    """
+    Recreate the rollup tables from a scan of the 'fromagerie' table.
+
+    Returns:
+    - list of (row key, error) of the rollup rows that could not be written.
+    """
     connection = happybase.Connection(host, port)
     connection.open()
-    print("Connexion HBase reussie!")
+    codec = load_codec(connection)
+    tables = connection.tables()
+    for name in (years_table_name, clients_table_name):
+        if name.encode('utf-8') in tables:
+            connection.delete_table(name, disable=True)
+        connection.create_table(name, {rollup_family: dict()})
 
-    df = pd.read_csv(input_file, encoding='utf-8')
-    print("Initial number of rows:", len(df))
+    names = ['datcde', 'codcli', 'qte', 'timbrecli', 'nomcli', 'prenomcli']
+    scan_columns = columns(*names)
+    rollups = Rollups()
+    rows = []
+    start = time.perf_counter()
+    for key, data in connection.table(table_name).scan(columns=scan_columns, batch_size=SCAN_BATCH_SIZE):
+        rows.append(data)
+        if len(rows) >= chunksize:
+            rollups.add_chunk(pd.DataFrame(codec.decode_rows(rows, names), columns=names))
+            rows = []
+    if rows:
+        rollups.add_chunk(pd.DataFrame(codec.decode_rows(rows, names), columns=names))
+    print("%d annees et %d clients agreges en %.1f s" % (len(rollups.years), len(rollups.clients),
+                                                       time.perf_counter() - start))
 
-    # Verif if exist table
-    if b'fromagerie' in connection.tables():
-        print("La table existe. Suppression en cours...")
-        connection.delete_table('fromagerie', disable=True)
+    pool = happybase.ConnectionPool(size=workers, host=host, port=port)
+    failed = rollups.flush(pool, workers=workers, batch_size=batch_size)
 
-    # Create table with col family 
-    connection.create_table(
-        'fromagerie',
-        {'data_fro': dict()}
-    )
-    table = connection.table('fromagerie')
-    print("La table est creer: ", table)
+    # New rollups: the cached query results are out of date
+    new_generation(connection)
+    connection.close()
+    return failed
 
-    # Insert with error handling
-    for index, row in df.iterrows():
-        key = str(index)
 
-        data = {}
-        for col, value in row.items():
-            try:
-                encoded_value = str(value).encode('utf-8', errors='replace')
-            except UnicodeEncodeError:
-                encoded_value = b'ENCODING_ERROR'
-            data[b'data_fro:' + col.encode('utf-8')] = encoded_value
+def load_csv(input_file, host, port, chunksize=chunksize, batch_size=batch_size, workers=workers, keep_table=False,
+             text=False, dictionary_columns=DICTIONARY_COLUMNS):
+    """
+    Load a CSV file into the 'fromagerie' table with `workers` parallel writers.
+
+    The CSV is read `chunksize` rows at a time; each chunk is encoded, cut into batches of
+    `batch_size` rows and handed to the writer threads. At most `2 * workers` batches wait in
+    the queue, so memory stays bounded by a few chunks.
+
+    Cells use the typed binary encoding (UTF-8 text with `text`); with `keep_table`, the codec of
+    the existing table is kept. The new dictionary values of each chunk are written to the meta
+    table before its rows.
+
+    Returns:
+    - tuple: (number of rows read, list of (row key, error) of the failed rows)
+    """
+    connection = happybase.Connection(host, port)
+    connection.open()
+    print("Connexion HBase reussie!")
+    create_table(connection, keep_table=keep_table)
+    codec = load_codec(connection, default=None) if keep_table else None
+    if codec is None:
+        codec = CellCodec.from_dtypes(binary=not text, dictionary_columns=dictionary_columns)
+    meta = connection.table(meta_table_name)
+    codec.save(meta)
+
+    pool = happybase.ConnectionPool(size=workers, host=host, port=port)
+    rollups = Rollups()
+    generation = generation_stamp()
+    rows_read = 0
+    rows_done = 0
+    failed = []
+    start = time.perf_counter()
+
+    def collect(futures):
+        nonlocal rows_done
+        for future in futures:
+            count, errors = future.result()
+            rows_done += count
+            failed.extend(errors)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        for chunk in pd.read_csv(input_file, encoding='utf-8', chunksize=chunksize):
+            rows = encode_rows(chunk, codec, generation)
+            codec.save(meta)
+            rows_read += len(rows)
+            rollups.add_chunk(chunk)
+            for i in range(0, len(rows), batch_size):
+                pending.add(executor.submit(write_rows, pool, rows[i:i + batch_size], batch_size))
+                if len(pending) >= 2 * workers:
+                    done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                    collect(done)
 
-        try:
-            table.put(key.encode('utf-8'), data)
-        except Exception as e:
-            print("Error inserting row", {index}, ":", {e})
+            elapsed = time.perf_counter() - start
+            written = rows_done - len(failed)
+            print("%d lignes lues, %d ecrites (%.0f lignes/s)" % (rows_read, written, written / elapsed))
+        collect(concurrent.futures.as_completed(pending))
 
-    print("Donnees inserees dans HBase avec succes.")
+    # Rollup tables: one counter increment per year and per client total
+    failed.extend(rollups.flush(pool, workers=workers, batch_size=batch_size))
 
-    # Close connection
+    # New load generation: the cached query results are out of date
+    new_generation(connection, generation)
     connection.close()
 
-except Exception as e:
-    print("Erreur de connexion HBase :", e)
\ No newline at end of file
+    elapsed = time.perf_counter() - start
+    print("Initial number of rows:", rows_read)
+    print("%d lignes chargees en %.1f s (%.0f lignes/s)" % (rows_done - len(failed), elapsed,
+                                                          (rows_done - len(failed)) / elapsed))
+    return rows_read, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chargement d'un fichier CSV dans la table HBase 'fromagerie'.")
+    parser.add_argument('--input', default=input_file, help="fichier CSV à charger")
+    parser.add_argument('--host', default=host)
+    parser.add_argument('--port', type=int, default=port)
+    parser.add_argument('--chunksize', type=int, default=chunksize, help="lignes lues et encodées à la fois")
+    parser.add_argument('--batch-size', type=int, default=batch_size, help="lignes par mutation groupée")
+    parser.add_argument('--workers', type=int, default=workers, help="threads d'écriture (connexions HBase)")
+    parser.add_argument('--keep-table', action='store_true', help="charger dans la table existante (pré-découpée)")
+    parser.add_argument('--text', action='store_true', help="cellules en texte UTF-8 au lieu de l'encodage typé")
+    parser.add_argument('--dictionary', nargs='*', default=list(DICTIONARY_COLUMNS),
+                        help="colonnes texte codées par dictionnaire")
+    parser.add_argument('--rebuild-rollups', action='store_true',
+                        help="recréer les tables d'agrégats à partir de la table 'fromagerie', sans chargement")
+    args = parser.parse_args()
+
+    # Connexion HBase
+    try:
+        if args.rebuild_rollups:
+            failed = rebuild_rollups(args.host, args.port, workers=args.workers, batch_size=args.batch_size,
+                                     chunksize=args.chunksize)
+        else:
+            rows_read, failed = load_csv(args.input, args.host, args.port, chunksize=args.chunksize,
+                                         batch_size=args.batch_size, workers=args.workers, keep_table=args.keep_table,
+                                         text=args.text, dictionary_columns=args.dictionary)
+    except Exception as e:
+        print("Erreur de connexion HBase :", e)
+        return
+
+    if failed:
+        print("%d lignes en echec :" % len(failed))
+        for key, error in failed:
+            print("  ligne %s : %s" % (key, error))
+    else:
+        print("Donnees inserees dans HBase avec succes.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,8 @@
 import happybase
-import pandas as pd
-import os
-import csv
+from cellcodec import load_codec
+from hbase_common import columns, host, load_generation, port, prefix_ranges, single_column_value_filter
+from query_cache import QueryCache, cached_result
+from query_engine import BestOrderNantes, output_dir, run_parallel
 
 """
 Script de récupération et de traitement des données dans la table HBase 'fromagerie'.
@@ -12,10 +13,21 @@ et en cas d'égalité, celle avec le plus grand timbre. Les résultats sont enre
 
 Fonctionnalités:
 - Connexion à HBase et accès à la table 'fromagerie'.
-- Filtrage des commandes par date (2020) et ville (Nantes).
+- Lecture, dans chaque bucket de sel, de la seule plage de clés `bucket|2020|` (année 2020) au lieu d'un scan
+  complet de la table (voir `hbase_common.py`); les 16 plages sont lues en parallèle. Tous les départements sont
+  lus: le filtre sur la ville retient aussi les villes hors de Loire-Atlantique dont le nom contient 'NANTES'.
+- Filtrage des commandes par date (2020, plage de clés) et ville (Nantes), avec lecture des seules colonnes
+  utilisées par la requête. Le filtre sur la ville n'est évalué côté serveur (`SingleColumnValueFilter`,
+  comparateur `substring:`) que si `villecli` est stockée en texte, ce qui est le cas par défaut (voir
+  `cellcodec.DICTIONARY_COLUMNS`); une table chargée avec `--dictionary villecli` est lue sur toute l'année et
+  la ville est filtrée par l'agrégateur.
 - Agrégation des quantités et des timbres pour chaque commande (`codecde`).
 - Sélection de la meilleure commande selon la quantité, puis le timbre en cas d'égalité.
 - Export des informations sur la meilleure commande dans un fichier CSV.
+- Résultat mis en cache sur disque (`query_cache.py`) jusqu'au prochain chargement de la table: une requête
+  répétée sans nouveau chargement ne scanne pas HBase.
+- Filtre, agrégation et export sont ceux de l'agrégateur `BestOrderNantes` de `query_engine.py`, qui calcule aussi
+  cette question dans le scan partagé de toutes les questions du lot3.
 
 Configuration:
 - Hôte: `localhost`
@@ -38,87 +50,40 @@ Gestion des erreurs:
 
 """
 
-# Connect to the 'fromagerie' table in HBase to access data
-connection = happybase.Connection('localhost', port=9090)
-table = connection.table('fromagerie')  
-
-# Initialize variables to store order information by codecde
-data_fro = {}
-
-# Scan the table for all rows related to orders
-for key, data in table.scan():
-    codecde = data.get(b'data_fro:codcde', b'').decode('utf-8')
-    qte = int(data.get(b'data_fro:qte', b'0').decode('utf-8'))
-    timbrecde = float(data.get(b'data_fro:timbrecde', b'0.0').decode('utf-8'))
-    genrecli = data.get(b'data_fro:genrecli', b'').decode('utf-8')
-    nomcli = data.get(b'data_fro:nomcli', b'').decode('utf-8')
-    prenomcli = data.get(b'data_fro:prenomcli', b'').decode('utf-8')
-    villecli = data.get(b'data_fro:villecli', b'').decode('utf-8')
-    datcde = data.get(b'data_fro:datcde', b'').decode('utf-8')
-
-
-
-    # Filter orders by date (2020) and city (Nantes)
-    if '2020' in datcde and 'NANTES' in villecli.upper():
-        print("Order matches criteria for 2020 and Nantes")
-        
-        if codecde not in data_fro:
-            data_fro[codecde] = {
-                'qte': 0,
-                'timbrecde': 0.0,
-                'villecli': villecli,
-                'datcde': datcde,
-                'genrecli': genrecli,
-                'nomcli': nomcli,
-                'prenomcli': prenomcli
-            }
-
-        # Accumulate quantity and timbre for each codecde
-        data_fro[codecde]['qte'] += qte
-        data_fro[codecde]['timbrecde'] += timbrecde
-
-# Find the best order based on quantity and timbre
-best_order = None
-best_order_key = None
-
-for codecde, order in data_fro.items():
-    if best_order is None or (
-            order['qte'] > best_order['qte'] or (
-            order['qte'] == best_order['qte'] and order['timbrecde'] > best_order['timbrecde']
-    )):
-        best_order = order
-        best_order_key = codecde
-
-# Prepare data for CSV export if a best order is found
-if best_order:
-    result = {
-        'City': best_order['villecli'],
-        'Date': best_order['datcde'],
-        'Codecde': best_order_key,
-        'Quantity': best_order['qte'],
-        'Timbrecde': best_order['timbrecde'],
-        'Gender': best_order['genrecli'],
-        'LastName': best_order['nomcli'],
-        'FirstName': best_order['prenomcli']
-    }
-    df = pd.DataFrame([result])
-
-    # Save path for the CSV file
-    output_dir = '/datavolume1/results_lot3'
-    os.makedirs(output_dir, exist_ok=True)  
-
-    # Save data to a CSV file
-    df.to_csv(os.path.join(output_dir, 'best_order_nantes.csv'), index=False)
-    print("Best order saved to /datavolume1/results_lot3/best_order_nantes.csv")
-
-    # Display the result in the console
-    print("Best Order:")
-    print("Order Code: {}".format(result['Codecde']))
-    print("Quantity: {}".format(result['Quantity']))
-    print("Timbrecde: {}".format(result['Timbrecde']))
-    print("Last Name: {}".format(result['LastName']))
-    print("First Name: {}".format(result['FirstName']))
-
-  
-else:
-    print("No orders found.")
+# Year and city of the query
+year = 2020
+city = 'NANTES'
+# Department of the query: None reads every department; '44' reads only the key prefixes of
+# Loire-Atlantique (faster, but cities of other departments matching 'NANTES' are left out)
+department = None
+
+# Connect to HBase, for the load generation and the cell encoding of the 'fromagerie' table
+connection = happybase.Connection(host, port=port)
+
+# Question of the shared query engine, with its filter, state and CSV export
+best_order_nantes = BestOrderNantes(year=year, city=city, department=department)
+
+# Columns read by the query, and city filter evaluated by the region servers when villecli is text
+# (the default); dictionary-encoded cities are numbers the substring comparator cannot match, the
+# aggregator filters them instead
+codec = load_codec(connection)
+scan_columns = columns(*best_order_nantes.column_names)
+scan_filter = None
+if codec.is_text('villecli'):
+    scan_filter = single_column_value_filter('villecli', '=', 'substring:' + city)
+
+
+
+def best_order():
+    # Scan the key range of the year (and department) in every salt bucket, in parallel,
+    # and find the best order based on quantity and timbre
+    key_ranges = prefix_ranges(year) if department is None else prefix_ranges(year, department)
+    results = run_parallel(lambda: [BestOrderNantes(year=year, city=city, department=department)], key_ranges,
+                           codec, columns=scan_columns, filter=scan_filter)
+    return results[best_order_nantes.name]
+
+
+# Cached result of the last load, or scan
+result = cached_result(QueryCache(), load_generation(connection), best_order_nantes, best_order)
+connection.close()
+best_order_nantes.export(result, output_dir)
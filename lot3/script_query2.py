@@ -1,7 +1,9 @@
-from collections import defaultdict
-import os
 import happybase
-import matplotlib.pyplot as plt
+from cellcodec import load_codec
+from hbase_common import (KEY_ONLY_FILTER, host, load_generation, port, rollup_column, unpack_counter,
+                          year_range_scans, years_table_name)
+from query_cache import QueryCache, cached_result
+from query_engine import OrdersByYear, output_dir, run_parallel
 
 """
 Script de comptage des commandes par année dans la table HBase 'fromagerie' et génération d'un graphique PDF.
@@ -12,10 +14,18 @@ le nombre total de commandes par année est généré et enregistré dans un fic
 
 Fonctionnalités:
 - Connexion à la table 'fromagerie' de HBase.
-- Filtrage et comptage des commandes par année entre 2010 et 2015.
+- Lecture des compteurs de la table d'agrégats `fromagerie_orders_by_year` (6 lectures de clés en un appel), tenue à
+  jour par `script_hbase.py`. Si elle n'existe pas ou est vide, comptage par scan de la table 'fromagerie':
+  lecture, dans chaque bucket de sel, de la seule plage de clés des années 2010 à 2015 (`row_start`/`row_stop`,
+  voir `hbase_common.py`) au lieu d'un scan complet de la table, les 16 plages en parallèle; l'année est lue dans
+  la clé de ligne.
+  seules les clés traversent la connexion Thrift (`FirstKeyOnlyFilter` et `KeyOnlyFilter` côté serveur).
+- Comptage des commandes par année entre 2010 et 2015.
 - Affichage du nombre de commandes par année dans la console.
 - Génération d'un graphique à barres représentant le nombre total de commandes par année.
 - Sauvegarde du graphique dans un fichier PDF dans le répertoire spécifié.
+- Comptage et graphique sont ceux de l'agrégateur `OrdersByYear` de `query_engine.py`.
+- Résultat mis en cache sur disque (`query_cache.py`) jusqu'au prochain chargement de la table.
 
 Configuration:
 - Hôte: `127.0.0.1`
@@ -24,53 +34,37 @@ Configuration:
 
 Structure des données dans HBase:
 - La colonne `data_fro:datcde` contient les dates des commandes au format `AAAA-MM-JJ`.
+- La clé de ligne `bucket|année|département|codcde|ligne` contient l'année de `datcde`.
 
 """
 
 
 # Connect to HBase
-connection = happybase.Connection('127.0.0.1', port=9090)
-table = connection.table('fromagerie')
+connection = happybase.Connection(host, port=port)
 
-def orders_count_by_year():
-    # Dictionary to store the number of orders per year
-    orders_per_year = {year: 0 for year in range(2010, 2016)}
-
-    for key, data in table.scan():
-        date_str = data[b'data_fro:datcde'].decode()
-        year = int(date_str.split('-')[0])  
-
-        if 2010 <= year <= 2015:
-            orders_per_year[year] += 1
-
-    return orders_per_year
-
-orders_by_year = orders_count_by_year()
+# Question of the shared query engine, with its state and PDF export
+orders_by_year = OrdersByYear(2010, 2015)
 
-# Display results in ascending order
-print("\nTotal number of orders between 2010 and 2015:")
-for year in sorted(orders_by_year.keys()):
-    print("{}: {} orders".format(year, orders_by_year[year]))
 
-# Output directory
-output_dir = '/datavolume1/results_lot3'
-os.makedirs(output_dir, exist_ok=True)  
-
-# Create a bar plot
-years = list(orders_by_year.keys())
-counts = list(orders_by_year.values())
-
-plt.figure(figsize=(10, 6))
-plt.bar(years, counts, color='blue')
-plt.xlabel('Year')
-plt.ylabel('Number of Orders')
-plt.title('Total Number of Orders by Year (2010-2015)')
-plt.xticks(years)  
-plt.grid(axis='y')
-
-# Save the plot as a PDF in the specified output directory
-pdf_path = os.path.join(output_dir, 'orders_by_year.pdf')  
-plt.savefig(pdf_path)  
-plt.close() 
-
-print("PDF saved at: " + pdf_path)  
+def orders_count_by_year():
+    # Counters of the rollup table, one row per year
+    if years_table_name.encode() in connection.tables():
+        orders_per_year = orders_by_year.result()
+        rows = connection.table(years_table_name).rows([str(year).encode() for year in orders_per_year])
+        if rows:
+            for key, data in rows:
+                orders_per_year[int(key)] = unpack_counter(data[rollup_column('orders')])
+            return orders_per_year
+        # Empty rollup table (created, not filled yet): count by scan
+
+    # Only the keys of 2010 to 2015 are read, in each salt bucket and in parallel; the year is read in the key
+    key_ranges = year_range_scans(orders_by_year.year_start, orders_by_year.year_stop)
+    results = run_parallel(lambda: [OrdersByYear(orders_by_year.year_start, orders_by_year.year_stop)], key_ranges,
+                           load_codec(connection), filter=KEY_ONLY_FILTER)
+    return results[orders_by_year.name]
+
+
+# Cached result of the last load, or count
+counts = cached_result(QueryCache(), load_generation(connection), orders_by_year, orders_count_by_year)
+connection.close()
+orders_by_year.export(counts, output_dir)
@@ -1,7 +1,9 @@
-from collections import defaultdict
-import os
 import happybase
-import pandas as pd
+from cellcodec import load_codec
+from hbase_common import (TOP_CLIENT_ROW, clients_table_name, columns, host, load_generation, port, rollup_column,
+                          shards, table_name, unpack_counter)
+from query_cache import QueryCache, cached_result
+from query_engine import ClientMaxTimbre, output_dir, run_parallel
 
 """
 Script de recherche du client ayant les frais de timbre les plus élevés dans la table HBase 'fromagerie' et export des résultats en Excel.
@@ -11,9 +13,16 @@ Les informations sur ce client sont ensuite exportées dans un fichier Excel pou
 
 Fonctionnalités:
 - Connexion à HBase et accès à la table 'fromagerie'.
+- Lecture de la seule ligne `_top` de la table d'agrégats `fromagerie_clients` (client de plus grande quantité totale:
+  nombre de lignes, quantité totale, nom et prénom), tenue à jour par `script_hbase.py`: une lecture de clé, quel
+  que soit le nombre de clients. Si la table n'existe pas ou n'a pas cette ligne (table vide, ou remplie avant
+  cette ligne: `script_hbase.py --rebuild-rollups`), agrégation par scan de la table 'fromagerie', avec lecture des seules colonnes utilisées (`codcli`, `qte`, `timbrecli`, `nomcli`, `prenomcli`), par lots de
+  `SCAN_BATCH_SIZE` lignes, les plages de clés (buckets de sel ou régions) étant lues en parallèle.
 - Calcul des frais de timbre cumulés pour chaque client, ainsi que du nombre de commandes et de la quantité totale de produits commandés.
 - Identification du client avec les frais de timbre les plus élevés.
 - Export des informations du client dans un fichier Excel dans le répertoire spécifié.
+- Agrégation et export sont ceux de l'agrégateur `ClientMaxTimbre` de `query_engine.py`.
+- Résultat mis en cache sur disque (`query_cache.py`) jusqu'au prochain chargement de la table.
 
 Configuration:
 - Hôte: `127.0.0.1`
@@ -31,46 +40,33 @@ Structure des données dans HBase:
 """
 
 # Connect to HBase
-connection = happybase.Connection('127.0.0.1', port=9090)
-table = connection.table('fromagerie')
+connection = happybase.Connection(host, port=port)
+table = connection.table(table_name)
 
-# 3. Client with the highest postage fees
-def client_with_max_timbre():
-    clients_data = defaultdict(lambda: {'count': 0, 'total_qty': 0, 'nom': '', 'prenom': ''})
-
-    for key, data in table.scan():
-        # Retrieve necessary information
-        client_id = data[b'data_fro:codcli'].decode()
-        quantity = int(data[b'data_fro:qte'].decode())
-        timbre = float(data[b'data_fro:timbrecli'].decode())
-        nom = data[b'data_fro:nomcli'].decode()
-        prenom = data[b'data_fro:prenomcli'].decode()
+# Question of the shared query engine, with its state and Excel export
+client_max_timbre = ClientMaxTimbre()
 
-        clients_data[client_id]['count'] += 1
-        clients_data[client_id]['total_qty'] += quantity
-        clients_data[client_id]['nom'] = nom
-        clients_data[client_id]['prenom'] = prenom
-        
-        # Find the client with the highest postage fees
-    max_timbre_client = max(clients_data.items(), key=lambda x: x[1]['total_qty'])
-    
-    return max_timbre_client[1]  
 
-client_max_timbre = client_with_max_timbre()
-
-print("\nClient with the highest postage fees:")
-print(client_max_timbre)
+# 3. Client with the highest postage fees
+def client_with_max_timbre():
+    # Top client row of the rollup table: a single get
+    if clients_table_name.encode() in connection.tables():
+        data = connection.table(clients_table_name).row(TOP_CLIENT_ROW)
+        if data:
+            return {
+                'count': unpack_counter(data[rollup_column('count')]),
+                'total_qty': unpack_counter(data[rollup_column('total_qty')]),
+                'nom': data[rollup_column('nom')].decode(),
+                'prenom': data[rollup_column('prenom')].decode(),
+            }
+        # No top client row (empty rollup table, or filled before that row existed): aggregate by scan
 
-# Output directory
-output_dir = '/datavolume1/results_lot3'
-os.makedirs(output_dir, exist_ok=True)  
+    results = run_parallel(lambda: [ClientMaxTimbre()], shards(table), load_codec(connection),
+                           columns=columns(*client_max_timbre.column_names))
+    return results[client_max_timbre.name]
 
-# Export results to an Excel file
-def export_to_excel(data, output_directory, filename='client_max_timbre.xlsx'):
-    df = pd.DataFrame([data])
-    file_path = os.path.join(output_directory, filename)  
-    df.to_excel(file_path, index=False)
-    print("Results exported to " + file_path)  
 
-# Call the export function
-export_to_excel(client_max_timbre, output_dir)
+# Cached result of the last load, or aggregation
+client = cached_result(QueryCache(), load_generation(connection), client_max_timbre, client_with_max_timbre)
+connection.close()
+client_max_timbre.export(client, output_dir)
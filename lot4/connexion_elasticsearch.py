@@ -1,55 +1,121 @@
+import argparse
+import bisect
+import os
+import sys
+import time
 import happybase
-import pandas as pd
 from elasticsearch import Elasticsearch, helpers
 
+# Scans parallèles de hbase_common.py (lot3), à copier avec ce script
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lot3'))
+from cellcodec import load_codec
+from hbase_common import (CHANGE_COLUMN, KEY_SEPARATOR, SCAN_WORKERS, StreamScan, columns, department_of,
+                          load_generation, parallel_scan, shards, single_column_value_filter, year_of)
+
 """
 Script de migration de données depuis HBase vers Elasticsearch.
 
 Ce script effectue les opérations suivantes :
 1. Connexion à Elasticsearch.
-2. Vérification de la connexion Elasticsearch et suppression de l'index existant (si nécessaire).
-3. Création d'un index Elasticsearch avec un mapping spécifique pour les données.
-4. Connexion à HBase et récupération de toutes les données de la table 'fromagerie'.
-5. Nettoyage et transformation des données en format JSON compatible avec Elasticsearch.
-6. Insertion des données par lots de 500 documents dans l'index Elasticsearch.
+2. Vérification de la connexion Elasticsearch.
+3. Création d'un nouvel index versionné (`dataw_fro03-<date>`) avec un mapping spécifique pour les données, réglé
+   pour le chargement : sans rafraîchissement (`refresh_interval` -1) ni réplique.
+4. Connexion à HBase et lecture de la table 'fromagerie' par plages de clés (buckets de sel ou régions) en
+   parallèle sur un pool de connexions (`hbase_common.StreamScan`).
+5. Décodage des cellules (encodage de la table, voir `lot3/cellcodec.py`: valeurs typées) et transformation des
+   lignes en actions d'indexation Elasticsearch, au fil du scan.
+6. Insertion des documents par lots (`helpers.parallel_bulk`, ou `helpers.streaming_bulk` avec un seul thread).
+7. Rétablissement du rafraîchissement, fusion des segments (`forcemerge`) et des répliques de `index_settings`,
+   avec un délai de requête long (`FINALIZE_TIMEOUT`), puis attente de l'état `yellow` de l'index (santé du
+   cluster).
+8. Bascule de l'alias `dataw_fro03` sur le nouvel index en une seule opération atomique (`update_aliases`), puis
+   suppression de l'ancien index : Kibana lit l'ancien index jusqu'à la bascule, sans période sans données.
+   Un index `dataw_fro03` d'avant les alias est remplacé par l'alias dans la même opération (`remove_index`).
+   Si des documents sont en erreur, ou si le transfert s'interrompt (erreur de transport, de scan), les nouveaux
+   index sont supprimés sans être publiés et les anciens restent en service.
+
+Index des commandes (`dataw_fro03_orders`) :
+- Un document par commande (`codcde`) : ville, code postal, département, année, date, client, quantité totale,
+  quantité moyenne par ligne, nombre de lignes, timbres (`timbrecde` et `timbrecli` totaux, `timbrecli_nul` quand
+  toutes les lignes ont un `timbrecli` nul). Les classements des lots 1 et 2 (100 meilleures commandes par
+  quantité et timbre, ou par quantité et moyenne sans timbre client) et la répartition par ville deviennent des
+  recherches triées et filtrées sur un index bien plus petit que celui des lignes.
+- Les commandes sont agrégées pendant le transfert des lignes, et le document d'une commande part dans le même
+  flux bulk dès que le scan passe à la commande suivante sur sa plage de clés (`OrderRollup`) : la mémoire reste
+  bornée. L'index des commandes est un index versionné publié par alias avec celui des lignes.
+- `--sync` recalcule les commandes des lignes modifiées : une clé de ligne commence par `bucket|année|département|
+  codcde|` (voir `lot3/hbase_common.py`), et toutes les lignes d'une commande (même date, même client) sont
+  relues par un scan de ce préfixe.
+
+Identifiants et synchronisation incrémentale :
+- Chaque document a pour `_id` la clé de ligne HBase : une reprise après interruption réécrit les mêmes documents
+  au lieu de créer des doublons.
+- Le point de reprise (checkpoint) est la génération du dernier chargement HBase indexé (`hbase_common.
+  load_generation`), enregistrée dans le `_meta` du mapping de l'index une fois toutes les écritures acquittées
+  (aucune erreur d'indexation).
+- `--sync` écrit dans l'index en service (via l'alias) : seules les lignes marquées d'une génération plus récente
+  que le checkpoint (colonne `data_fro:_gen`, filtre côté serveur) sont lues et écrites en upsert (`update` +
+  `doc_as_upsert`). La durée dépend du volume de lignes modifiées, et une synchronisation interrompue se relance
+  sans risque.
+
+Le transfert est un pipeline de générateurs : scan -> décodage -> bulk. Les lignes ne sont jamais toutes en
+mémoire : les blocs lus passent par une file bornée (`--scan-queue` blocs), les lots bulk par la file de
+`parallel_bulk` (`--queue-size` lots), et les threads de scan attendent quand l'indexation est en retard. Les
+premiers documents sont indexés pendant que le scan continue.
 
 Configuration :
 - Adresse d'Elasticsearch: `http://localhost:9200`
-- Nom de l'index Elasticsearch : `dataw_fro03`
+- Nom de l'index Elasticsearch : `dataw_fro03` (alias de l'index versionné en service)
+- Nom de l'index des commandes : `dataw_fro03_orders` (alias)
 - Adresse HBase : `'node183722-env-1839015-2024-m05-etudiant08.sh1.hidora.com'` (port 11986)
 - Table HBase : `fromagerie`
+- Lots bulk : `BULK_CHUNK_SIZE` documents et `BULK_MAX_CHUNK_BYTES` octets au plus, envoyés par `BULK_THREADS`
+  threads.
 
 Fonctionnalités :
-- Vérifie l'existence de l'index dans Elasticsearch et le recrée si nécessaire.
-- Récupère les données de HBase, nettoie les champs, et les convertit au format JSON pour l'insertion dans Elasticsearch.
+- Reconstruit l'index à côté de l'index en service et bascule l'alias à la fin (blue/green).
+- Récupère les données de HBase, décode les champs, et les convertit au format JSON pour l'insertion dans Elasticsearch.
 - Insère les données en utilisant des lots pour optimiser la performance et gérer les erreurs d'indexation.
+- Affiche la progression (documents indexés, documents/seconde).
 
 Exceptions :
 - Gère les erreurs de connexion HBase et Elasticsearch.
 - Gère les erreurs d'indexation en affichant les documents échoués.
 
+Usage :
+    python3 connexion_elasticsearch.py [--sync] [--chunk-size 500] [--max-chunk-bytes 10485760] [--bulk-threads 4]
+                                       [--queue-size 4] [--scan-workers 8] [--scan-queue 16]
 """
 
 
 # Connexion Elasticsearch
 ELASTIC_ADDRESS_HOST = "http://localhost:9200"
 ELASTIC_INDEX_NAME = "dataw_fro03"
+ELASTIC_ORDERS_INDEX_NAME = "dataw_fro03_orders"
 ELASTIC_USER = "*****"
 ELASTIC_PASSWORD = "******"
 
-es_connect = Elasticsearch(
-    [ELASTIC_ADDRESS_HOST],
-    http_auth=(ELASTIC_USER, ELASTIC_PASSWORD)
-)
+# Connexion à HBase
+HBASE_HOST = '*******'
+HBASE_PORT = *****
 
-# Vérification de la connexion Elasticsearch
-if not es_connect.ping():
-    raise ValueError("Connexion à Elasticsearch échouée")
+# Lots bulk : documents et octets par lot, threads d'envoi, lots en attente
+BULK_CHUNK_SIZE = 500
+BULK_MAX_CHUNK_BYTES = 10 * 1024 * 1024
+BULK_THREADS = 4
+BULK_QUEUE_SIZE = 4
 
-# Vérification de l'existence de l'index et suppression s'il existe
-if es_connect.indices.exists(index=ELASTIC_INDEX_NAME):
-    es_connect.indices.delete(index=ELASTIC_INDEX_NAME)
-    print(f"L'index '{ELASTIC_INDEX_NAME}' a été supprimé.")
+# Réglages de l'index pendant le chargement, remplacés à la fin par ceux de `index_settings`
+LOAD_SETTINGS = {"number_of_replicas": 0, "refresh_interval": "-1"}
+REFRESH_INTERVAL = "1s"
+
+# Délais (secondes) de la fusion des segments et de l'attente des répliques : bien plus longs que les 10 s par
+# défaut du client, dépassés sur un index complet
+FINALIZE_TIMEOUT = 3600
+HEALTH_STATUS = "yellow"
+
+# Clé du checkpoint de synchronisation dans le `_meta` du mapping de l'index
+CHECKPOINT_KEY = 'hbase_generation'
 
 # Création d'un nouvel index avec le mapping modifié
 index_settings = {
@@ -88,92 +154,453 @@ index_settings = {
     }
 }
 
-# Création de l'index
-es_connect.indices.create(index=ELASTIC_INDEX_NAME, body=index_settings)
-print(f"Index '{ELASTIC_INDEX_NAME}' créé avec succès.")
 
-# Connexion à HBase
-HBASE_HOST = '*******'
-HBASE_PORT = *****
-connection = happybase.Connection(HBASE_HOST, port=HBASE_PORT)
-table = connection.table('fromagerie')
+# Index des commandes : un document par `codcde`
+order_index_settings = {
+    "settings": {
+        "number_of_shards": 1,
+        "number_of_replicas": 1
+    },
+    "mappings": {
+        "properties": {
+            "codcde": {"type": "integer"},
+            "codcli": {"type": "integer"},
+            "villecli": {"type": "keyword"},
+            "cpcli": {"type": "keyword"},
+            "departement": {"type": "keyword"},
+            "annee": {"type": "integer"},
+            "datcde": {"type": "date", "format": "yyyy-MM-dd"},
+            "qte_totale": {"type": "integer"},
+            "moyenne_qte": {"type": "float"},
+            "nb_lignes": {"type": "integer"},
+            "timbrecde_total": {"type": "float"},
+            "timbrecli_total": {"type": "float"},
+            "timbrecli_nul": {"type": "boolean"}
+        }
+    }
+}
 
+# Colonnes HBase lues pour recalculer une commande
+ORDER_COLUMNS = ['codcde', 'codcli', 'villecli', 'cpcli', 'datcde', 'qte', 'timbrecde', 'timbrecli']
 
-def get_data_hbase():
+
+class OrderRollup:
+    """
+    Agrégats par commande (`codcde`) des lignes transférées, pour l'index des commandes.
+
+    Sur chaque plage de clés lue, les lignes d'une commande se suivent (clé 'bucket|année|département|codcde|
+    ligne') : une commande est complète dès que le préfixe de clé change sur sa plage, et `add` la renvoie
+    aussitôt. Seules la première et la dernière commande de chaque plage, qui peuvent chevaucher la limite de deux
+    régions, sont gardées jusqu'à `finish` : la mémoire dépend du nombre de plages, pas du nombre de commandes.
+    """
+
+    def __init__(self, key_ranges):
+        self.starts = sorted(start or b'' for start, stop in key_ranges)
+        # Commande en cours de chaque plage : [préfixe de clé, état, première commande de la plage]
+        self.current = {}
+        # Premières et dernières commandes des plages, fusionnées par `codcde`
+        self.edges = {}
+
+    def add(self, key, row):
+        """Ajoute une ligne (clé HBase, valeurs décodées) ; renvoie la commande précédente de la plage si elle est
+        complète, sinon None."""
+        prefix = key[:key.rindex(KEY_SEPARATOR.encode('utf-8')) + 1]
+        key_range = bisect.bisect_right(self.starts, key) - 1
+        state = self.current.get(key_range)
+        complete = None
+        if state is None or state[0] != prefix:
+            if state is not None:
+                if state[2]:
+                    self.merge_edge(state[1])
+                else:
+                    complete = state[1]
+            state = self.current[key_range] = [prefix, self.new_order(row), state is None]
+        order = state[1]
+        order["qte_totale"] += int(row['qte'])
+        order["nb_lignes"] += 1
+        order["timbrecde_total"] += float(row['timbrecde'])
+        order["timbrecli_total"] += float(row['timbrecli'])
+        order["timbrecli_nul"] = order["timbrecli_nul"] and not row['timbrecli']
+        return complete
+
+    def finish(self):
+        """Commandes gardées aux limites des plages, une fois toutes les lignes ajoutées."""
+        for prefix, order, first in self.current.values():
+            self.merge_edge(order)
+        self.current = {}
+        return list(self.edges.values())
+
+    def merge_edge(self, order):
+        edge = self.edges.get(order["codcde"])
+        if edge is None:
+            self.edges[order["codcde"]] = order
+            return
+        for name in ("qte_totale", "nb_lignes", "timbrecde_total", "timbrecli_total"):
+            edge[name] += order[name]
+        edge["timbrecli_nul"] = edge["timbrecli_nul"] and order["timbrecli_nul"]
+
+    @staticmethod
+    def new_order(row):
+        return {
+            "codcde": row['codcde'],
+            "codcli": row['codcli'],
+            "villecli": row['villecli'],
+            "cpcli": row['cpcli'],
+            "departement": department_of(row['cpcli']),
+            "annee": int(year_of(row['datcde'])),
+            "datcde": row['datcde'] or None,
+            "qte_totale": 0,
+            "nb_lignes": 0,
+            "timbrecde_total": 0.0,
+            "timbrecli_total": 0.0,
+            "timbrecli_nul": True
+        }
+
+    @staticmethod
+    def document(order, index_name):
+        """Action d'indexation d'une commande (`_id` = `codcde`)."""
+        # Sommes arrondies aux centimes (bruit des additions de réels)
+        return {
+            "_index": index_name,
+            "_id": str(order["codcde"]),
+            "_source": dict(order, moyenne_qte=order["qte_totale"] / order["nb_lignes"],
+                            timbrecde_total=round(order["timbrecde_total"], 2),
+                            timbrecli_total=round(order["timbrecli_total"], 2))
+        }
+
+
+def connect_elasticsearch():
     """
-    Récupère toutes les données de la table 'fromagerie' de HBase et les convertit en un DataFrame pandas.
-    
+    Connexion à Elasticsearch.
+
     Retourne :
-        pd.DataFrame : Les données de HBase sous forme de DataFrame.
+        Elasticsearch : Le client, dont la connexion a été vérifiée.
     """
-    data_list = []
-    for key, data in table.scan():
-        # Nettoyage préfixe "details:" - décodage des valeurs
-        data_cleaned = {k.decode().split(':')[1]: v.decode('utf-8', errors='ignore') for k, v in data.items()}
-        data_list.append(data_cleaned)
-    return pd.DataFrame(data_list)
+    es_connect = Elasticsearch(
+        [ELASTIC_ADDRESS_HOST],
+        http_auth=(ELASTIC_USER, ELASTIC_PASSWORD)
+    )
 
+    # Vérification de la connexion Elasticsearch
+    if not es_connect.ping():
+        raise ValueError("Connexion à Elasticsearch échouée")
+    return es_connect
 
-# Récupération des données de HBase
-hbase_data = get_data_hbase()
 
+def create_index(es_connect, alias=ELASTIC_INDEX_NAME, body=index_settings):
+    """
+    Crée un nouvel index versionné `<alias>-<date>` avec le mapping de `body`, réglé pour le chargement
+    (`LOAD_SETTINGS`). L'alias reste sur l'index en service jusqu'à `publish_index`.
 
-def transform_to_elastic_format(data):
+    Arguments :
+        es_connect (Elasticsearch) : Le client Elasticsearch.
+        alias (str) : Nom de lecture de l'index (alias).
+        body (dict) : Réglages et mapping définitifs de l'index.
+
+    Retourne :
+        str : Nom du nouvel index.
     """
-    Transforme les données du DataFrame en un format compatible JSON pour Elasticsearch.
-    
+    # Date à la milliseconde : deux transferts de la même seconde ont des index distincts
+    now = time.time()
+    index_name = "%s-%s%03d" % (alias, time.strftime('%Y%m%d-%H%M%S', time.localtime(now)), now * 1000 % 1000)
+    load_body = dict(body, settings=dict(body["settings"], **LOAD_SETTINGS))
+    es_connect.indices.create(index=index_name, body=load_body)
+    print(f"Index '{index_name}' créé avec succès.")
+    return index_name
+
+
+def finalize_index(es_connect, index_name, body=index_settings):
+    """
+    Rétablit les réglages de `body` après le chargement : rafraîchissement, fusion des segments, puis répliques
+    (copiées à partir des segments fusionnés). Attend que l'index soit au moins `HEALTH_STATUS` (primaires
+    alloués) avant de rendre la main, pour que `publish_index` ne bascule pas l'alias sur un index indisponible.
+    """
+    es_connect.indices.put_settings(index=index_name, body={"index": {"refresh_interval": REFRESH_INTERVAL}},
+                                    request_timeout=FINALIZE_TIMEOUT)
+    es_connect.indices.refresh(index=index_name, request_timeout=FINALIZE_TIMEOUT)
+    es_connect.indices.forcemerge(index=index_name, max_num_segments=1, request_timeout=FINALIZE_TIMEOUT)
+    es_connect.indices.put_settings(index=index_name,
+                                    body={"index": {"number_of_replicas": body["settings"]["number_of_replicas"]}},
+                                    request_timeout=FINALIZE_TIMEOUT)
+
+    health = es_connect.cluster.health(index=index_name, wait_for_status=HEALTH_STATUS,
+                                       timeout="%ds" % FINALIZE_TIMEOUT, request_timeout=FINALIZE_TIMEOUT)
+    if health["timed_out"]:
+        raise RuntimeError(f"L'index '{index_name}' n'a pas atteint l'état {HEALTH_STATUS} : {health['status']}")
+
+
+def publish_index(es_connect, index_name, alias=ELASTIC_INDEX_NAME):
+    """
+    Bascule l'alias sur `index_name` en une seule opération, puis supprime les index qu'il désignait.
+    """
+    actions = [{"add": {"index": index_name, "alias": alias}}]
+    old_indices = []
+    if es_connect.indices.exists_alias(name=alias):
+        old_indices = [name for name in es_connect.indices.get_alias(name=alias) if name != index_name]
+        actions = [{"remove": {"index": name, "alias": alias}} for name in old_indices] + actions
+    elif es_connect.indices.exists(index=alias):
+        # Index concret d'avant les alias : supprimé dans la même opération que la création de l'alias
+        actions.insert(0, {"remove_index": {"index": alias}})
+    es_connect.indices.update_aliases(body={"actions": actions})
+    print(f"Alias '{alias}' basculé sur l'index '{index_name}'.")
+
+    for name in old_indices:
+        es_connect.indices.delete(index=name)
+        print(f"L'index '{name}' a été supprimé.")
+
+
+def delete_indices(es_connect, new_indices):
+    """
+    Supprime les index versionnés créés par un transfert qui n'a pas abouti ; les alias restent sur les index en
+    service.
+    """
+    for name, alias, body in new_indices:
+        if es_connect.indices.exists(index=name):
+            es_connect.indices.delete(index=name)
+            print(f"L'index '{name}' n'est pas publié et a été supprimé.")
+
+
+def load_checkpoint(es_connect):
+    """
+    Génération HBase du dernier transfert complet vers l'index, ou None.
+    """
+    if not es_connect.indices.exists(index=ELASTIC_INDEX_NAME):
+        return None
+    for mapping in es_connect.indices.get_mapping(index=ELASTIC_INDEX_NAME).values():
+        return mapping['mappings'].get('_meta', {}).get(CHECKPOINT_KEY)
+    return None
+
+
+def save_checkpoint(es_connect, generation, index_name=ELASTIC_INDEX_NAME):
+    """
+    Enregistre la génération HBase transférée dans le `_meta` du mapping de l'index.
+    """
+    es_connect.indices.put_mapping(index=index_name, body={"_meta": {CHECKPOINT_KEY: generation}})
+    print(f"Checkpoint enregistré : génération {generation}.")
+
+
+def scan_rows(scan_workers=SCAN_WORKERS, scan_queue=None, since=None):
+    """
+    Lit la table 'fromagerie' de HBase par blocs de lignes, au fil du scan.
+
     Arguments :
-        data (pd.DataFrame) : Les données de HBase sous forme de DataFrame.
-        
+        scan_workers (int) : Nombre de plages de clés lues en parallèle.
+        scan_queue (int) : Nombre de blocs lus en attente au plus (2 par thread par défaut).
+        since (str) : Génération du checkpoint : seules les lignes écrites par un chargement plus récent sont lues.
+
     Retourne :
-        list : Liste de dictionnaires au format JSON pour Elasticsearch.
-    """
-    actions = []
-    for index, row in data.iterrows():
-        # Convertir les valeurs boolean en format Elasticsearch pour les champs barchive, bstock et indispobj
-        row_dict = row.to_dict()
-        row_dict['barchive'] = row_dict['barchive'].lower() == 'true'
-        row_dict['bstock'] = row_dict['bstock'].lower() == 'true'
-        row_dict['indispobj'] = row_dict['indispobj'].lower() == 'true'
-
-        action = {
-            "_index": ELASTIC_INDEX_NAME,
-            "_source": row_dict
-        }
-        actions.append(action)
-    return actions
+        tuple : (encodage des cellules de la table, génération du dernier chargement, plages de clés lues,
+        scan des blocs de lignes (clé, cellules), `StreamScan` à utiliser dans un `with` : les threads de scan
+        s'arrêtent à la sortie, même sur une erreur)
+    """
+    connection = happybase.Connection(HBASE_HOST, port=HBASE_PORT)
+    key_ranges = shards(connection.table('fromagerie'))
+    codec = load_codec(connection)
+    generation = load_generation(connection)
+    connection.close()
 
+    scan_kwargs = {}
+    if since is not None:
+        # Lignes marquées d'une génération plus récente que le checkpoint, filtrées par les RegionServers
+        scan_kwargs['filter'] = single_column_value_filter(CHANGE_COLUMN, '>', 'binary:' + since)
 
-# Transformation des données en format compatible pour Elasticsearch
-elastic_data = transform_to_elastic_format(hbase_data)
+    pool = happybase.ConnectionPool(size=scan_workers, host=HBASE_HOST, port=HBASE_PORT)
+    return codec, generation, key_ranges, StreamScan(key_ranges, workers=scan_workers, pool=pool,
+                                                     queue_size=scan_queue, **scan_kwargs)
 
 
-# Fonction pour insérer les données par lots de 500
-def insert_data_batch(data, batch_size=500):
+def rescan_orders(prefixes, codec, scan_workers=SCAN_WORKERS):
     """
-    Insère les données par lots dans Elasticsearch.
-    
+    Recalcule les commandes des préfixes de clés donnés en relisant toutes leurs lignes dans HBase.
+
     Arguments :
-        data (list) : Liste de données transformées au format JSON pour Elasticsearch.
-        batch_size (int) : Taille du lot pour chaque insertion dans Elasticsearch. Par défaut, 500.
-    
+        prefixes (iterable) : Préfixes de clés des commandes ('bucket|année|département|codcde|').
+        codec (CellCodec) : Encodage des cellules de la table.
+        scan_workers (int) : Nombre de préfixes lus en parallèle.
+
+    Retourne :
+        list : Commandes relues (une par préfixe).
+    """
+    def read_rows(rows):
+        block = list(rows)
+        return list(zip([key for key, data in block], codec.decode_rows([data for key, data in block], ORDER_COLUMNS)))
+
+    key_ranges = [(prefix, prefix[:-1] + bytes([prefix[-1] + 1])) for prefix in sorted(prefixes)]
+    pool = happybase.ConnectionPool(size=scan_workers, host=HBASE_HOST, port=HBASE_PORT)
+    # Une plage par commande : toutes les commandes sont rendues par `finish`
+    rollup = OrderRollup(key_ranges)
+    for rows in parallel_scan(key_ranges, read_rows, workers=scan_workers, pool=pool, columns=columns(*ORDER_COLUMNS)):
+        for key, row in rows:
+            rollup.add(key, row)
+    return rollup.finish()
+
+
+def transform_to_elastic_format(blocks, codec, index_name=ELASTIC_INDEX_NAME, upsert=False, orders=None,
+                                orders_index=None, prefixes=None):
+    """
+    Transforme les lignes de HBase en actions d'indexation pour Elasticsearch, au fil de l'eau.
+
+    Arguments :
+        blocks (iterable) : Blocs de lignes (clé, cellules) de la table 'fromagerie'.
+        codec (CellCodec) : Encodage des cellules de la table.
+        index_name (str) : Index (ou alias) de destination.
+        upsert (bool) : Actions `update` avec `doc_as_upsert` au lieu de `index`.
+        orders (OrderRollup) : Agrégats par commande : le document d'une commande est émis dans `orders_index`
+            dès qu'elle est complète.
+        orders_index (str) : Index des commandes.
+        prefixes (set) : Complété avec le préfixe de clé de la commande de chaque ligne (synchronisation).
+
+    Retourne :
+        generator : Actions d'indexation (un document par ligne, `_id` = clé de ligne HBase, et un par commande).
+    """
+    for block in blocks:
+        data_list = [data for key, data in block]
+        # Nettoyage préfixe "details:" - décodage des valeurs, colonne par colonne ;
+        # les champs barchive, bstock et indispobj sont des booléens (décodage typé)
+        names = sorted({k.decode().split(':')[1] for data in data_list for k in data} - {CHANGE_COLUMN})
+        for (key, data), row_dict in zip(block, codec.decode_rows(data_list, names)):
+            if orders is not None:
+                order = orders.add(key, row_dict)
+                if order is not None:
+                    yield OrderRollup.document(order, orders_index)
+            if prefixes is not None:
+                prefixes.add(key[:key.rindex(KEY_SEPARATOR.encode('utf-8')) + 1])
+            if upsert:
+                yield {
+                    "_op_type": "update",
+                    "_index": index_name,
+                    "_id": key.decode('utf-8'),
+                    "doc": row_dict,
+                    "doc_as_upsert": True
+                }
+            else:
+                yield {
+                    "_index": index_name,
+                    "_id": key.decode('utf-8'),
+                    "_source": row_dict
+                }
+    if orders is not None:
+        for order in orders.finish():
+            yield OrderRollup.document(order, orders_index)
+
+
+def insert_data_stream(es_connect, actions, chunk_size=BULK_CHUNK_SIZE, max_chunk_bytes=BULK_MAX_CHUNK_BYTES,
+                       thread_count=BULK_THREADS, queue_size=BULK_QUEUE_SIZE):
+    """
+    Insère les actions dans Elasticsearch par lots, au fur et à mesure qu'elles sont produites.
+
+    Arguments :
+        es_connect (Elasticsearch) : Le client Elasticsearch.
+        actions (iterable) : Actions d'indexation, consommées au fil de l'eau.
+        chunk_size (int) : Nombre de documents par lot. Par défaut, 500.
+        max_chunk_bytes (int) : Taille maximale d'un lot en octets.
+        thread_count (int) : Nombre de threads d'envoi (`streaming_bulk` avec 1 thread).
+        queue_size (int) : Nombre de lots en attente d'envoi au plus.
+
     Affiche :
-        Messages de confirmation pour chaque lot inséré et les erreurs d'indexation (le cas échéant).
+        La progression et les erreurs d'indexation (le cas échéant).
+
+    Retourne :
+        tuple : (documents indexés, documents en erreur)
     """
-    for i in range(0, len(data), batch_size):
-        batch = data[i:i + batch_size]
-        try:
-            # Envoi du lot dans Elasticsearch
-            helpers.bulk(es_connect, batch)
-            print(f"Lot {i // batch_size + 1} inséré avec succès.")
-        except helpers.BulkIndexError as bulk_error:
-            print(f"Erreurs d'indexation pour le lot {i // batch_size + 1} :")
-            for error in bulk_error.errors:
-                print(f"Erreur d'indexation pour le document {error}")
+    if thread_count > 1:
+        results = helpers.parallel_bulk(es_connect, actions, thread_count=thread_count, chunk_size=chunk_size,
+                                        max_chunk_bytes=max_chunk_bytes, queue_size=queue_size,
+                                        raise_on_error=False)
+    else:
+        results = helpers.streaming_bulk(es_connect, actions, chunk_size=chunk_size,
+                                         max_chunk_bytes=max_chunk_bytes, raise_on_error=False)
+
+    indexed = 0
+    errors = 0
+    start = time.perf_counter()
+    for ok, item in results:
+        if ok:
+            indexed += 1
+            if indexed % (chunk_size * 100) == 0:
+                print("%d documents indexés (%.0f documents/s)" % (indexed, indexed / (time.perf_counter() - start)))
+        else:
+            errors += 1
+            print(f"Erreur d'indexation pour le document {item}")
+    print("%d documents indexés en %.1f s, %d en erreur" % (indexed, time.perf_counter() - start, errors))
+    return indexed, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migration de la table HBase 'fromagerie' vers Elasticsearch.")
+    parser.add_argument('--sync', action='store_true',
+                        help="synchronisation incrémentale (upserts des lignes modifiées depuis le checkpoint)")
+    parser.add_argument('--chunk-size', type=int, default=BULK_CHUNK_SIZE, help="documents par lot bulk")
+    parser.add_argument('--max-chunk-bytes', type=int, default=BULK_MAX_CHUNK_BYTES, help="octets par lot bulk")
+    parser.add_argument('--bulk-threads', type=int, default=BULK_THREADS, help="threads d'envoi des lots")
+    parser.add_argument('--queue-size', type=int, default=BULK_QUEUE_SIZE, help="lots en attente d'envoi")
+    parser.add_argument('--scan-workers', type=int, default=SCAN_WORKERS, help="plages de clés HBase lues en parallèle")
+    parser.add_argument('--scan-queue', type=int, default=None, help="blocs de lignes lus en attente")
+    args = parser.parse_args()
+
+    es_connect = connect_elasticsearch()
+    since = None
+    # Nouveaux index versionnés (index, alias, réglages), publiés à la fin si aucun document n'est en erreur
+    new_indices = []
+    sync = args.sync and es_connect.indices.exists(index=ELASTIC_INDEX_NAME)
+    if sync:
+        # Synchronisation de l'index en service, à travers l'alias
+        index_name = ELASTIC_INDEX_NAME
+        since = load_checkpoint(es_connect)
+        print(f"Synchronisation depuis la génération {since}." if since else "Pas de checkpoint : transfert complet.")
+    else:
+        index_name = create_index(es_connect)
+        new_indices.append((index_name, ELASTIC_INDEX_NAME, index_settings))
+
+    bulk_options = dict(chunk_size=args.chunk_size, max_chunk_bytes=args.max_chunk_bytes,
+                        thread_count=args.bulk_threads, queue_size=args.queue_size)
+    try:
+        # Index des commandes : reconstruit pendant un transfert complet, avec les documents des commandes émis
+        # au fil du scan ; en synchronisation, commandes des lignes modifiées recalculées après les lignes
+        orders = orders_index = prefixes = None
+        codec, generation, key_ranges, blocks = scan_rows(scan_workers=args.scan_workers,
+                                                          scan_queue=args.scan_queue, since=since)
+        if since is None:
+            orders_index = create_index(es_connect, ELASTIC_ORDERS_INDEX_NAME, order_index_settings)
+            new_indices.append((orders_index, ELASTIC_ORDERS_INDEX_NAME, order_index_settings))
+            orders = OrderRollup(key_ranges)
+        else:
+            prefixes = set()
+
+        # Pipeline : scan HBase -> transformation (et documents des commandes) -> bulk ; les threads de scan
+        # s'arrêtent en sortant du `with`, y compris sur une erreur du bulk
+        with blocks:
+            actions = transform_to_elastic_format(blocks, codec, index_name=index_name, upsert=sync, orders=orders,
+                                                  orders_index=orders_index, prefixes=prefixes)
+            indexed, errors = insert_data_stream(es_connect, actions, **bulk_options)
+
+        if prefixes and not errors:
+            if es_connect.indices.exists(index=ELASTIC_ORDERS_INDEX_NAME):
+                changed = rescan_orders(prefixes, codec, scan_workers=args.scan_workers)
+                print("%d commandes à recalculer." % len(changed))
+                actions = (OrderRollup.document(order, ELASTIC_ORDERS_INDEX_NAME) for order in changed)
+                errors += insert_data_stream(es_connect, actions, **bulk_options)[1]
+            else:
+                print(f"Index '{ELASTIC_ORDERS_INDEX_NAME}' absent : il sera construit au prochain transfert complet.")
+
+        # Checkpoint une fois toutes les écritures acquittées ; sinon la prochaine synchronisation reprend au
+        # précédent
+        if errors:
+            print("Checkpoint non enregistré : %d documents en erreur." % errors)
+            delete_indices(es_connect, new_indices)
+            return
+        for name, alias, body in new_indices:
+            finalize_index(es_connect, name, body)
+    except Exception:
+        # Erreur de transport ou de scan : les index créés par ce transfert ne sont pas publiés
+        delete_indices(es_connect, new_indices)
+        raise
 
+    if generation is not None and generation != since:
+        save_checkpoint(es_connect, generation, index_name)
+    for name, alias, body in new_indices:
+        publish_index(es_connect, name, alias)
 
-# Envoi des données par lots de 500 vers Elasticsearch
-insert_data_batch(elastic_data, batch_size=500)
 
-# Fermeture de la connexion HBase
-connection.close()
+if __name__ == "__main__":
+    main()
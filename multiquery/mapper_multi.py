@@ -0,0 +1,127 @@
+import sys
+import csv
+
+from queryspec import load_queries
+
+# Maximum number of groups (all queries together) kept in memory before the partial states are written out
+max_groups_in_memory = 100000
+
+# Column order of cleaned_data.csv, used when the input split does not start with the header line
+default_columns = ['codcli', 'genrecli', 'nomcli', 'prenomcli', 'cpcli', 'villecli', 'codcde', 'datcde',
+                   'timbrecli', 'timbrecde', 'Nbcolis', 'cheqcli', 'barchive', 'bstock', 'codobj', 'qte', 'Colis',
+                   'libobj', 'Tailleobj', 'Poidsobj', 'points', 'indispobj', 'libcondit', 'prixcond', 'puobj']
+
+
+def split_line(line):
+    """Split a CSV line into fields, with `csv.reader` only when the line contains quotes."""
+    if '"' in line:
+        return next(csv.reader([line]))
+    return line.rstrip('\r\n').split(',')
+
+
+def emit_groups(groups):
+    """
+    Print the partial state of every group, then empty the table.
+
+    `groups` maps (query, group value) to [kept values, aggregate states].
+    """
+    lines = []
+    for (query, group_value), (kept, states) in groups.items():
+        fields = ['%s:%s' % (query.id, group_value)] + kept
+        for state in states:
+            fields.extend(str(value) for value in state)
+        lines.append('\t'.join(fields) + '\n')
+    sys.stdout.write(''.join(lines))
+    groups.clear()
+
+
+def mapper(queries_file=None):
+    """
+    Evaluate every query of `queries.json` on a single scan of cleaned_data.csv.
+
+    Reads CSV data from standard input. Each row is parsed once, then checked against the year
+    range, departments and predicates of every query; a row can match several queries. Matching
+    rows are pre-aggregated per (query, group) in memory (in-mapper combining), and the table is
+    written out whenever it holds `max_groups_in_memory` groups.
+
+    Output format:
+    - One line per (query, group): 'queryid:group\tkept values...\tpartial aggregate states...'.
+      The key (text before the first tab) is tagged with the query id, so Hadoop partitions and
+      sorts the records of each query and group together.
+    """
+    queries = load_queries(queries_file)
+    all_years = set().union(*(query.years or () for query in queries))
+    all_departments = set().union(*(query.departments or () for query in queries))
+    any_year = any(query.years is None for query in queries)
+    any_department = any(query.departments is None for query in queries)
+    groups = {}
+
+    # Resolve the column positions from the header, or fall back to the cleaned_data.csv layout
+    first_line = sys.stdin.readline()
+    if not first_line:
+        return
+    columns = split_line(first_line)
+    pending_lines = []
+    if 'codcde' not in columns:
+        columns = default_columns
+        pending_lines.append(first_line)
+
+    needed = {'cpcli', 'datcde'}.union(*(query.fields() for query in queries))
+    missing_columns = [key for key in needed if key not in columns]
+    if missing_columns:
+        print("Missing columns: %s" % missing_columns, file=sys.stderr)
+        return
+    position = {key: columns.index(key) for key in needed}
+    i_cpcli, i_datcde = position['cpcli'], position['datcde']
+    n_columns = max(position.values()) + 1
+
+    # Column positions used by each query
+    plans = []
+    for query in queries:
+        plans.append((query,
+                      position[query.group_by],
+                      [position[key] for key in query.keep],
+                      [(position[field], predicate, expected) for field, predicate, expected in query.where],
+                      [(aggregate, position[aggregate.field] if aggregate.field else None)
+                       for aggregate in query.aggregates]))
+
+    for lines in (pending_lines, sys.stdin):
+        for line in lines:
+            row = split_line(line)
+            if len(row) < n_columns:
+                if line.strip():
+                    print("Malformed line: %s" % line.rstrip('\r\n'), file=sys.stderr)
+                continue
+
+            # Reject rows that no query can match, before any conversion
+            year = row[i_datcde][:4]
+            department = row[i_cpcli][:2]
+            if (not any_year and year not in all_years) or (not any_department and department not in all_departments):
+                continue
+
+            for query, i_group, i_keep, predicates, aggregates in plans:
+                if query.years is not None and year not in query.years:
+                    continue
+                if query.departments is not None and department not in query.departments:
+                    continue
+                try:
+                    if not all(predicate(row[i], expected) for i, predicate, expected in predicates):
+                        continue
+
+                    key = (query, row[i_group])
+                    group = groups.get(key)
+                    if group is None:
+                        if len(groups) >= max_groups_in_memory:
+                            emit_groups(groups)
+                        group = groups[key] = [[row[i] for i in i_keep],
+                                               [aggregate.initial() for aggregate, _ in aggregates]]
+                    for (aggregate, i), state in zip(aggregates, group[1]):
+                        aggregate.add(state, row[i] if i is not None else None)
+                except ValueError as e:
+                    print("Malformed line: %s, Error: %s" % (line.rstrip('\r\n'), e), file=sys.stderr)
+
+    emit_groups(groups)
+
+
+if __name__ == "__main__":
+    mapper(sys.argv[1] if len(sys.argv) > 1 else None)
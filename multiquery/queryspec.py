@@ -0,0 +1,114 @@
+"""
+Declarative filter/aggregate queries evaluated by `mapper_multi.py` and `reducer_multi.py`.
+
+A query (one object of `queries.json`) lists:
+- 'id': query id, used to tag its intermediate and output records,
+- 'departments': department numbers (first 2 characters of 'cpcli'),
+- 'years': inclusive [year_min, year_max] of 'datcde',
+- 'where': row predicates, e.g. {"field": "timbrecli", "op": "empty_or_zero"},
+- 'group_by': grouping column (default 'codcde'),
+- 'keep': columns copied from the first row of each group (e.g. 'villecli'),
+- 'aggregates': {"name", "op" (sum, count or mean), "field", "type" (int or float)},
+- 'rank_by': aggregate names used to rank the groups (descending), and 'top': number kept.
+"""
+import json
+import os
+
+# Text values accepted as zero without calling float()
+ZERO_VALUES = {'', '0', '0.0'}
+
+
+def is_empty_or_zero(value, expected=None):
+    return value in ZERO_VALUES or float(value) == 0
+
+
+PREDICATES = {
+    'empty_or_zero': is_empty_or_zero,
+    'eq': lambda value, expected: value == expected,
+    'ne': lambda value, expected: value != expected,
+    'in': lambda value, expected: value in expected,
+}
+
+
+class Aggregate:
+    """One aggregate of a query, and the layout of its partial state in the intermediate records."""
+
+    def __init__(self, spec):
+        self.name = spec['name']
+        self.op = spec['op']
+        self.field = spec.get('field')
+        self.cast = int if spec.get('type', 'float') == 'int' else float
+        if self.op not in ('sum', 'count', 'mean'):
+            raise ValueError("Unknown aggregate op: %s" % self.op)
+        # Number of tab-separated fields of the partial state (mean = sum and count)
+        self.width = 2 if self.op == 'mean' else 1
+
+    def initial(self):
+        return [self.cast(0), 0] if self.op == 'mean' else [self.cast(0) if self.op == 'sum' else 0]
+
+    def add(self, state, value):
+        """Add the text value of one row to `state`."""
+        if self.op == 'sum':
+            state[0] += self.cast(value)
+        elif self.op == 'count':
+            state[0] += 1
+        else:
+            state[0] += self.cast(value)
+            state[1] += 1
+
+    def merge(self, state, parts):
+        """Add a partial state read from an intermediate record to `state`."""
+        state[0] += (int if self.op == 'count' else self.cast)(parts[0])
+        if self.op == 'mean':
+            state[1] += int(parts[1])
+
+    def result(self, state):
+        if self.op == 'mean':
+            return state[0] / state[1] if state[1] > 0 else 0
+        return state[0]
+
+
+class Query:
+    """A parsed query of `queries.json`."""
+
+    def __init__(self, spec):
+        self.id = spec['id']
+        self.departments = set(spec['departments']) if spec.get('departments') else None
+        years = spec.get('years')
+        self.years = {str(year) for year in range(years[0], years[1] + 1)} if years else None
+        self.where = [(predicate['field'], PREDICATES[predicate['op']],
+                       set(predicate['value']) if predicate['op'] == 'in' else predicate.get('value'))
+                      for predicate in spec.get('where', [])]
+        self.group_by = spec.get('group_by', 'codcde')
+        self.keep = spec.get('keep', [])
+        self.aggregates = [Aggregate(aggregate) for aggregate in spec['aggregates']]
+        names = [aggregate.name for aggregate in self.aggregates]
+        self.rank_positions = [names.index(name) for name in spec.get('rank_by', names)]
+        self.top = spec.get('top', 100)
+
+    def fields(self):
+        """Columns of the input read by this query."""
+        fields = {self.group_by, *self.keep, *(field for field, _, _ in self.where)}
+        fields.update(aggregate.field for aggregate in self.aggregates if aggregate.field)
+        return fields
+
+    def ranking_key(self, group):
+        """
+        Sort key of a finished group (group value, kept values, aggregate results): ranked
+        aggregates descending, then group value. Floats are rounded to ignore summation noise.
+        """
+        group_value, kept, results = group
+        return tuple(-round(results[position], 6) for position in self.rank_positions) + (group_value,)
+
+
+def load_queries(path=None):
+    """
+    Load the queries of `path`, or of `queries.json` in the working directory (where Hadoop puts
+    the files shipped with -file) or next to this module.
+    """
+    if path is None:
+        path = 'queries.json'
+        if not os.path.exists(path):
+            path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'queries.json')
+    with open(path, encoding='utf-8') as f:
+        return [Query(spec) for spec in json.load(f)]
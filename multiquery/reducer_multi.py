@@ -0,0 +1,73 @@
+import heapq
+import itertools
+import sys
+
+from queryspec import load_queries
+
+
+def read_groups(lines, queries):
+    """
+    Merge the sorted partial states written by `mapper_multi.py`, one group at a time.
+
+    Records are sorted by key ('queryid:group'), so the partial states of a group are
+    consecutive and the groups of a query are contiguous.
+
+    Yields:
+    - tuple: (query, (group value, kept values, aggregate results))
+    """
+    current_key = current = None
+
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if not line:
+            continue
+        fields = line.split('\t')
+        try:
+            query_id, group_value = fields[0].split(':', 1)
+            query = queries[query_id]
+            if fields[0] != current_key:
+                if current is not None:
+                    yield finish(*current)
+                current_key = fields[0]
+                kept = fields[1:1 + len(query.keep)]
+                current = (query, group_value, kept, [aggregate.initial() for aggregate in query.aggregates])
+
+            position = 1 + len(query.keep)
+            for aggregate, state in zip(query.aggregates, current[3]):
+                aggregate.merge(state, fields[position:position + aggregate.width])
+                position += aggregate.width
+        except (ValueError, KeyError, IndexError) as e:
+            print("Malformed line: %s, Error: %s" % (line, e), file=sys.stderr)
+
+    if current is not None:
+        yield finish(*current)
+
+
+def finish(query, group_value, kept, states):
+    results = [aggregate.result(state) for aggregate, state in zip(query.aggregates, states)]
+    return query, (group_value, kept, results)
+
+
+def reducer(queries_file=None):
+    """
+    Finish the groups of every query and emit the top groups of each query.
+
+    For each query, a bounded heap keeps the `top` best groups by the `rank_by` aggregates,
+    so memory does not depend on the number of groups.
+
+    Output format:
+    - 'queryid\tgroup\tkept values...\taggregate results...', best first. The records of one
+      query, without the query id, have the format of the dedicated job of that query (e.g.
+      `reducerlot1.py`), so they can be given to its report stage.
+    """
+    queries = {query.id: query for query in load_queries(queries_file)}
+    groups = read_groups(sys.stdin, queries)
+
+    for query, query_groups in itertools.groupby(groups, key=lambda item: item[0]):
+        best = heapq.nsmallest(query.top, (group for _, group in query_groups), key=query.ranking_key)
+        for group_value, kept, results in best:
+            print('\t'.join([query.id, group_value] + kept + [str(result) for result in results]))
+
+
+if __name__ == "__main__":
+    reducer(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,86 @@
+"""
+Compact intermediate records between the lot1/lot2 mappers and reducers (optional).
+
+Hadoop Streaming moves lines of text, so a compact record stays a tab-separated line with the
+Hadoop key first (partitioning and sorting do not change), but:
+- repeated strings (the city 'villecli') are replaced by their id in a dictionary file, one
+  value per line, shipped with the job (`-file villes.txt`); the id is written after the
+  marker `~`, which tells the reducers that the record is compact,
+- numbers are integers: amounts with 2 decimals ('timbrecde') are written as cents, and
+  values the reducer does not use are dropped.
+
+    text:    42446\tCHATEAU-GONTIER\t18\t4.55
+    compact: 42446\t~3\t18\t455
+
+The reducers decode a compact record with a single `split` and a dictionary lookup of the
+`~id` token, as fast as a text record. A record that cannot be encoded (city missing from the
+dictionary, amount that is not a whole number of cents) is written in the text format; the
+reducers accept both formats on any line.
+
+Build the dictionary from the cleaned data:
+    python tools/streamcodec.py data/cleaned_data.csv villes.txt
+"""
+import argparse
+import csv
+import os
+
+MARKER = '~'
+DEFAULT_DICTIONARY = 'villes.txt'
+
+
+def to_cents(amount):
+    """Integer number of cents of `amount`, or None if it is not a whole number of cents."""
+    cents = round(amount * 100)
+    return cents if abs(amount * 100 - cents) < 1e-6 * max(1, abs(cents)) else None
+
+
+def load_dictionary(path=None):
+    """
+    Values of a dictionary file, in id order. `path` defaults to `villes.txt` in the working
+    directory (where Hadoop puts the files shipped with -file) or next to this module.
+    """
+    if path is None:
+        path = DEFAULT_DICTIONARY
+        if not os.path.exists(path):
+            path = os.path.join(os.path.dirname(os.path.abspath(__file__)), DEFAULT_DICTIONARY)
+    with open(path, encoding='utf-8') as f:
+        return [line.rstrip('\n') for line in f]
+
+
+def dictionary_tokens(values):
+    """Map each value of a dictionary to its '~id' token (encoding)."""
+    return {value: '%s%d' % (MARKER, i) for i, value in enumerate(values)}
+
+
+def dictionary_values(values):
+    """Map each '~id' token of a dictionary to its value (decoding)."""
+    return {'%s%d' % (MARKER, i): value for i, value in enumerate(values)}
+
+
+def build_dictionary(input_file, output_file, column='villecli'):
+    """
+    Write the distinct values of `column` of a CSV file to `output_file`, one per line, sorted.
+
+    Returns:
+    - int: Number of values written.
+    """
+    with open(input_file, newline='', encoding='utf-8') as f:
+        values = {row[column] for row in csv.DictReader(f) if '\n' not in row[column]}
+    with open(output_file, 'w', encoding='utf-8') as f:
+        f.writelines(value + '\n' for value in sorted(values))
+    return len(values)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input_file', help="cleaned CSV file")
+    parser.add_argument('output_file', nargs='?', default=DEFAULT_DICTIONARY, help="dictionary file to write")
+    parser.add_argument('--column', default='villecli')
+    args = parser.parse_args()
+
+    count = build_dictionary(args.input_file, args.output_file, column=args.column)
+    print("%d values of %s written to %s" % (count, args.column, args.output_file))
+
+
+if __name__ == "__main__":
+    main()
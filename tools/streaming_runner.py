@@ -0,0 +1,315 @@
+"""
+Local Hadoop Streaming runner for the mapper/reducer scripts of the project.
+
+Runs any mapper/combiner/reducer commands the way Hadoop Streaming does, on a single machine:
+1. the input files are split into byte ranges aligned on line boundaries (the header line is
+   only in the first split, as in HDFS),
+2. map tasks run in a process pool; each one pipes its split into the mapper command, then
+   hash-partitions the output records on their key (text before the first tab, or the whole
+   line) and sorts them, spilling sorted runs to disk when the sort buffer is full (the
+   optional combiner runs on each run),
+3. reduce tasks run in a process pool; each one merges the sorted runs of its partition and
+   pipes them into the reducer command, whose output is written to `part-NNNNN`.
+
+With --compress, the sorted runs are written with gzip (as `mapreduce.map.output.compress`
+does on Hadoop), which trades some CPU for less spill and shuffle I/O.
+
+Usage:
+    python tools/streaming_runner.py --input data/cleaned_data.csv --output out/job01 \\
+        --mapper "python3 lot1/mapperlot1.py" --combiner "python3 lot1/combinerlot1.py" \\
+        --reducer "python3 lot1/reducerlot1.py" --num-mappers 8 --num-reducers 4
+"""
+import argparse
+import concurrent.futures
+import gzip
+import heapq
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import zlib
+
+
+def parse_size(value):
+    """Parse a size such as '64M', '1G' or '65536' into a number of bytes."""
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    value = value.strip().upper()
+    if value[-1:] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+def split_input(paths, split_bytes):
+    """
+    Split the input files into (path, start, end) byte ranges aligned on line boundaries.
+    """
+    splits = []
+    for path in paths:
+        size = os.path.getsize(path)
+        with open(path, 'rb') as f:
+            start = 0
+            while start < size:
+                end = start + split_bytes
+                if end >= size:
+                    end = size
+                else:
+                    # Move the cut to the end of the line that contains `end - 1`
+                    f.seek(end - 1)
+                    f.readline()
+                    end = f.tell()
+                splits.append((path, start, end))
+                start = end
+    return splits
+
+
+def record_key(line):
+    """Key of an intermediate record: the text before the first tab, or the whole line."""
+    return line.split(b'\t', 1)[0].rstrip(b'\r\n')
+
+
+def partition_of(line, num_reducers):
+    """Reduce partition of a record (deterministic hash of its key)."""
+    return zlib.crc32(record_key(line)) % num_reducers
+
+
+def pipe_through(command, chunks, stdout):
+    """
+    Run `command`, write the byte strings of `chunks` to its standard input from a thread and
+    return the process (its standard output is `stdout`, a file or subprocess.PIPE).
+    """
+    process = subprocess.Popen(shlex.split(command), stdin=subprocess.PIPE, stdout=stdout)
+
+    def feed():
+        try:
+            for chunk in chunks:
+                process.stdin.write(chunk)
+        except BrokenPipeError:
+            pass
+        finally:
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+    process.feeder = feeder
+    return process
+
+
+def wait_for(process, command):
+    """Wait for a process started by `pipe_through` and raise if it failed."""
+    process.feeder.join()
+    if process.wait() != 0:
+        raise RuntimeError("Command failed with exit code %d: %s" % (process.returncode, command))
+
+
+def read_split(path, start, end, block_size=1024 * 1024):
+    """Yield the bytes of `path` between `start` and `end`, block by block."""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            block = f.read(min(block_size, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
+
+
+def open_run(run_path, mode):
+    """Open a run file, with gzip when its name ends with '.gz'."""
+    if run_path.endswith('.gz'):
+        return gzip.open(run_path, mode, compresslevel=1)
+    return open(run_path, mode)
+
+
+def write_run(lines, run_path, combiner):
+    """
+    Write a sorted run of records to `run_path` (gzip-compressed if it ends with '.gz'), through
+    the combiner if there is one.
+
+    Returns:
+    - int: Number of records written.
+    """
+    if combiner:
+        process = pipe_through(combiner, iter(lines), subprocess.PIPE)
+        combined = process.stdout.read().splitlines(keepends=True)
+        wait_for(process, combiner)
+        lines = sorted(combined, key=record_key)
+
+    with open_run(run_path, 'wb') as f:
+        f.writelines(lines)
+    return len(lines)
+
+
+def run_map_task(task):
+    """
+    Run one map task: pipe a split into the mapper, partition, sort and spill its output.
+
+    Parameters:
+    - task (dict): split, mapper and combiner commands, number of reducers, sort buffer size
+      and spill directory.
+
+    Returns:
+    - dict: spill files of each partition and task counters.
+    """
+    index, (path, start, end) = task['index'], task['split']
+    num_reducers, sort_buffer = task['num_reducers'], task['sort_buffer']
+    buffers = [[] for _ in range(num_reducers)]
+    buffered_bytes = 0
+    runs = [[] for _ in range(num_reducers)]
+    counters = {'map_input_bytes': end - start, 'map_output_records': 0, 'map_output_bytes': 0,
+                'spills': 0, 'spilled_records': 0, 'spilled_bytes': 0}
+
+    def spill():
+        for partition, lines in enumerate(buffers):
+            if not lines:
+                continue
+            lines.sort(key=record_key)
+            run_path = os.path.join(task['spill_dir'], 'map-%05d-spill-%03d-part-%05d%s' % (
+                index, counters['spills'], partition, '.gz' if task['compress'] else ''))
+            counters['spilled_records'] += write_run(lines, run_path, task['combiner'])
+            counters['spilled_bytes'] += os.path.getsize(run_path)
+            runs[partition].append(run_path)
+            buffers[partition] = []
+        counters['spills'] += 1
+
+    process = pipe_through(task['mapper'], read_split(path, start, end), subprocess.PIPE)
+    for line in process.stdout:
+        if not line.endswith(b'\n'):
+            line += b'\n'
+        buffers[partition_of(line, num_reducers)].append(line)
+        counters['map_output_records'] += 1
+        counters['map_output_bytes'] += len(line)
+        buffered_bytes += len(line)
+        if buffered_bytes >= sort_buffer:
+            spill()
+            buffered_bytes = 0
+    wait_for(process, task['mapper'])
+
+    if buffered_bytes or counters['spills'] == 0:
+        spill()
+    return {'runs': runs, 'counters': counters}
+
+
+def merge_runs(run_paths):
+    """Yield the records of several sorted run files in key order."""
+    files = [open_run(run_path, 'rb') for run_path in run_paths]
+    try:
+        yield from heapq.merge(*files, key=record_key)
+    finally:
+        for f in files:
+            f.close()
+
+
+def run_reduce_task(task):
+    """
+    Run one reduce task: merge the sorted runs of a partition into the reducer command.
+
+    Returns:
+    - dict: task counters.
+    """
+    output_path = os.path.join(task['output_dir'], 'part-%05d' % task['partition'])
+    counters = {'reduce_input_records': 0}
+
+    def records():
+        for line in merge_runs(task['runs']):
+            counters['reduce_input_records'] += 1
+            yield line
+
+    with open(output_path, 'wb') as output:
+        process = pipe_through(task['reducer'], records(), output)
+        wait_for(process, task['reducer'])
+
+    counters['reduce_output_bytes'] = os.path.getsize(output_path)
+    return {'counters': counters}
+
+
+def run_job(inputs, output_dir, mapper, reducer, combiner=None, num_mappers=None, num_reducers=1,
+            split_bytes=64 * 1024 ** 2, sort_buffer=100 * 1024 ** 2, compress=False, keep_temporary=False):
+    """
+    Run a streaming job locally and return its counters.
+
+    Parameters:
+    - inputs (list): Input files.
+    - output_dir (str): Output directory (must not exist, as with Hadoop).
+    - mapper, reducer, combiner (str): Commands, e.g. "python3 lot1/mapperlot1.py".
+    - num_mappers (int): Number of map processes running at the same time (default: CPU count).
+    - num_reducers (int): Number of reduce partitions and `part-*` files.
+    - split_bytes (int): Size of the input splits.
+    - sort_buffer (int): Bytes of map output buffered by a map task before a sorted run is spilled.
+    - compress (bool): Write the sorted runs with gzip.
+    - keep_temporary (bool): Keep the spill files in `output_dir/_temporary`.
+    """
+    if os.path.exists(output_dir):
+        raise FileExistsError("Output directory %s already exists" % output_dir)
+    spill_dir = os.path.join(output_dir, '_temporary')
+    os.makedirs(spill_dir)
+    num_mappers = num_mappers or os.cpu_count()
+    counters = {}
+
+    def add_counters(values):
+        for name, value in values.items():
+            counters[name] = counters.get(name, 0) + value
+
+    splits = split_input(inputs, split_bytes)
+    map_tasks = [{'index': index, 'split': split, 'mapper': mapper, 'combiner': combiner,
+                  'num_reducers': num_reducers, 'sort_buffer': sort_buffer, 'compress': compress,
+                  'spill_dir': spill_dir}
+                 for index, split in enumerate(splits)]
+    runs = [[] for _ in range(num_reducers)]
+
+    start = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=num_mappers) as pool:
+        for result in pool.map(run_map_task, map_tasks):
+            for partition, run_paths in enumerate(result['runs']):
+                runs[partition].extend(run_paths)
+            add_counters(result['counters'])
+    counters['map_tasks'] = len(map_tasks)
+    counters['map_seconds'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    reduce_tasks = [{'partition': partition, 'runs': runs[partition], 'reducer': reducer, 'output_dir': output_dir}
+                    for partition in range(num_reducers)]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=min(num_mappers, num_reducers)) as pool:
+        for result in pool.map(run_reduce_task, reduce_tasks):
+            add_counters(result['counters'])
+    counters['reduce_tasks'] = num_reducers
+    counters['reduce_seconds'] = time.perf_counter() - start
+
+    if not keep_temporary:
+        shutil.rmtree(spill_dir)
+    open(os.path.join(output_dir, '_SUCCESS'), 'w').close()
+    return counters
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--input', action='append', required=True, help="input file (can be repeated)")
+    parser.add_argument('--output', required=True, help="output directory (must not exist)")
+    parser.add_argument('--mapper', required=True)
+    parser.add_argument('--reducer', required=True)
+    parser.add_argument('--combiner', default=None)
+    parser.add_argument('--num-mappers', type=int, default=None, help="parallel map processes (default: CPU count)")
+    parser.add_argument('--num-reducers', type=int, default=1)
+    parser.add_argument('--split-size', type=parse_size, default='64M')
+    parser.add_argument('--sort-buffer', type=parse_size, default='100M')
+    parser.add_argument('--compress', action='store_true', help="gzip the sorted runs (map output compression)")
+    parser.add_argument('--keep-temporary', action='store_true')
+    args = parser.parse_args()
+
+    counters = run_job(args.input, args.output, args.mapper, args.reducer, combiner=args.combiner,
+                       num_mappers=args.num_mappers, num_reducers=args.num_reducers, split_bytes=args.split_size,
+                       sort_buffer=args.sort_buffer, compress=args.compress, keep_temporary=args.keep_temporary)
+
+    for name in sorted(counters):
+        value = counters[name]
+        print("%-22s %s" % (name, '%.2f' % value if isinstance(value, float) else value), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()